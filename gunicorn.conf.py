@@ -0,0 +1,23 @@
+"""
+Gunicorn settings of the production server, e.g. ``gunicorn moviedb_rest_api.wsgi -c gunicorn.conf.py``.
+
+Every worker process serves ``GUNICORN_THREADS`` requests at once. Threads help
+the views waiting for OMDb, each of them keeps its own database connection
+(``DATABASE_CONN_MAX_AGE``), so the database has to accept
+``WEB_CONCURRENCY * GUNICORN_THREADS`` connections per instance.
+"""
+import multiprocessing
+
+from getenv import env
+
+bind = '0.0.0.0:{}'.format(env('PORT', 8000))
+workers = env('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+threads = env('GUNICORN_THREADS', 4)
+# uvicorn.workers.UvicornWorker serves moviedb_rest_api.asgi:application instead.
+worker_class = env('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+timeout = env('GUNICORN_TIMEOUT', 30)
+keepalive = env('GUNICORN_KEEPALIVE', 5)
+# Recycling the workers now and then bounds the damage of any memory leak.
+max_requests = env('GUNICORN_MAX_REQUESTS', 10000)
+max_requests_jitter = max_requests // 10
+accesslog = '-'
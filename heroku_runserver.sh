@@ -1,3 +1,3 @@
 #!/usr/bin/env bash
 
-python3 manage.py runserver 0.0.0.0:$PORT
+exec gunicorn moviedb_rest_api.wsgi -c gunicorn.conf.py
@@ -2,7 +2,19 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_delete
 
 
 class MoviedbRestApiConfig(AppConfig):
     name = 'moviedb_rest_api'
+
+    def ready(self):
+        if settings.DATABASE_CONN_HEALTH_CHECKS:
+            from moviedb_rest_api.db import close_unusable_connections
+            request_started.connect(close_unusable_connections, dispatch_uid='close_unusable_connections')
+        from moviedb_rest_api.routers import end_request
+        request_finished.connect(end_request, dispatch_uid='end_replica_routing')
+        from moviedb_rest_api.models import comment_deleted
+        post_delete.connect(comment_deleted, sender=self.get_model('Comment'), dispatch_uid='comment_deleted')
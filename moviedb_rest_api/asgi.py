@@ -0,0 +1,20 @@
+"""
+ASGI config for moviedb_rest_api project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server, e.g. ``uvicorn moviedb_rest_api.asgi:application``
+or gunicorn with ``GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker``.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moviedb_rest_api.settings")
+
+wsgi_application = get_wsgi_application()
+
+# Imported once get_wsgi_application() has loaded the apps.
+from moviedb_rest_api.async_app import Application  # noqa: E402
+
+application = Application(wsgi_application)
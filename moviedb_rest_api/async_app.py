@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.urlresolvers import reverse
+from django.db import DatabaseError, close_old_connections, connections
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+
+from moviedb_rest_api import metrics, omdb_async, routers
+from moviedb_rest_api.db import close_unusable_connections
+from moviedb_rest_api.fastjson import FastJSONParser, FastJSONRenderer
+from moviedb_rest_api.models import normalize_title
+from moviedb_rest_api.omdb import OmdbUnavailable
+from moviedb_rest_api.serializers import InvalidFields, MovieValuesSerializer
+from moviedb_rest_api.singleflight import postgres_advisory_unlock, try_postgres_advisory_lock
+from moviedb_rest_api.views import MoviesView
+
+logger = logging.getLogger(__name__)
+
+# Bodies AsyncMoviesView parses itself, anything else (e.g. multipart forms) is left to Django.
+NATIVE_CONTENT_TYPES = ('application/json', 'application/x-www-form-urlencoded')
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+def query_params(scope):
+    return parse_qs(scope['query_string'].decode('latin1'), keep_blank_values=True)
+
+
+def content_type(scope):
+    for name, value in scope['headers']:
+        if name.lower() == b'content-type':
+            return value.decode('latin1').split(';')[0].strip().lower()
+    return ''
+
+
+def call_with_connections(func, *args):
+    """Runs ``func`` in a pool thread like Django runs a request: with its connections checked before and after."""
+    close_old_connections()
+    if settings.DATABASE_CONN_HEALTH_CHECKS:
+        close_unusable_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+class AsyncSingleFlight(object):
+    """``SingleFlight`` for the coroutines of one event loop."""
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, fn):
+        """Returns ``(result, shared)``, ``shared`` is True for the callers that waited."""
+        call = self.calls.get(key)
+        shared = call is not None
+        if not shared:
+            call = self.calls[key] = asyncio.ensure_future(fn())
+            call.add_done_callback(lambda done: self.calls.pop(key) if self.calls.get(key) is done else None)
+        # A caller going away must not cancel the call the others wait for.
+        return await asyncio.shield(call), shared
+
+
+class AsyncWorkerLock(object):
+    """
+    ``worker_lock`` for the event loop.
+
+    An advisory lock belongs to the database session that took it, so all of
+    them are taken and released by one dedicated thread, on its own connection.
+    The thread only tries the locks, a coroutine waiting for a lock another
+    worker holds tries again every ``poll_interval`` seconds and holds no thread
+    meanwhile. With ``SINGLE_FLIGHT_LOCK_BACKEND=local`` there is nothing to
+    lock, ``AsyncSingleFlight`` coalesces the fetches of the process.
+    """
+
+    def __init__(self, poll_interval=0.05):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.poll_interval = poll_interval
+
+    @property
+    def enabled(self):
+        return settings.SINGLE_FLIGHT_LOCK_BACKEND == 'postgres'
+
+    def run(self, func, key):
+        return asyncio.get_event_loop().run_in_executor(self.executor, self.call, func, key)
+
+    @staticmethod
+    def call(func, key):
+        try:
+            return func(key)
+        except DatabaseError:
+            # The locks went away with the session, the next call connects again.
+            connections['default'].close()
+            raise
+
+    async def acquire(self, key):
+        if self.enabled:
+            while not await self.run(try_postgres_advisory_lock, key):
+                await asyncio.sleep(self.poll_interval)
+
+    async def release(self, key):
+        if self.enabled:
+            await self.run(postgres_advisory_unlock, key)
+
+    def close(self):
+        self.executor.submit(connections.close_all).result()
+        self.executor.shutdown()
+
+
+class AsyncMoviesView(object):
+    """
+    Non-blocking ``MoviesView.post``.
+
+    The database steps are the ones of ``MoviesView`` and run in the thread pool,
+    the OMDb request is made on the event loop. A request waiting for OMDb holds
+    neither a thread nor a database connection, so one process can wait for
+    hundreds of them. The responses are the same as the ones of ``MoviesView``,
+    the fetches are coalesced across the workers by the same lock.
+
+    Django's middleware does not run for it. ``RequestProfilingMiddleware``'s
+    request count and duration are recorded, its database and OMDb breakdown
+    and ``Server-Timing`` header are not.
+    """
+
+    def __init__(self, executor, client=None):
+        self.executor = executor
+        self.client = client or omdb_async.create_client()
+        self.omdb_fetches = AsyncSingleFlight()
+        self.worker_lock = AsyncWorkerLock()
+
+    async def __call__(self, scope, receive, send):
+        start = time.perf_counter()
+        body = await read_body(receive)
+        try:
+            status_code, data = await self.post(scope, body)
+        except Exception:
+            logger.exception('Internal Server Error: %s', scope['path'])
+            status_code, data = status.HTTP_500_INTERNAL_SERVER_ERROR, {'detail': 'Server error.'}
+        body = FastJSONRenderer().render(data)
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if settings.DATABASE_REPLICAS:
+            # Like ReplicaRoutingMiddleware, the client reads its write from the primary.
+            headers.append((b'set-cookie', routers.sticky_cookie_header().encode('latin1')))
+        await send({'type': 'http.response.start', 'status': status_code, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+        if settings.REQUEST_PROFILING:
+            metrics.increment('http_requests_total', view='movies', method='POST', status=status_code)
+            metrics.observe('http_request_duration_seconds', time.perf_counter() - start, view='movies', method='POST')
+
+    def run_sync(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(self.executor, partial(call_with_connections, func, *args))
+
+    async def post(self, scope, body):
+        try:
+            movie_title = self.parse_movie_title(content_type(scope), body)
+        except ParseError as exc:
+            return status.HTTP_400_BAD_REQUEST, {'detail': exc.detail}
+        if not movie_title or not isinstance(movie_title, str):
+            return status.HTTP_400_BAD_REQUEST, {}
+        try:
+            serializer_class = MovieValuesSerializer.project(query_params(scope).get('fields', [None])[-1])
+        except InvalidFields:
+            return status.HTTP_400_BAD_REQUEST, {}
+
+        movie_data = await self.run_sync(MoviesView.find_movie_data, movie_title, serializer_class)
+        if movie_data is not None:
+            return status.HTTP_200_OK, movie_data
+        try:
+            (created, movie_data), shared = await self.omdb_fetches.do(
+                normalize_title(movie_title), lambda: self.fetch_movie_data(movie_title)
+            )
+        except OmdbUnavailable:
+            return status.HTTP_503_SERVICE_UNAVAILABLE, {'OMDB_Error': 'OMDb is unavailable, try again later.'}
+        if 'OMDB_Error' not in movie_data:
+            movie_data = serializer_class.pick(movie_data)
+        return status.HTTP_201_CREATED if created and not shared else status.HTTP_200_OK, movie_data
+
+    async def fetch_movie_data(self, movie_title):
+        key = normalize_title(movie_title)
+        await self.worker_lock.acquire(key)
+        try:
+            # Another worker may have stored it while this one waited for the lock.
+            stored = await self.run_sync(MoviesView.stored_movie_data, movie_title)
+            if stored is not None:
+                return stored
+            status_code, response_data = await self.client.get_movie(movie_title)
+            return await self.run_sync(MoviesView.save_omdb_response, movie_title, status_code, response_data)
+        finally:
+            await self.worker_lock.release(key)
+
+    @staticmethod
+    def parse_movie_title(media_type, body):
+        if not body:
+            return None
+        if media_type == 'application/json':
+            data = FastJSONParser().parse(BytesIO(body))
+        else:
+            data = {key: values[-1] for key, values in parse_qs(body.decode('utf-8', 'replace')).items()}
+        return data.get('movie_title') if isinstance(data, dict) else None
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_{}'.format(name)
+        value = value.decode('latin1')
+        environ[key] = '{},{}'.format(environ[key], value) if key in environ else value
+    # The whole body has been read already, also when it came chunked without a Content-Length.
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def allowed_host(scope):
+    """Whether the request passes the ``ALLOWED_HOSTS`` check of Django's ``HttpRequest.get_host``."""
+    try:
+        WSGIRequest(build_environ(scope, b'')).get_host()
+    except DisallowedHost:
+        return False
+    return True
+
+
+class WsgiBridge(object):
+    """
+    Serves ASGI HTTP requests with a WSGI application running in the thread pool.
+
+    asgiref's ``WsgiToAsgi`` would run all of them in one shared thread. The
+    response body is passed on as the application yields it, so streamed
+    responses stay streamed.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        self.wsgi_application = wsgi_application
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        body = await read_body(receive)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self.run, scope, body, partial(self.send_from_thread, loop, send))
+
+    @staticmethod
+    def send_from_thread(loop, send, message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run(self, scope, body, send):
+        response_start = {}
+
+        def start_response(status_line, headers, exc_info=None):
+            response_start.update({
+                'type': 'http.response.start',
+                'status': int(status_line.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+            })
+
+        output = self.wsgi_application(build_environ(scope, body), start_response)
+        try:
+            started = False
+            for chunk in output:
+                if not chunk:
+                    continue
+                if not started:
+                    send(response_start)
+                    started = True
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                send(response_start)
+            send({'type': 'http.response.body'})
+        finally:
+            # Fires Django's request_finished, which returns the database connections.
+            if hasattr(output, 'close'):
+                output.close()
+
+
+class Application(object):
+    """
+    ASGI application of the project.
+
+    POST /movies/, the request that may wait for OMDb, is served by
+    ``AsyncMoviesView`` on the event loop. Everything else goes to Django
+    through ``WsgiBridge``, as do the requests with a host not in
+    ``ALLOWED_HOSTS``, for Django to reject. Both share a pool of
+    ``ASGI_THREADS`` threads.
+    """
+
+    def __init__(self, wsgi_application, executor=None, client=None):
+        self.executor = executor or ThreadPoolExecutor(max_workers=settings.ASGI_THREADS)
+        self.movies_view = AsyncMoviesView(self.executor, client)
+        self.wsgi = WsgiBridge(wsgi_application, self.executor)
+        self.movies_path = reverse('movies')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type {}.'.format(scope['type']))
+        try:
+            if self.is_async_movie_post(scope):
+                await self.movies_view(scope, receive, send)
+            else:
+                await self.wsgi(scope, receive, send)
+        except ClientDisconnected:
+            pass
+
+    def is_async_movie_post(self, scope):
+        if scope['method'] != 'POST' or scope['path'] != self.movies_path:
+            return False
+        # POST /movies/?async=true does not wait for OMDb anyway.
+        if query_params(scope).get('async', [''])[-1] in ('1', 'true'):
+            return False
+        return content_type(scope) in NATIVE_CONTENT_TYPES and allowed_host(scope)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.movies_view.client.close()
+                self.movies_view.worker_lock.close()
+                self.executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,208 @@
+import json
+import math
+import random
+import resource
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from moviedb_rest_api import omdb
+from moviedb_rest_api.models import Comment, Movie
+from moviedb_rest_api.omdb_stub import OmdbStub
+
+GENRES = ('Action', 'Adventure', 'Comedy', 'Crime', 'Drama', 'Horror', 'Romance', 'Sci-Fi', 'Thriller')
+# Latency changes smaller than this are noise on any machine, whatever the threshold.
+LATENCY_NOISE_MS = 1.0
+# p99 of a few hundred requests is a handful of outliers, it is reported but does not fail the comparison.
+COMPARED_LATENCY_METRICS = ('p50_ms', 'p95_ms')
+# Requests made before a scenario is measured, they warm up the connections and caches.
+WARMUP_REQUESTS = 5
+
+
+def movie_data(rng, title):
+    """An OMDb-like payload of a made up movie."""
+    return {
+        'Title': title,
+        'Year': str(rng.randint(1950, 2018)),
+        'Runtime': '{} min'.format(rng.randint(80, 180)),
+        'Genre': ', '.join(rng.sample(GENRES, rng.randint(1, 3))),
+        'Plot': ' '.join(rng.choice(('space', 'love', 'war', 'heist', 'ship', 'family')) for _ in range(20)),
+        'imdbRating': '{:.1f}'.format(rng.uniform(2, 9.5)),
+        'imdbID': 'tt{:07d}'.format(rng.randint(0, 9999999)),
+        'Response': 'True',
+    }
+
+
+def seed(movies, comments, rng, batch_size=1000):
+    """
+    Stores ``movies`` made up movies and ``comments`` comments spread over the last 30 days.
+
+    The comments follow a Zipf distribution - a handful of movies get most of
+    them, like in real traffic. Returns the movie ids, most commented first.
+    """
+    now = timezone.now()
+    movie_ids = []
+    for start in range(0, movies, batch_size):
+        batch = []
+        for index in range(start, min(start + batch_size, movies)):
+            title = 'Benchmark Movie {:06d}'.format(index)
+            movie = Movie(title=title, normalized_title=title.lower(), additional_data=movie_data(rng, title))
+            movie.set_omdb_attributes()
+            batch.append(movie)
+        movie_ids += [movie.id for movie in Movie.objects.bulk_create(batch)]
+    # created_at is set on insert, spread the movies over the 30 days for /top/ with a single query.
+    Movie.objects.filter(id__in=movie_ids).update(
+        created_at=RawSQL("%s - ((id * 7919) %% 43200) * interval '1 minute'", (now,))
+    )
+
+    cum_weights = list(accumulate(1.0 / rank for rank in range(1, movies + 1)))
+    for start in range(0, comments, batch_size):
+        Comment.objects.bulk_insert([
+            Comment(
+                movie_id=rng.choices(movie_ids, cum_weights=cum_weights)[0],
+                body='Benchmark comment {}'.format(index),
+                created_at=now - timedelta(days=rng.uniform(0, 30)),
+            ) for index in range(start, min(start + batch_size, comments))
+        ])
+    return movie_ids
+
+
+def percentile(sorted_values, share):
+    """Nearest-rank percentile of already sorted values."""
+    return sorted_values[max(0, math.ceil(share * len(sorted_values)) - 1)]
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Benchmark(object):
+    """
+    Seeds a database and replays scripted requests against every endpoint.
+
+    Requests go through the whole Django stack in process, by the test client.
+    OMDb is replaced by a local stub, the response cache is off and all the
+    queries go to the seeded database, not to the replicas. Every scenario is
+    measured by its latency percentiles, database queries per request and the
+    peak RSS of the process. The same ``seed`` produces the same data and the
+    same requests.
+    """
+
+    def __init__(self, movies=1000, comments=10000, requests=200, seed=0):
+        self.settings = {'movies': movies, 'comments': comments, 'requests': requests, 'seed': seed}
+        self.rng = random.Random(seed)
+        self.client = Client()
+
+    def scenarios(self):
+        movie_ids = self.movie_ids
+        now = time.time()
+        fresh_titles = iter(self.fresh_titles)
+        return [
+            ('post_movie_new', lambda: self.client.post(reverse('movies'), {'movie_title': next(fresh_titles)})),
+            ('post_movie_existing', lambda: self.client.post(reverse('movies'), {
+                'movie_title': 'benchmark movie {:06d}'.format(self.rng.randrange(len(movie_ids)))
+            })),
+            ('get_movies', lambda: self.client.get(reverse('movies'))),
+            ('get_movies_filtered', lambda: self.client.get(reverse('movies'), {
+                'genre': self.rng.choice(GENRES).lower(), 'ordering': '-imdb_rating'
+            })),
+            ('get_comments', lambda: self.client.get(reverse('comments'))),
+            ('get_movie_comments', lambda: self.client.get(reverse('comments'), {'movie_id': self.pick_movie()})),
+            ('post_comment', lambda: self.client.post(reverse('comments'), {
+                'movie_id': self.pick_movie(), 'comment_body': 'Benchmark comment'
+            })),
+            ('get_top', lambda: self.client.get(reverse('top'), {'date_from': now - 7 * 86400, 'date_to': now})),
+            ('get_top_activity', lambda: self.client.get(reverse('top'), {
+                'date_from': now - 7 * 86400, 'date_to': now, 'ranking': 'activity'
+            })),
+        ]
+
+    def pick_movie(self):
+        return self.rng.choices(self.movie_ids, cum_weights=self.cum_weights)[0]
+
+    def run(self):
+        """Returns the settings and the measurements of every scenario, ready to be stored as JSON."""
+        self.movie_ids = seed(self.settings['movies'], self.settings['comments'], self.rng)
+        self.cum_weights = list(accumulate(1.0 / rank for rank in range(1, len(self.movie_ids) + 1)))
+        self.fresh_titles = [
+            'Fresh Benchmark Movie {:06d}'.format(index)
+            for index in range(WARMUP_REQUESTS + self.settings['requests'])
+        ]
+
+        stub = OmdbStub(movies={title: movie_data(self.rng, title) for title in self.fresh_titles})
+        previous_client = omdb._client
+        omdb._client = omdb.OmdbClient(api_url=stub.url, api_key='benchmark', max_retries=0)
+        try:
+            with stub, override_settings(RESPONSE_CACHE_TIMEOUT=0, DATABASE_REPLICAS=[]):
+                results = {name: self.measure(request) for name, request in self.scenarios()}
+        finally:
+            omdb._client = previous_client
+        return {'settings': self.settings, 'scenarios': results}
+
+    def measure(self, request):
+        latencies = []
+        queries = 0
+        errors = 0
+        for _ in range(WARMUP_REQUESTS):
+            request()
+        for _ in range(self.settings['requests']):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request()
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries += len(captured)
+            errors += response.status_code >= 400
+        latencies.sort()
+        return {
+            'p50_ms': round(percentile(latencies, 0.5), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'queries_per_request': round(queries / len(latencies), 2),
+            'errors': errors,
+            'max_rss_mb': round(max_rss_mb(), 1),
+        }
+
+
+def compare(results, baseline, threshold):
+    """
+    Lists the regressions of ``results`` against ``baseline``.
+
+    The p50 and p95 latencies and RSS may grow by ``threshold`` (a fraction), queries per request
+    are deterministic and may not grow at all. Failed requests are always a regression.
+    """
+    regressions = []
+    for name, current in sorted(results['scenarios'].items()):
+        if current['errors']:
+            regressions.append('{}: {} failed requests'.format(name, current['errors']))
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric in COMPARED_LATENCY_METRICS:
+            if current[metric] > previous[metric] * (1 + threshold) + LATENCY_NOISE_MS:
+                regressions.append('{}: {} {} > {}'.format(name, metric, current[metric], previous[metric]))
+        if current['max_rss_mb'] > previous['max_rss_mb'] * (1 + threshold):
+            regressions.append('{}: max_rss_mb {} > {}'.format(name, current['max_rss_mb'], previous['max_rss_mb']))
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append('{}: queries_per_request {} > {}'.format(
+                name, current['queries_per_request'], previous['queries_per_request']
+            ))
+    return regressions
+
+
+def load(path):
+    with open(path, encoding='utf-8') as results_file:
+        return json.load(results_file)
+
+
+def save(results, path):
+    with open(path, 'w', encoding='utf-8') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+        results_file.write('\n')
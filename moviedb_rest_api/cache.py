@@ -0,0 +1,181 @@
+import calendar
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from rest_framework.response import Response
+
+from moviedb_rest_api import metrics, routers
+
+MOVIES = 'movies'
+COMMENTS = 'comments'
+TOP = 'top'
+
+CACHED_HEADERS = ('Link',)
+
+# Backends keeping their entries in the process, the versions they hold miss the writes of the other workers.
+LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def shared_versions():
+    """Whether all the workers see the same versions, only then they can validate responses."""
+    return settings.CACHES[settings.RESPONSE_CACHE_ALIAS]['BACKEND'] not in LOCAL_BACKENDS
+
+
+def movie_comments_scope(movie_id):
+    # The id may come straight from the query string, '01' and 1 are the same movie.
+    return '{}:{}'.format(COMMENTS, int(movie_id))
+
+
+def version_key(scope):
+    return 'version:{}'.format(scope)
+
+
+def get_versions(scopes):
+    """
+    Current version of every scope. A missing (or evicted) version starts from
+    the current time, so it never matches a version stored before it was lost.
+    """
+    cache = get_cache()
+    versions = cache.get_many([version_key(scope) for scope in scopes])
+    for scope in scopes:
+        key = version_key(scope)
+        if key not in versions:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[version_key(scope)] for scope in scopes]
+
+
+def bump(*scopes):
+    cache = get_cache()
+    for scope in scopes:
+        key = version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+def movie_created():
+    bump(MOVIES, TOP)
+
+
+def movie_updated():
+    bump(MOVIES)
+
+
+def movie_deleted():
+    bump(MOVIES, TOP, COMMENTS)
+
+
+def comments_created(movie_ids):
+    bump(COMMENTS, TOP, *[movie_comments_scope(movie_id) for movie_id in set(movie_ids)])
+
+
+def comments_deleted(movie_ids):
+    comments_created(movie_ids)
+
+
+def comments_updated(movie_ids):
+    bump(COMMENTS, *[movie_comments_scope(movie_id) for movie_id in set(movie_ids)])
+
+
+def normalized_params(query_params):
+    return sorted((key, value) for key, values in query_params.lists() for value in values if value != '')
+
+
+def response_cache_key(view_name, query_params, versions):
+    fingerprint = repr((normalized_params(query_params), versions)).encode('utf-8')
+    return 'response:{}:{}'.format(view_name, hashlib.md5(fingerprint).hexdigest())
+
+
+def cached_response(view_name, get_scopes):
+    """
+    Caches successful responses of a view's ``get`` method.
+
+    ``get_scopes(request)`` lists the version scopes the response depends on, the
+    key combines them with the normalized query params - bumping any of the scopes
+    from a write path makes the stored responses unreachable. Requests the method
+    should not answer from cache make ``get_scopes`` return None.
+    """
+    def decorator(get):
+        @functools.wraps(get)
+        def wrapper(view, request, *args, **kwargs):
+            scopes = get_scopes(request) if settings.RESPONSE_CACHE_TIMEOUT else None
+            if scopes is None:
+                return get(view, request, *args, **kwargs)
+
+            cache = get_cache()
+            key = response_cache_key(view_name, request.query_params, get_versions(scopes))
+            cached = cache.get(key)
+            if cached is not None:
+                metrics.increment('response_cache_hits_total', view=view_name)
+                data, status, headers = cached
+                return Response(data, status=status, headers=headers)
+
+            metrics.increment('response_cache_misses_total', view=view_name)
+            # A lagging replica's answer would be served for the whole timeout, not just while the replica lags.
+            with routers.use_primary():
+                response = get(view, request, *args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+                cache.set(key, (response.data, response.status_code, headers), settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_get(view_name):
+    """
+    Answers conditional GETs of a view's ``get`` method with 304 Not Modified.
+
+    The validators come from the view's ``get_validators(request, *args, **kwargs)``: a cheap
+    summary of the state the response depends on (the versions of its scopes when
+    they are ``shared_versions``, else row counts, max ``updated_at``, ...) and the
+    last modification time if known, or None when the request should not be
+    validated. Nothing is serialized when the client's copy is still current.
+
+    The versions are bumped by writes to the primary, so with them the response is
+    read from the primary: a lagging replica's body would be stored by the client
+    under the new ETag and revalidated until the next write.
+    """
+    def decorator(get):
+        @functools.wraps(get)
+        def wrapper(view, request, *args, **kwargs):
+            validators = view.get_validators(request, *args, **kwargs)
+            if validators is None:
+                return get(view, request, *args, **kwargs)
+
+            state, last_modified = validators
+            fingerprint = repr((view_name, normalized_params(request.query_params), state)).encode('utf-8')
+            etag = quote_etag(hashlib.md5(fingerprint).hexdigest())
+            if last_modified is not None:
+                last_modified = calendar.timegm(last_modified.utctimetuple())
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                if shared_versions():
+                    with routers.use_primary():
+                        response = get(view, request, *args, **kwargs)
+                else:
+                    response = get(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,15 @@
+from django.db import connections
+
+
+def close_unusable_connections(**kwargs):
+    """
+    Drops the persistent connections the database closed since the last request.
+
+    Django 1.11 only notices a connection killed by a database restart, failover
+    or idle timeout when the first query of a request fails. Checking them when
+    a request starts costs a ``SELECT 1`` round trip per persistent connection.
+    """
+    for connection in connections.all():
+        if connection.connection is not None and connection.settings_dict['CONN_MAX_AGE']:
+            if not connection.is_usable():
+                connection.close()
@@ -0,0 +1,134 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from moviedb_rest_api import cache, omdb
+from moviedb_rest_api.models import Movie
+from moviedb_rest_api.negative_cache import negative_cache
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.MOVIE_ENRICHMENT_THREADS)
+    return _executor
+
+
+def schedule(movie_id):
+    """
+    Queues the OMDb fetch of a pending movie.
+
+    Pending rows are the queue itself, so with the 'worker' backend there is
+    nothing to do - ``manage.py enrich_movies`` picks them up. The 'thread'
+    backend starts the fetch once the transaction reserving the row commits.
+    """
+    if settings.MOVIE_ENRICHMENT_BACKEND == 'thread':
+        transaction.on_commit(lambda: get_executor().submit(enrich_movie_id, movie_id))
+
+
+def claim(movies, batch_size):
+    """
+    Leases up to ``batch_size`` of the oldest pending ``movies`` no other worker holds.
+
+    The rows are locked (``SELECT ... FOR UPDATE SKIP LOCKED``) only while the
+    lease is taken, the OMDb fetches run outside of any transaction. The lease of
+    a worker that died mid-fetch runs out after ``MOVIE_ENRICHMENT_LEASE`` seconds.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = list(
+            movies.select_for_update(skip_locked=True).filter(
+                Q(claimed_until__isnull=True) | Q(claimed_until__lt=now), status=Movie.PENDING
+            ).order_by('id')[:batch_size]
+        )
+        claimed_until = now + timedelta(seconds=settings.MOVIE_ENRICHMENT_LEASE)
+        Movie.objects.filter(id__in=[movie.id for movie in claimed]).update(claimed_until=claimed_until)
+    for movie in claimed:
+        movie.claimed_until = claimed_until
+    return claimed
+
+
+def enrich(movie, client=None):
+    """
+    Fetches the OMDb data of a pending ``movie`` claimed by the caller.
+
+    Titles OMDb does not know are marked as failed (and remembered in the negative
+    cache), deleting them would take their comments along. Unavailable OMDb is
+    retried later, up to ``MOVIE_ENRICHMENT_MAX_ATTEMPTS`` fetches. Returns whether
+    the movie left the queue.
+    """
+    client = client or omdb.get_client()
+    try:
+        status_code, data = client.get_movie(movie.title)
+    except omdb.OmdbUnavailable as exc:
+        logger.warning('Could not fetch OMDb data of movie %s (%s).', movie.id, exc)
+        data = None
+    else:
+        if data.get('Error') == omdb.MOVIE_NOT_FOUND:
+            negative_cache.add(movie.title, omdb.MOVIE_NOT_FOUND)
+            movie.status = Movie.FAILED
+            data = None
+        elif status_code != 200 or 'Error' in data:
+            logger.warning('OMDb refused movie %s (%s).', movie.id, data.get('Error'))
+            data = None
+
+    if data is not None:
+        movie.additional_data = data
+        movie.status = Movie.READY
+        movie.last_fetched_at = timezone.now()
+        movie.set_omdb_attributes()
+    elif movie.status == Movie.PENDING:
+        movie.fetch_attempts += 1
+        if movie.fetch_attempts >= settings.MOVIE_ENRICHMENT_MAX_ATTEMPTS:
+            movie.status = Movie.FAILED
+    # Only the enrichment columns (the comment counter of the instance may be stale) and only while the lease
+    # holds, once it ran out another worker may have claimed the movie.
+    fields = ('additional_data', 'status', 'fetch_attempts', 'last_fetched_at') + Movie.OMDB_ATTRIBUTE_FIELDS
+    updated = Movie.objects.filter(id=movie.id, status=Movie.PENDING, claimed_until=movie.claimed_until).update(
+        claimed_until=None, updated_at=timezone.now(), **{field: getattr(movie, field) for field in fields}
+    )
+    if not updated:
+        return False
+    cache.movie_updated()
+    return movie.status != Movie.PENDING
+
+
+def enrich_pending(batch_size=10, client=None):
+    """
+    Enriches up to ``batch_size`` of the oldest pending movies, returns how many of them left the queue.
+
+    The movies are claimed first, so any number of workers can run side by side
+    without fetching the same movie twice.
+    """
+    return sum(enrich(movie, client) for movie in claim(Movie.objects.all(), batch_size))
+
+
+def enrich_movie_id(movie_id):
+    try:
+        for movie in claim(Movie.objects.filter(id=movie_id), 1):
+            enrich(movie)
+    except Exception:
+        logger.exception('Enriching movie %s failed.', movie_id)
+    finally:
+        connection.close()
+
+
+def requeue_failed(normalized_title):
+    """Puts a failed movie back to the queue, returns whether there was one."""
+    requeued = Movie.objects.filter(normalized_title=normalized_title, status=Movie.FAILED).update(
+        status=Movie.PENDING, fetch_attempts=0, updated_at=timezone.now()
+    )
+    return bool(requeued)
@@ -0,0 +1,139 @@
+import codecs
+import json
+import re
+import uuid
+
+from django.conf import settings
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# DRF's encoder formats datetimes itself (e.g. 'Z' for UTC), orjson hands them to it to give the same output.
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+encoder = JSONEncoder()
+
+
+class RawJSON(object):
+    """
+    Already encoded JSON text, written to the output as it is.
+
+    Lets a JSONB column fetched as text (``additional_data::text``) reach the
+    response without being decoded into a dict and encoded again.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def __eq__(self, other):
+        return isinstance(other, RawJSON) and other.text == self.text
+
+    def __repr__(self):
+        return 'RawJSON({!r})'.format(self.text)
+
+
+def stdlib_dumps(data, default, indent=None, ensure_ascii=False, allow_nan=False, compact=True):
+    if indent is not None:
+        separators = (',', ': ')
+    else:
+        separators = (',', ':') if compact else (', ', ': ')
+    return json.dumps(
+        data, default=default, indent=indent, ensure_ascii=ensure_ascii, allow_nan=allow_nan, separators=separators
+    ).encode('utf-8')
+
+
+def stdlib_loads(text):
+    return json.loads(text, parse_constant=strict_constant)
+
+
+def orjson_dumps(data, default, indent=None, ensure_ascii=False, allow_nan=False, compact=True):
+    # orjson writes compact UTF-8 only, indented by 2 spaces at most.
+    if ensure_ascii or not compact or indent not in (None, 2):
+        return stdlib_dumps(data, default, indent, ensure_ascii, allow_nan, compact)
+    return orjson.dumps(data, default=default, option=ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+
+
+def orjson_loads(text):
+    return orjson.loads(text)
+
+
+JSON_BACKENDS = {
+    'stdlib': (stdlib_dumps, stdlib_loads),
+    'orjson': (orjson_dumps, orjson_loads),
+}
+
+
+def get_backend():
+    """``(dumps, loads)`` of ``JSON_BACKEND``, orjson falls back to the standard library when it is not installed."""
+    if settings.JSON_BACKEND == 'orjson' and orjson is None:
+        return JSON_BACKENDS['stdlib']
+    return JSON_BACKENDS[settings.JSON_BACKEND]
+
+
+def dumps(data, indent=None, ensure_ascii=False, allow_nan=False, compact=True):
+    """
+    Encodes ``data`` to UTF-8 JSON bytes, the way DRF's ``JSONRenderer`` does.
+
+    ``RawJSON`` values are encoded as placeholder strings first and replaced
+    with their text in the output.
+    """
+    raw_texts = []
+    marker = []
+
+    def default(obj):
+        if isinstance(obj, RawJSON):
+            if not marker:
+                # Unique for the call, so no string of the data can pass for a placeholder.
+                marker.append('rawjson-{}-'.format(uuid.uuid4().hex))
+            raw_texts.append(obj.text)
+            return '{}{}'.format(marker[0], len(raw_texts) - 1)
+        return encoder.default(obj)
+
+    output = get_backend()[0](data, default, indent, ensure_ascii, allow_nan, compact)
+    if raw_texts:
+        # Every other part is the index of a placeholder.
+        parts = re.split('"{}([0-9]+)"'.format(marker[0]).encode('ascii'), output)
+        parts[1::2] = [raw_texts[int(index)].encode('utf-8') for index in parts[1::2]]
+        output = b''.join(parts)
+    return output
+
+
+def loads(text):
+    """Decodes JSON ``text`` (bytes or str), out of range floats (NaN, Infinity) are rejected."""
+    return get_backend()[1](text)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` encoding with ``JSON_BACKEND`` and writing ``RawJSON`` values as they are."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        output = dumps(data, indent=indent, ensure_ascii=self.ensure_ascii, allow_nan=not self.strict,
+                       compact=self.compact)
+        # Like JSONRenderer, keeps the output a strict subset of JavaScript.
+        return output.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """``JSONParser`` decoding with ``JSON_BACKEND``."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            body = stream.read()
+            if codecs.lookup(encoding).name != 'utf-8':
+                body = body.decode(encoding)
+            return loads(body)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - {}'.format(exc))
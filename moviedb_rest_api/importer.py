@@ -0,0 +1,232 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, utc
+
+from moviedb_rest_api import cache, metrics, omdb
+from moviedb_rest_api.models import Comment, Movie, normalize_title
+from moviedb_rest_api.negative_cache import negative_cache
+
+CREATED = 'created'
+EXISTING = 'existing'
+NOT_FOUND = 'not_found'
+FAILED = 'failed'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+
+TIME_LIMIT_ERROR = 'The import ran out of time before fetching the title, import it again.'
+
+
+class RateLimiter(object):
+    """Spaces calls made from any thread at least ``1 / rate`` seconds apart, a falsy rate disables it."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.next_slot = 0
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = self.clock()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            self.sleep(slot - now)
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class MovieImporter(object):
+    """
+    Imports many movie titles at once.
+
+    Titles are deduplicated case-insensitively, the ones already stored are found
+    with a single query, the rest is fetched from OMDb by a bounded thread pool
+    (rate limited, so a large import does not trip OMDb's limits) and saved with
+    ``bulk_create`` in batches. ``run`` returns one result per submitted title.
+    With a ``time_limit`` the titles not fetched within that many seconds are
+    marked as failed and the fetches in flight are cut short, so an import made
+    by a request ends before the server's timeout does.
+    """
+
+    def __init__(self, client=None, workers=None, rate=None, batch_size=None, time_limit=None, clock=time.monotonic):
+        self.client = client or omdb.get_client()
+        self.workers = workers or settings.MOVIE_IMPORT_WORKERS
+        self.rate_limiter = RateLimiter(settings.MOVIE_IMPORT_RATE if rate is None else rate)
+        self.batch_size = batch_size or settings.MOVIE_IMPORT_BATCH_SIZE
+        self.time_limit = time_limit
+        self.clock = clock
+        self.deadline = None
+
+    def run(self, movie_titles):
+        results = [{'title': movie_title} for movie_title in movie_titles]
+        unique = {}
+        for result in results:
+            title = result['title']
+            if not isinstance(title, str) or not title.strip():
+                result['status'] = INVALID
+            elif normalize_title(title) in unique:
+                result['status'] = DUPLICATE
+            else:
+                unique[normalize_title(title)] = result
+
+        existing = dict(Movie.objects.filter(normalized_title__in=list(unique)).values_list('normalized_title', 'id'))
+        missing = []
+        for normalized_title, result in unique.items():
+            if normalized_title in existing:
+                result.update(status=EXISTING, movie_id=existing[normalized_title])
+            elif negative_cache.get(result['title']):
+                result.update(status=NOT_FOUND, error=omdb.MOVIE_NOT_FOUND)
+            else:
+                missing.append(result)
+
+        if self.time_limit:
+            self.deadline = self.clock() + self.time_limit
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            fetched = list(executor.map(self.fetch, missing))
+        self.save([(result, data) for result, data in zip(missing, fetched) if data is not None])
+
+        for result in results:
+            metrics.increment('movie_import_titles_total', status=result['status'])
+        return results
+
+    def fetch(self, result):
+        """Returns the OMDb data of the result's title, or marks the result as failed and returns None."""
+        self.rate_limiter.wait()
+        time_limit = None
+        if self.deadline is not None:
+            # A fetch (with its retries) must not outlast the import either.
+            time_limit = self.deadline - self.clock()
+            if time_limit <= 0:
+                result.update(status=FAILED, error=TIME_LIMIT_ERROR)
+                return None
+        try:
+            status_code, data = self.client.get_movie(result['title'], time_limit=time_limit)
+        except omdb.OmdbUnavailable as exc:
+            result.update(status=FAILED, error=str(exc) or 'OMDb is unavailable.')
+            return None
+        if status_code == 200 and 'Error' not in data:
+            return data
+        if data.get('Error') == omdb.MOVIE_NOT_FOUND:
+            negative_cache.add(result['title'], omdb.MOVIE_NOT_FOUND)
+            result.update(status=NOT_FOUND, error=omdb.MOVIE_NOT_FOUND)
+        else:
+            result.update(status=FAILED, error=data.get('Error'))
+        return None
+
+    def save(self, fetched):
+        created = False
+        for batch in batches(fetched, self.batch_size):
+            movies = [
+                Movie(
+                    title=result['title'].strip().title(),
+                    normalized_title=normalize_title(result['title']),
+                    additional_data=data,
+                ) for result, data in batch
+            ]
+            for movie in movies:
+                movie.set_omdb_attributes()
+            try:
+                with transaction.atomic():
+                    Movie.objects.bulk_create(movies)
+            except IntegrityError:
+                # Some title was stored concurrently, fall back to row by row upserts for this batch.
+                for result, data in batch:
+                    movie, movie_created = Movie.objects.insert_or_get(
+                        title=result['title'].strip().title(), additional_data=data
+                    )
+                    result.update(status=CREATED if movie_created else EXISTING, movie_id=movie.id)
+                    created = created or movie_created
+            else:
+                for (result, data), movie in zip(batch, movies):
+                    result.update(status=CREATED, movie_id=movie.id)
+                created = True
+        if created:
+            cache.movie_created()
+
+
+class CommentImporter(object):
+    """
+    Imports many comments at once.
+
+    All the referenced movies are checked with a single query, valid comments are
+    inserted in batches of ``batch_size`` by ``Comment.objects.bulk_insert``, which
+    also updates the denormalized counters once per batch. ``run`` returns one
+    result per submitted item.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.COMMENT_IMPORT_BATCH_SIZE
+
+    def run(self, items):
+        results = []
+        comments = []
+        for item in items:
+            try:
+                comment = self.build_comment(item)
+            except ValueError as exc:
+                results.append({'status': INVALID, 'error': str(exc)})
+            else:
+                results.append({'movie_id': comment.movie_id})
+                comments.append((results[-1], comment))
+
+        movie_ids = set(Movie.objects.filter(
+            id__in={comment.movie_id for _, comment in comments}
+        ).values_list('id', flat=True))
+        valid = []
+        for result, comment in comments:
+            if comment.movie_id in movie_ids:
+                valid.append((result, comment))
+            else:
+                result.update(status=INVALID, error='Movie does not exist.')
+
+        created_movie_ids = set()
+        for batch in batches(valid, self.batch_size):
+            try:
+                Comment.objects.bulk_insert([comment for _, comment in batch])
+            except DatabaseError as exc:
+                # E.g. a movie deleted in the meantime - only this batch is lost.
+                for result, _ in batch:
+                    result.update(status=FAILED, error=str(exc))
+                continue
+            for result, comment in batch:
+                result.update(status=CREATED, comment_id=comment.id)
+                created_movie_ids.add(comment.movie_id)
+        if created_movie_ids:
+            cache.comments_created(created_movie_ids)
+
+        for result in results:
+            metrics.increment('comment_import_items_total', status=result['status'])
+        return results
+
+    @staticmethod
+    def build_comment(item):
+        if not isinstance(item, dict):
+            raise ValueError('Expected an object.')
+        movie_id = item.get('movie_id')
+        if isinstance(movie_id, bool) or not isinstance(movie_id, (int, str)) or not str(movie_id).isdigit():
+            raise ValueError('movie_id has to be an integer.')
+        comment_body = item.get('comment_body')
+        if not isinstance(comment_body, str) or not comment_body:
+            raise ValueError('comment_body is required.')
+        created_at = item.get('created_at')
+        if created_at is not None:
+            created_at = parse_datetime(created_at) if isinstance(created_at, str) else None
+            if created_at is None:
+                raise ValueError('created_at has to be an ISO 8601 date and time.')
+            if is_naive(created_at):
+                created_at = make_aware(created_at, utc)
+            else:
+                created_at = created_at.astimezone(utc)
+        return Comment(movie_id=int(movie_id), body=comment_body, created_at=created_at)
@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from moviedb_rest_api import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway test database and measures the latency, queries per request and memory of every '
+        'endpoint. Fails when the results regressed past --threshold compared to a --baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=1000, help='Movies to seed.')
+        parser.add_argument('--comments', type=int, default=10000, help='Comments to seed.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests made by every scenario.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data and requests.')
+        parser.add_argument('--baseline', help='JSON file with earlier results to compare to.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2, help='Allowed growth of latencies and memory, 0.2 is 20%%.'
+        )
+        parser.add_argument('--save', help='JSON file to store the results in, e.g. as a new baseline.')
+
+    def handle(self, *args, **options):
+        baseline = benchmark.load(options['baseline']) if options['baseline'] else None
+        run = benchmark.Benchmark(
+            movies=options['movies'], comments=options['comments'], requests=options['requests'], seed=options['seed']
+        )
+        if baseline is not None and baseline['settings'] != run.settings:
+            raise CommandError('The baseline was measured with different settings: {}.'.format(baseline['settings']))
+
+        with self.test_database():
+            results = run.run()
+
+        self.stdout.write('{:<22}{:>10}{:>10}{:>10}{:>10}{:>8}{:>10}'.format(
+            'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'errors', 'rss MB'
+        ))
+        for name, scenario in results['scenarios'].items():
+            self.stdout.write('{:<22}{p50_ms:>10.2f}{p95_ms:>10.2f}{p99_ms:>10.2f}{queries_per_request:>10.2f}'
+                              '{errors:>8}{max_rss_mb:>10.1f}'.format(name, **scenario))
+        if options['save']:
+            benchmark.save(results, options['save'])
+
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError('Performance regressed:\n{}'.format('\n'.join(regressions)))
+            self.stdout.write('No regressions compared to {}.'.format(options['baseline']))
+
+    @contextmanager
+    def test_database(self):
+        """Runs the block against a fresh test database, with DEBUG off like in production."""
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
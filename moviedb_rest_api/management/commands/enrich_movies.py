@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from moviedb_rest_api import enrichment
+
+
+class Command(BaseCommand):
+    help = 'Fetches the OMDb data of movies posted asynchronously. Any number of workers can run at once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help='Movies claimed per transaction.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=5, help='Seconds to wait when no pending movie could be enriched.'
+        )
+        parser.add_argument('--once', action='store_true', help='Exit once no pending movie could be enriched.')
+
+    def handle(self, *args, **options):
+        enriched = 0
+        while True:
+            done = enrichment.enrich_pending(options['batch_size'])
+            enriched += done
+            if not done:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        self.stdout.write('Enriched {} pending movie(s).'.format(enriched))
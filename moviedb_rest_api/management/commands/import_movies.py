@@ -0,0 +1,38 @@
+import sys
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from moviedb_rest_api.importer import MovieImporter
+
+
+class Command(BaseCommand):
+    help = 'Imports the movie titles listed in a file, one title per line, fetching their details from OMDb.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File with the movie titles, "-" reads them from the standard input.')
+        parser.add_argument('--workers', type=int, help='Number of concurrent OMDb requests.')
+        parser.add_argument('--rate', type=float, help='Maximum OMDb requests a second, 0 for no limit.')
+        parser.add_argument('--batch-size', type=int, help='Movies inserted per query.')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            movie_titles = self.read_titles(sys.stdin)
+        else:
+            with open(options['path'], encoding='utf-8') as titles_file:
+                movie_titles = self.read_titles(titles_file)
+
+        importer = MovieImporter(workers=options['workers'], rate=options['rate'], batch_size=options['batch_size'])
+        results = importer.run(movie_titles)
+        for result in results:
+            self.stdout.write('{}\t{}\t{}'.format(
+                result['status'], result['title'], result.get('movie_id') or result.get('error') or ''
+            ))
+        totals = Counter(result['status'] for result in results)
+        self.stdout.write('Imported {} title(s): {}.'.format(
+            len(results), ', '.join('{} {}'.format(count, status) for status, count in sorted(totals.items()))
+        ))
+
+    @staticmethod
+    def read_titles(lines):
+        return [line.strip() for line in lines if line.strip()]
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from moviedb_rest_api.negative_cache import negative_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Purges cached OMDb "Movie not found" responses, either for the given titles or all of them. '
+        'Needs NEGATIVE_CACHE_BACKEND set to a cache shared by the web workers, the in-process caches '
+        'of the workers are reached only through it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('titles', nargs='*', help='Movie titles to purge. Purges everything if omitted.')
+
+    def handle(self, *args, **options):
+        if not settings.NEGATIVE_CACHE_BACKEND:
+            raise CommandError(
+                'NEGATIVE_CACHE_BACKEND is not set, the negative caches live only in the memory of the web '
+                'workers. Restart them to purge.'
+            )
+        titles = options['titles'] or None
+        negative_cache.purge(titles)
+        if titles:
+            self.stdout.write('Purged {} title(s) from the negative cache.'.format(len(titles)))
+        else:
+            self.stdout.write('Purged the negative cache.')
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from moviedb_rest_api.models import CommentActivity
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-movie comment activity rollup from the comments table.'
+
+    def handle(self, *args, **options):
+        buckets = CommentActivity.objects.rebuild()
+        self.stdout.write('Rebuilt {} {} bucket(s).'.format(buckets, settings.COMMENT_ACTIVITY_BUCKET))
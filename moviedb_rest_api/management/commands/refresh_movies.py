@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from moviedb_rest_api.refresh import MovieRefresher
+
+
+class Command(BaseCommand):
+    help = 'Re-fetches the OMDb data of the movies fetched longest ago, writing back only the changed ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Maximum movies refreshed per run.')
+        parser.add_argument('--max-age', type=int, help='Seconds after which the OMDb data of a movie is stale.')
+        parser.add_argument('--workers', type=int, help='Number of concurrent OMDb requests.')
+        parser.add_argument('--rate', type=float, help='Maximum OMDb requests a second, 0 for no limit.')
+        parser.add_argument('--batch-size', type=int, help='Movies updated per query.')
+        parser.add_argument(
+            '--interval', type=float, help='Keep running, starting a new run this many seconds after the last one.'
+        )
+
+    def handle(self, *args, **options):
+        refresher = MovieRefresher(workers=options['workers'], rate=options['rate'], batch_size=options['batch_size'])
+        while True:
+            totals = refresher.run(limit=options['limit'], max_age=options['max_age'])
+            summary = ', '.join('{} {}'.format(count, status) for status, count in sorted(totals.items()))
+            self.stdout.write('Refreshed {} movie(s): {}.'.format(sum(totals.values()), summary))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
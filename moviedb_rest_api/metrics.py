@@ -0,0 +1,118 @@
+import bisect
+import threading
+from collections import defaultdict
+
+# Upper bounds (in seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def metric_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Counters(object):
+    """Process-wide, thread-safe monotonic counters, optionally split by labels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(int)
+
+    def increment(self, name, value=1, **labels):
+        with self.lock:
+            self.values[metric_key(name, labels)] += value
+
+    def get(self, name, **labels):
+        with self.lock:
+            return self.values[metric_key(name, labels)]
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Histograms(object):
+    """Process-wide, thread-safe histograms with fixed buckets, optionally split by labels."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # Per key: the count of every bucket (not cumulative, the last one is +Inf), the sum and the count.
+        self.values = {}
+
+    def observe(self, name, value, **labels):
+        key = metric_key(name, labels)
+        with self.lock:
+            bucket_counts, total, count = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0, 0)
+            bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = bucket_counts, total + value, count + 1
+
+    def snapshot(self):
+        with self.lock:
+            return {key: (list(buckets), total, count) for key, (buckets, total, count) in self.values.items()}
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+
+counters = Counters()
+histograms = Histograms()
+
+
+def increment(name, value=1, **labels):
+    counters.increment(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    histograms.observe(name, value, **labels)
+
+
+def hit_rate(prefix, **labels):
+    """Share of ``<prefix>_hits_total`` among all the lookups counted so far."""
+    hits = counters.get('{}_hits_total'.format(prefix), **labels)
+    misses = counters.get('{}_misses_total'.format(prefix), **labels)
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(label, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for label, value in labels
+    ))
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All the counters and histograms of this process in the Prometheus text exposition format."""
+    lines = []
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.snapshot().items():
+        by_name[name].append((labels, value))
+    for name in sorted(by_name):
+        lines.append('# TYPE {} counter'.format(name))
+        for labels, value in sorted(by_name[name]):
+            lines.append('{}{} {}'.format(name, format_labels(labels), format_value(value)))
+
+    by_name = defaultdict(list)
+    for (name, labels), value in histograms.snapshot().items():
+        by_name[name].append((labels, value))
+    bounds = [format_value(float(bound)) for bound in histograms.buckets] + ['+Inf']
+    for name in sorted(by_name):
+        lines.append('# TYPE {} histogram'.format(name))
+        for labels, (bucket_counts, total, count) in sorted(by_name[name]):
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, bucket_counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{} {}'.format(name, format_labels(labels + (('le', bound),)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, format_labels(labels), format_value(total)))
+            lines.append('{}_count{} {}'.format(name, format_labels(labels), count))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def normalize_title(title):
+    return title.strip().lower()
+
+
+def backfill_normalized_title(apps, schema_editor):
+    Movie = apps.get_model('moviedb_rest_api', 'Movie')
+    Comment = apps.get_model('moviedb_rest_api', 'Comment')
+    kept_movies = {}
+    for movie in Movie.objects.order_by('id').iterator():
+        normalized_title = normalize_title(movie.title)
+        kept_movie_id = kept_movies.get(normalized_title)
+        if kept_movie_id:
+            # Case-insensitive duplicate of an older row - merge it into the original.
+            Comment.objects.filter(movie_id=movie.id).update(movie_id=kept_movie_id)
+            Movie.objects.filter(id=movie.id).delete()
+        else:
+            kept_movies[normalized_title] = movie.id
+            Movie.objects.filter(id=movie.id).update(normalized_title=normalized_title)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='normalized_title',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(backfill_normalized_title, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0002_movie_normalized_title'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='normalized_title',
+            field=models.CharField(editable=False, max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='title',
+            field=models.CharField(max_length=255),
+        ),
+    ]
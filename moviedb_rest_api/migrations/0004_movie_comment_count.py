@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 10:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0003_unique_normalized_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-comment_count', 'id'], name='movie_comment_count_idx'),
+        ),
+        migrations.RunSQL(
+            '''
+            UPDATE moviedb_rest_api_movie AS movie SET comment_count = counts.comment_count
+            FROM (
+                SELECT movie_id, COUNT(*) AS comment_count FROM moviedb_rest_api_comment GROUP BY movie_id
+            ) AS counts
+            WHERE movie.id = counts.movie_id
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
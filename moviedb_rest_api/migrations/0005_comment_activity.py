@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 10:32
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_comment_activity(apps, schema_editor):
+    schema_editor.execute(
+        "INSERT INTO moviedb_rest_api_commentactivity (movie_id, bucket, comment_count) "
+        "SELECT movie_id, date_trunc(%s, created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', COUNT(*) "
+        "FROM moviedb_rest_api_comment GROUP BY 1, 2",
+        [settings.COMMENT_ACTIVITY_BUCKET]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0004_movie_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('comment_count', models.IntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_activity', to='moviedb_rest_api.Movie')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='commentactivity',
+            index=models.Index(fields=['bucket', 'movie', 'comment_count'], name='comment_activity_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='commentactivity',
+            unique_together=set([('movie', 'bucket')]),
+        ),
+        migrations.RunPython(backfill_comment_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 10:44
+from __future__ import unicode_literals
+
+import re
+from decimal import Decimal, InvalidOperation
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+YEAR_RE = re.compile(r'^(\d{4})')
+RUNTIME_RE = re.compile(r'^(\d+) min')
+
+
+def movie_attributes(data):
+    def value(key):
+        raw = data.get(key)
+        return raw.strip() if isinstance(raw, str) and raw.strip() not in ('', 'N/A') else None
+
+    year = YEAR_RE.match(value('Year') or '')
+    runtime = RUNTIME_RE.match(value('Runtime') or '')
+    try:
+        imdb_rating = Decimal(value('imdbRating')) if value('imdbRating') else None
+    except InvalidOperation:
+        imdb_rating = None
+    return {
+        'year': int(year.group(1)) if year else None,
+        'imdb_id': value('imdbID'),
+        'imdb_rating': imdb_rating,
+        'runtime_minutes': int(runtime.group(1)) if runtime else None,
+        'genres': [genre.strip().lower() for genre in (value('Genre') or '').split(',') if genre.strip()],
+    }
+
+
+def backfill_omdb_attributes(apps, schema_editor):
+    Movie = apps.get_model('moviedb_rest_api', 'Movie')
+    for movie_id, additional_data in Movie.objects.values_list('id', 'additional_data').iterator():
+        Movie.objects.filter(id=movie_id).update(**movie_attributes(additional_data or {}))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0005_comment_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='genres',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=64), default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='imdb_id',
+            field=models.CharField(db_index=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='imdb_rating',
+            field=models.DecimalField(decimal_places=1, editable=False, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='runtime_minutes',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='year',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_omdb_attributes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['year', 'id'], name='movie_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['imdb_rating', 'id'], name='movie_imdb_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['runtime_minutes', 'id'], name='movie_runtime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['genres'], name='movie_genres_idx'),
+        ),
+    ]
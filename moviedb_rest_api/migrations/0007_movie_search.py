@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 10:47
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_TRIGGER = """
+CREATE FUNCTION moviedb_rest_api_movie_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.additional_data ->> 'Plot', '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER movie_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, additional_data ON moviedb_rest_api_movie
+    FOR EACH ROW EXECUTE PROCEDURE moviedb_rest_api_movie_search_vector();
+
+UPDATE moviedb_rest_api_movie SET title = title;
+"""
+
+DROP_SEARCH_VECTOR_TRIGGER = """
+DROP TRIGGER movie_search_vector_update ON moviedb_rest_api_movie;
+DROP FUNCTION moviedb_rest_api_movie_search_vector();
+"""
+
+
+def create_trigram_index(apps, schema_editor):
+    # pg_trgm ships with the contrib package, which not every Postgres installation has.
+    # Without it fuzzy search is disabled, see MovieManager.has_trigram_support().
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX movie_title_trgm_idx ON moviedb_rest_api_movie USING gin (normalized_title gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX IF EXISTS movie_title_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0006_movie_omdb_attributes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_TRIGGER, DROP_SEARCH_VECTOR_TRIGGER),
+        migrations.AddIndex(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='movie_search_vector_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
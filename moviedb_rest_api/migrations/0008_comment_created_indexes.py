@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 10:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0007_movie_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['movie', '-created_at', 'id'], name='comment_movie_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-created_at', 'id'], name='comment_created_idx'),
+        ),
+        # Dropped only once comment_movie_created_idx can serve the lookups by movie.
+        migrations.AlterField(
+            model_name='comment',
+            name='movie',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='moviedb_rest_api.Movie'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 10:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0008_comment_created_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='fetch_attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Waiting for OMDb data'), ('ready', 'Ready'), ('failed', 'OMDb data could not be fetched')], default='ready', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunSQL(
+            'UPDATE moviedb_rest_api_movie SET updated_at = created_at', migrations.RunSQL.noop
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['status', 'id'], name='movie_status_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 10:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0009_movie_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='last_fetched_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        # Existing movies were last fetched when they were created.
+        migrations.RunSQL(
+            'UPDATE moviedb_rest_api_movie SET last_fetched_at = created_at', reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['status', 'last_fetched_at', 'id'], name='movie_last_fetched_idx'),
+        ),
+    ]
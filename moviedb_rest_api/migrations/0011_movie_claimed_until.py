@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 12:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moviedb_rest_api', '0010_movie_last_fetched_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='claimed_until',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
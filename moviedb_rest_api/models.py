@@ -1,5 +1,42 @@
-from django.contrib.postgres.fields import JSONField
-from django.db import models
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField, TrigramSimilarity
+from django.db import connections, models, router, transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.sql import InsertQuery
+from django.utils import timezone
+
+from psycopg2.extras import Json
+
+from moviedb_rest_api import cache
+from moviedb_rest_api.omdb import movie_attributes
+
+
+# Text search configuration of Movie.search_vector, the trigger filling it is created by migration 0007.
+SEARCH_CONFIG = 'english'
+
+SEARCH_PREFIX = 'prefix'
+SEARCH_FUZZY = 'fuzzy'
+SEARCH_TEXT = 'text'
+SEARCH_MODES = (SEARCH_PREFIX, SEARCH_FUZZY, SEARCH_TEXT)
+
+_trigram_support = {}
+
+
+def normalize_title(title):
+    return title.strip().lower()
+
+
+def write_db(manager):
+    """
+    Database the raw SQL writes of ``manager`` go to: the one it is bound to
+    (``db_manager``), else the router's ``db_for_write``. ``manager.db`` is the
+    database for reads, a replica in read-only requests.
+    """
+    return manager._db or router.db_for_write(manager.model, **manager._hints)
 
 
 class MovieManager(models.Manager):
@@ -12,16 +49,325 @@ class MovieManager(models.Manager):
         finally:
             return movie
 
+    def get_by_title(self, title):
+        return self.get_or_none(normalized_title=normalize_title(title))
+
+    def insert_or_get(self, title, **kwargs):
+        """
+        Inserts the movie with ``INSERT ... ON CONFLICT DO NOTHING``.
+
+        Returns ``(movie, created)`` - when a concurrent request has already stored
+        the same title the existing row is returned instead of raising IntegrityError.
+        """
+        movie = self.model(title=title, normalized_title=normalize_title(title), **kwargs)
+        movie.set_omdb_attributes()
+        fields = [field for field in self.model._meta.concrete_fields if field is not self.model._meta.auto_field]
+        query = InsertQuery(self.model)
+        query.insert_values(fields, [movie])
+        db = write_db(self)
+        [(sql, params)] = query.get_compiler(using=db).as_sql()
+        sql += ' ON CONFLICT ("normalized_title") DO NOTHING RETURNING "id"'
+        with connections[db].cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            # Read back from the database written to, a replica may not have the conflicting row yet.
+            return self.db_manager(db).get(normalized_title=movie.normalized_title), False
+        movie.pk = row[0]
+        movie._state.adding = False
+        movie._state.db = db
+        return movie, True
+
+    def add_comment_counts(self, counts):
+        """Adds ``counts`` (movie id -> number of comments) to the denormalized counters in one UPDATE."""
+        if not counts:
+            return
+        with connections[write_db(self)].cursor() as cursor:
+            cursor.execute(
+                'UPDATE {table} SET comment_count = {table}.comment_count + counts.comments '
+                'FROM (VALUES {values}) AS counts (id, comments) WHERE {table}.id = counts.id'.format(
+                    table=self.model._meta.db_table, values=', '.join(['(%s, %s)'] * len(counts))
+                ),
+                [value for movie_count in counts.items() for value in movie_count]
+            )
+
+    def refresh_omdb_data(self, movies_data):
+        """
+        Stores refreshed OMDb data, ``movies_data`` maps movie ids to it, with one
+        ``UPDATE ... FROM (VALUES ...)`` that also sets the typed attribute columns.
+        """
+        if not movies_data:
+            return
+        now = timezone.now()
+        params = []
+        for movie_id, data in movies_data.items():
+            attributes = movie_attributes(data)
+            params += [movie_id, Json(data)] + [attributes[field] for field in self.model.OMDB_ATTRIBUTE_FIELDS]
+        row = '(%s::integer, %s::jsonb, %s::smallint, %s::varchar, %s::numeric, %s::smallint, %s::varchar[])'
+        with connections[write_db(self)].cursor() as cursor:
+            cursor.execute(
+                'UPDATE {table} SET additional_data = data.additional_data, year = data.year, '
+                'imdb_id = data.imdb_id, imdb_rating = data.imdb_rating, runtime_minutes = data.runtime_minutes, '
+                'genres = data.genres, last_fetched_at = %s, updated_at = %s FROM (VALUES {values}) '
+                'AS data (id, additional_data, year, imdb_id, imdb_rating, runtime_minutes, genres) '
+                'WHERE {table}.id = data.id'.format(
+                    table=self.model._meta.db_table, values=', '.join([row] * len(movies_data))
+                ),
+                [now, now] + params
+            )
+
+    def has_trigram_support(self):
+        """Whether the pg_trgm extension fuzzy search depends on is installed, checked once per process."""
+        if self.db not in _trigram_support:
+            with connections[self.db].cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _trigram_support[self.db] = cursor.fetchone() is not None
+        return _trigram_support[self.db]
+
+    def search(self, query, modes=SEARCH_MODES):
+        """
+        Movies matching ``query`` by any of the ``modes``, best matches first.
+
+        * prefix - the title starts with the query, served by the ``LIKE`` index of ``normalized_title``,
+        * fuzzy - trigram similarity of the titles, tolerates typos (GIN trigram index, needs pg_trgm),
+        * text - full-text match of the title and the OMDb plot (GIN index of ``search_vector``).
+
+        The score adds up an exact/prefix title match bonus, the trigram similarity and the text rank.
+        """
+        normalized_query = normalize_title(query)
+        matches = Q()
+        score = Value(0.0, output_field=FloatField())
+        if SEARCH_PREFIX in modes:
+            matches |= Q(normalized_title__startswith=normalized_query)
+            score = score + Case(
+                When(normalized_title=normalized_query, then=Value(2.0)),
+                When(normalized_title__startswith=normalized_query, then=Value(1.0)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        if SEARCH_FUZZY in modes:
+            matches |= Q(normalized_title__trigram_similar=normalized_query)
+            score = score + TrigramSimilarity('normalized_title', normalized_query)
+        if SEARCH_TEXT in modes:
+            text_query = SearchQuery(query, config=SEARCH_CONFIG)
+            matches |= Q(search_vector=text_query)
+            score = score + SearchRank(F('search_vector'), text_query)
+        return self.filter(matches).annotate(score=score).order_by('-score', 'id')
+
 
 class Movie(models.Model):
-    title = models.CharField(max_length=255, unique=True, blank=False, null=False)
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Waiting for OMDb data'),
+        (READY, 'Ready'),
+        (FAILED, 'OMDb data could not be fetched'),
+    )
+    OMDB_ATTRIBUTE_FIELDS = ('year', 'imdb_id', 'imdb_rating', 'runtime_minutes', 'genres')
+
+    title = models.CharField(max_length=255, blank=False, null=False)
+    # Lower-cased title, so case-insensitive lookups and uniqueness are served by a plain btree index.
+    normalized_title = models.CharField(max_length=255, unique=True, editable=False)
     additional_data = JSONField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever the representation changes, e.g. when the OMDb data arrives.
+    updated_at = models.DateTimeField(auto_now=True)
+    # Movies posted asynchronously are pending until a background worker fetches their OMDb data.
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=READY, editable=False)
+    fetch_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Until when an enrichment worker holds the pending movie, see enrichment.claim().
+    claimed_until = models.DateTimeField(null=True, editable=False)
+    # When additional_data was last fetched from OMDb, `manage.py refresh_movies` refreshes the stalest movies.
+    last_fetched_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Denormalized number of comments, maintained by Comment.save() and the comment_deleted post_delete receiver.
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Copies of the OMDb attributes the movie list is filtered and sorted by, see set_omdb_attributes().
+    year = models.PositiveSmallIntegerField(null=True, editable=False)
+    imdb_id = models.CharField(max_length=16, null=True, editable=False, db_index=True)
+    imdb_rating = models.DecimalField(max_digits=3, decimal_places=1, null=True, editable=False)
+    runtime_minutes = models.PositiveSmallIntegerField(null=True, editable=False)
+    genres = ArrayField(models.CharField(max_length=64), default=list, editable=False)
+    # Weighted title and OMDb plot lexemes, kept up to date by a database trigger.
+    search_vector = SearchVectorField(null=True, editable=False)
 
     objects = MovieManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-comment_count', 'id'], name='movie_comment_count_idx'),
+            models.Index(fields=['year', 'id'], name='movie_year_idx'),
+            models.Index(fields=['imdb_rating', 'id'], name='movie_imdb_rating_idx'),
+            models.Index(fields=['runtime_minutes', 'id'], name='movie_runtime_idx'),
+            GinIndex(fields=['genres'], name='movie_genres_idx'),
+            GinIndex(fields=['search_vector'], name='movie_search_vector_idx'),
+            models.Index(fields=['status', 'id'], name='movie_status_idx'),
+            models.Index(fields=['status', 'last_fetched_at', 'id'], name='movie_last_fetched_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_title = normalize_title(self.title)
+        self.set_omdb_attributes()
+        super(Movie, self).save(*args, **kwargs)
+
+    def set_omdb_attributes(self):
+        for field, value in movie_attributes(self.additional_data or {}).items():
+            setattr(self, field, value)
+
+
+class CommentManager(models.Manager):
+
+    def bulk_insert(self, comments):
+        """
+        Inserts ``comments`` with a single multi-row INSERT and updates the movie
+        comment counters and the activity rollup once for the whole batch.
+
+        Unlike ``bulk_create`` the ``created_at`` set on the comments is kept, so
+        historical comments can be imported, comments without it get the current time.
+        """
+        now = timezone.now()
+        for comment in comments:
+            comment.created_at = comment.created_at or now
+        fields = [field for field in self.model._meta.concrete_fields if field is not self.model._meta.auto_field]
+        query = InsertQuery(self.model)
+        query.insert_values(fields, comments, raw=True)
+        db = write_db(self)
+        with transaction.atomic(using=db):
+            ids = query.get_compiler(using=db).execute_sql(return_id=True)
+            if len(comments) == 1:
+                ids = [ids]
+            for comment, comment_id in zip(comments, ids):
+                comment.pk = comment_id
+                comment._state.adding = False
+                comment._state.db = db
+            Movie.objects.db_manager(db).add_comment_counts(Counter(comment.movie_id for comment in comments))
+            CommentActivity.objects.db_manager(db).record_buckets(
+                Counter((comment.movie_id, activity_bucket(comment.created_at)) for comment in comments)
+            )
+        return comments
+
 
 class Comment(models.Model):
-    movie = models.ForeignKey(Movie, related_name='comments')
+    # Lookups by movie are served by comment_movie_created_idx, a separate FK index would be redundant.
+    movie = models.ForeignKey(Movie, related_name='comments', db_index=False)
     body = models.TextField(null=False, blank=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = CommentManager()
+
+    class Meta:
+        indexes = [
+            # Newest first pages of a movie's comments and of all of them are index range scans.
+            models.Index(fields=['movie', '-created_at', 'id'], name='comment_movie_created_idx'),
+            models.Index(fields=['-created_at', 'id'], name='comment_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            super(Comment, self).save(*args, **kwargs)
+            # Edits (e.g. in the admin) change the comments responses and their ETags.
+            cache.comments_updated([self.movie_id])
+            return
+        with transaction.atomic(using=kwargs.get('using')):
+            super(Comment, self).save(*args, **kwargs)
+            Movie.objects.filter(id=self.movie_id).update(comment_count=F('comment_count') + 1)
+            CommentActivity.objects.record(self.movie_id, self.created_at)
+
+
+def comment_deleted(sender, instance, using, **kwargs):
+    """
+    ``post_delete`` receiver keeping the movie counters and the activity rollup in step.
+
+    It runs for every deleted comment, also for the ones deleted by a queryset's
+    ``delete()`` (e.g. the admin's bulk delete) and by the cascade of their movie.
+    """
+    Movie.objects.using(using).filter(id=instance.movie_id).update(comment_count=F('comment_count') - 1)
+    CommentActivity.objects.db_manager(using).remove(instance.movie_id, instance.created_at)
+    cache.comments_deleted([instance.movie_id])
+
+
+def activity_bucket(moment):
+    """Start of the ``COMMENT_ACTIVITY_BUCKET`` ('hour' or 'day') ``moment`` falls in, in UTC."""
+    if timezone.is_aware(moment):
+        moment = moment.astimezone(timezone.utc)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if settings.COMMENT_ACTIVITY_BUCKET == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+class CommentActivityManager(models.Manager):
+
+    def record(self, movie_id, created_at, comments=1):
+        self.record_buckets({(movie_id, activity_bucket(created_at)): comments})
+
+    def remove(self, movie_id, created_at):
+        # No upsert, the bucket of a stored comment exists. One could bring back the bucket of a movie being deleted.
+        self.filter(movie_id=movie_id, bucket=activity_bucket(created_at)).update(comment_count=F('comment_count') - 1)
+
+    def record_buckets(self, counts):
+        """Adds ``counts`` ((movie id, bucket) -> number of comments) to the rollup in one upsert."""
+        if not counts:
+            return
+        table = self.model._meta.db_table
+        with connections[write_db(self)].cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {table} (movie_id, bucket, comment_count) VALUES {values} '
+                'ON CONFLICT (movie_id, bucket) DO UPDATE '
+                'SET comment_count = {table}.comment_count + EXCLUDED.comment_count'.format(
+                    table=table, values=', '.join(['(%s, %s, %s)'] * len(counts))
+                ),
+                [value for (movie_id, bucket), comments in counts.items() for value in (movie_id, bucket, comments)]
+            )
+
+    def rebuild(self):
+        table = self.model._meta.db_table
+        db = write_db(self)
+        with transaction.atomic(using=db), connections[db].cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(table))
+            cursor.execute(
+                "INSERT INTO {table} (movie_id, bucket, comment_count) "
+                "SELECT movie_id, date_trunc(%s, created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', COUNT(*) "
+                "FROM {comments} GROUP BY 1, 2".format(table=table, comments=Comment._meta.db_table),
+                [settings.COMMENT_ACTIVITY_BUCKET]
+            )
+            return cursor.rowcount
+
+    def top_movies(self, date_from, date_to, offset=0, limit=None):
+        """
+        Movies ranked by the number of comments written within ``[date_from, date_to)``.
+
+        Only the buckets in range are read, ``date_from`` is rounded down to its bucket.
+        The bucket ``date_to`` falls in is only partly in range, its comments are
+        counted from ``Comment`` instead - at most one bucket's worth of rows.
+        """
+        bucket_from = activity_bucket(date_from)
+        bucket_to = max(activity_bucket(date_to), bucket_from)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                'SELECT movie_id, SUM(comment_count) AS total, '
+                'DENSE_RANK() OVER (ORDER BY SUM(comment_count) DESC) '
+                'FROM (SELECT movie_id, comment_count FROM {activity} WHERE bucket >= %s AND bucket < %s '
+                'UNION ALL SELECT movie_id, 1 FROM {comment} WHERE created_at >= %s AND created_at < %s) counts '
+                'GROUP BY movie_id HAVING SUM(comment_count) > 0 '
+                'ORDER BY total DESC, movie_id OFFSET %s LIMIT %s'.format(
+                    activity=self.model._meta.db_table, comment=Comment._meta.db_table
+                ),
+                [bucket_from, bucket_to, bucket_to, date_to, offset, limit]
+            )
+            return [{'id': movie_id, 'comment_count': total, 'rank': rank} for movie_id, total, rank in cursor]
+
+
+class CommentActivity(models.Model):
+    """Number of comments written for a movie per hour (or day, see ``COMMENT_ACTIVITY_BUCKET``)."""
+    movie = models.ForeignKey(Movie, related_name='comment_activity')
+    bucket = models.DateTimeField()
+    comment_count = models.IntegerField(default=0)
+
+    objects = CommentActivityManager()
+
+    class Meta:
+        unique_together = ('movie', 'bucket')
+        indexes = [
+            models.Index(fields=['bucket', 'movie', 'comment_count'], name='comment_activity_bucket_idx'),
+        ]
@@ -0,0 +1,152 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from moviedb_rest_api import metrics
+from moviedb_rest_api.models import normalize_title
+
+METRIC_PREFIX = 'omdb_negative_cache'
+GENERATION_KEY = 'omdb-negative:generation'
+# Bumped by every purge. The in-process LRUs of all the workers drop the entries stored before it changed.
+PURGES_KEY = 'omdb-negative:purges'
+
+
+class LRUCache(object):
+    """Size-bounded, TTL-bounded in-process LRU mapping."""
+
+    def __init__(self, max_size, ttl, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                expires_at, value = self.entries[key]
+            except KeyError:
+                return None
+            if expires_at <= self.clock():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class NegativeCache(object):
+    """
+    Remembers titles OMDb could not find, so retrying a misspelled title does not
+    cost another external round trip until the entry expires.
+
+    Entries live in an in-process LRU and, when ``NEGATIVE_CACHE_BACKEND`` names a
+    Django cache alias shared by the workers (e.g. a Redis or database cache), in
+    that shared tier too. There the tier also counts the purges, a local entry is
+    trusted only while the count is the one it was stored with, so a purge made by
+    any process reaches the LRUs of all of them within ``NEGATIVE_CACHE_CHECK_INTERVAL``
+    seconds.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.local = LRUCache(max_size=settings.NEGATIVE_CACHE_MAX_SIZE, ttl=settings.NEGATIVE_CACHE_TTL)
+        self.clock = clock
+        # (checked_at, generation, purges) last read from the shared tier.
+        self.checked_counters = None
+
+    @property
+    def shared(self):
+        if settings.NEGATIVE_CACHE_BACKEND:
+            return caches[settings.NEGATIVE_CACHE_BACKEND]
+
+    def counters(self, shared):
+        """
+        ``(generation, purges)`` of the shared tier, ``(None, None)`` without one.
+
+        The counters are read at most every ``NEGATIVE_CACHE_CHECK_INTERVAL`` seconds,
+        not on every lookup.
+        """
+        if shared is None:
+            return None, None
+        now = self.clock()
+        checked = self.checked_counters
+        if checked is None or now - checked[0] >= settings.NEGATIVE_CACHE_CHECK_INTERVAL:
+            counters = shared.get_many([GENERATION_KEY, PURGES_KEY])
+            checked = self.checked_counters = (now, counters.get(GENERATION_KEY, 0), counters.get(PURGES_KEY, 0))
+        return checked[1], checked[2]
+
+    @staticmethod
+    def shared_key(title, generation):
+        # Bumping the generation invalidates the whole shared tier at once.
+        return 'omdb-negative:{}:{}'.format(generation, hashlib.md5(title.encode('utf-8')).hexdigest())
+
+    @staticmethod
+    def bump(shared, key):
+        try:
+            shared.incr(key)
+        except ValueError:
+            shared.set(key, 1, timeout=None)
+
+    def get(self, movie_title):
+        title = normalize_title(movie_title)
+        shared = self.shared
+        generation, purges = self.counters(shared)
+        entry = self.local.get(title)
+        error = entry[1] if entry is not None and entry[0] == purges else None
+        if error is None and shared is not None:
+            error = shared.get(self.shared_key(title, generation))
+            if error is not None:
+                self.local.set(title, (purges, error))
+        metrics.increment('{}_{}_total'.format(METRIC_PREFIX, 'misses' if error is None else 'hits'))
+        return error
+
+    def add(self, movie_title, error):
+        title = normalize_title(movie_title)
+        shared = self.shared
+        generation, purges = self.counters(shared)
+        self.local.set(title, (purges, error))
+        if shared is not None:
+            shared.set(self.shared_key(title, generation), error, timeout=settings.NEGATIVE_CACHE_TTL)
+
+    def purge(self, movie_titles=None):
+        shared = self.shared
+        if movie_titles is None:
+            self.local.clear()
+            if shared is not None:
+                self.bump(shared, GENERATION_KEY)
+                self.bump(shared, PURGES_KEY)
+                self.checked_counters = None
+            return
+        generation, _ = self.counters(shared)
+        for movie_title in movie_titles:
+            title = normalize_title(movie_title)
+            self.local.delete(title)
+            if shared is not None:
+                shared.delete(self.shared_key(title, generation))
+        if shared is not None:
+            self.bump(shared, PURGES_KEY)
+            self.checked_counters = None
+
+
+negative_cache = NegativeCache()
@@ -0,0 +1,205 @@
+import logging
+import random
+import re
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+from moviedb_rest_api import profiling
+
+logger = logging.getLogger(__name__)
+
+MOVIE_NOT_FOUND = 'Movie not found!'
+
+YEAR_RE = re.compile(r'^(\d{4})')
+RUNTIME_RE = re.compile(r'^(\d+) min')
+
+
+def movie_attributes(data):
+    """
+    Typed values of the OMDb attributes ``Movie`` keeps in indexed columns.
+
+    OMDb sends everything as strings with 'N/A' for missing values, e.g. a
+    Year of '2005–2010' or a Runtime of '107 min'.
+    """
+    def value(key):
+        raw = data.get(key)
+        return raw.strip() if isinstance(raw, str) and raw.strip() not in ('', 'N/A') else None
+
+    year = YEAR_RE.match(value('Year') or '')
+    runtime = RUNTIME_RE.match(value('Runtime') or '')
+    try:
+        imdb_rating = Decimal(value('imdbRating')) if value('imdbRating') else None
+    except InvalidOperation:
+        imdb_rating = None
+    return {
+        'year': int(year.group(1)) if year else None,
+        'imdb_id': value('imdbID'),
+        'imdb_rating': imdb_rating,
+        'runtime_minutes': int(runtime.group(1)) if runtime else None,
+        'genres': [genre.strip().lower() for genre in (value('Genre') or '').split(',') if genre.strip()],
+    }
+
+
+class OmdbUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Fails fast while OMDb is unhealthy.
+
+    After ``failure_threshold`` consecutive failed calls the circuit opens and every
+    call is rejected for ``reset_timeout`` seconds. Then a single trial call is let
+    through - its outcome either closes the circuit or opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+class OmdbClient(object):
+    """
+    OMDb API client sharing one pooled keep-alive session between requests.
+
+    Every attempt is bounded by connect and read timeouts. Connection errors,
+    timeouts and 5xx/429 responses are retried with jittered exponential backoff,
+    and calls that still fail feed the circuit breaker.
+    """
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_url, api_key, connect_timeout=3.05, read_timeout=5, max_retries=2,
+                 backoff_factor=0.2, pool_size=10, circuit_breaker=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_movie(self, movie_title, time_limit=None):
+        """
+        Returns ``(status_code, data)`` of the OMDb title lookup.
+
+        Raises ``OmdbUnavailable`` when the circuit is open or OMDb kept failing
+        after all retries. With a ``time_limit`` the attempts are cut short and not
+        retried once they would not end within that many seconds.
+        """
+        if not self.circuit_breaker.allow_request():
+            raise OmdbUnavailable('OMDb circuit is open.')
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        try:
+            response = self.request_with_retries({'apikey': self.api_key, 't': movie_title}, deadline)
+            data = response.json()
+        except (requests.RequestException, ValueError) as exc:
+            self.circuit_breaker.record_failure()
+            raise OmdbUnavailable(str(exc))
+        if response.status_code in self.retry_statuses:
+            self.circuit_breaker.record_failure()
+            raise OmdbUnavailable('OMDb responded with {}.'.format(response.status_code))
+        self.circuit_breaker.record_success()
+        return response.status_code, data
+
+    def request_with_retries(self, params, deadline=None):
+        attempt = 0
+        while True:
+            try:
+                with profiling.timing('omdb'):
+                    response = self.session.get(self.api_url, params=params, timeout=self.attempt_timeout(deadline))
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt + 1)
+                if self.out_of_time(deadline, delay):
+                    raise
+                logger.warning('OMDb request failed (%s), retrying.', exc)
+            else:
+                if response.status_code not in self.retry_statuses or attempt >= self.max_retries:
+                    return response
+                delay = self.backoff(attempt + 1)
+                if self.out_of_time(deadline, delay):
+                    return response
+                logger.warning('OMDb responded with %s, retrying.', response.status_code)
+            attempt += 1
+            time.sleep(delay)
+
+    def attempt_timeout(self, deadline):
+        """Connect and read timeouts of the next attempt, shortened to what is left until ``deadline``."""
+        if deadline is None:
+            return self.timeout
+        remaining = max(deadline - time.monotonic(), 0.001)
+        return tuple(min(timeout, remaining) for timeout in self.timeout)
+
+    @staticmethod
+    def out_of_time(deadline, delay):
+        # A retry that could not start before the deadline is not worth making.
+        return deadline is not None and time.monotonic() + delay >= deadline
+
+    def backoff(self, attempt):
+        # "Full jitter" - spreads the retries of concurrent workers apart.
+        return random.uniform(0, self.backoff_factor * 2 ** attempt)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OmdbClient(
+                    api_url=settings.OMDB_API_URL,
+                    api_key=settings.OMDB_API_KEY,
+                    connect_timeout=settings.OMDB_CONNECT_TIMEOUT,
+                    read_timeout=settings.OMDB_READ_TIMEOUT,
+                    max_retries=settings.OMDB_MAX_RETRIES,
+                    backoff_factor=settings.OMDB_RETRY_BACKOFF,
+                    pool_size=settings.OMDB_POOL_SIZE,
+                    circuit_breaker=CircuitBreaker(
+                        failure_threshold=settings.OMDB_CIRCUIT_FAILURE_THRESHOLD,
+                        reset_timeout=settings.OMDB_CIRCUIT_RESET_TIMEOUT,
+                    ),
+                )
+    return _client
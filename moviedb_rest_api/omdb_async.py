@@ -0,0 +1,96 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from django.conf import settings
+
+from moviedb_rest_api.omdb import CircuitBreaker, OmdbClient, OmdbUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncOmdbClient(object):
+    """
+    asyncio counterpart of ``OmdbClient``, for the event loop of the ASGI application.
+
+    All the requests share one aiohttp session, its connection pool keeps up to
+    ``pool_size`` keep-alive connections. Timeouts, retries and the circuit
+    breaker behave like in ``OmdbClient``.
+    """
+    retry_statuses = OmdbClient.retry_statuses
+    backoff = OmdbClient.backoff
+
+    def __init__(self, api_url, api_key, connect_timeout=3.05, read_timeout=5, max_retries=2,
+                 backoff_factor=0.2, pool_size=100, circuit_breaker=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        self.session = None
+
+    def get_session(self):
+        # Created on first use, so it belongs to the running event loop.
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size), timeout=self.timeout
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def get_movie(self, movie_title):
+        """
+        Returns ``(status_code, data)`` of the OMDb title lookup.
+
+        Raises ``OmdbUnavailable`` when the circuit is open or OMDb kept failing
+        after all retries.
+        """
+        if not self.circuit_breaker.allow_request():
+            raise OmdbUnavailable('OMDb circuit is open.')
+        try:
+            status_code, data = await self.request_with_retries({'apikey': self.api_key, 't': movie_title})
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+            self.circuit_breaker.record_failure()
+            raise OmdbUnavailable(str(exc))
+        if status_code in self.retry_statuses:
+            self.circuit_breaker.record_failure()
+            raise OmdbUnavailable('OMDb responded with {}.'.format(status_code))
+        self.circuit_breaker.record_success()
+        return status_code, data
+
+    async def request_with_retries(self, params):
+        attempt = 0
+        while True:
+            try:
+                async with self.get_session().get(self.api_url, params=params) as response:
+                    if response.status not in self.retry_statuses or attempt >= self.max_retries:
+                        return response.status, await response.json(content_type=None)
+                    logger.warning('OMDb responded with %s, retrying.', response.status)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning('OMDb request failed (%s), retrying.', exc)
+            attempt += 1
+            await asyncio.sleep(self.backoff(attempt))
+
+
+def create_client():
+    return AsyncOmdbClient(
+        api_url=settings.OMDB_API_URL,
+        api_key=settings.OMDB_API_KEY,
+        connect_timeout=settings.OMDB_CONNECT_TIMEOUT,
+        read_timeout=settings.OMDB_READ_TIMEOUT,
+        max_retries=settings.OMDB_MAX_RETRIES,
+        backoff_factor=settings.OMDB_RETRY_BACKOFF,
+        pool_size=settings.OMDB_ASYNC_POOL_SIZE,
+        circuit_breaker=CircuitBreaker(
+            failure_threshold=settings.OMDB_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.OMDB_CIRCUIT_RESET_TIMEOUT,
+        ),
+    )
@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+
+class OmdbStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Without it every keep-alive response waits for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        stub = self.server.stub
+        title = parse_qs(urlparse(self.path).query).get('t', [''])[0]
+        with stub.lock:
+            stub.requests.append(title)
+            stub.client_ports.add(self.client_address[1])
+            status_code = stub.failures.pop(0) if stub.failures else 200
+        if stub.delay:
+            time.sleep(stub.delay)
+
+        if status_code != 200:
+            body = {'Response': 'False', 'Error': 'Stub failure.'}
+        elif title.lower() in stub.movies:
+            body = stub.movies[title.lower()]
+        else:
+            body = {'Response': 'False', 'Error': 'Movie not found!'}
+        payload = json.dumps(body).encode('utf-8')
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on a slow response are expected in timeout tests.
+        pass
+
+
+class OmdbStub(object):
+    """
+    Local stand-in for the OMDb API.
+
+    ``movies`` maps lower-cased titles to the OMDb payload, ``failures`` is a queue
+    of status codes returned by the next requests and ``delay`` slows every response.
+    """
+
+    def __init__(self, movies=None, delay=0):
+        self.movies = {title.lower(): data for title, data in (movies or {}).items()}
+        self.delay = delay
+        self.failures = []
+        self.requests = []
+        self.client_ports = set()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), OmdbStubHandler)
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
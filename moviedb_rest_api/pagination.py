@@ -0,0 +1,239 @@
+import abc
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+class PageNotFound(LookupError):
+    pass
+
+
+# Largest OFFSET Postgres takes (bigint).
+MAX_OFFSET = 2 ** 63 - 1
+
+
+class BasePaginator(abc.ABC):
+    page_size_query_param = 'page_size'
+
+    def __init__(self, page_size=None, max_page_size=None):
+        self.page_size = page_size or settings.API_PAGE_SIZE
+        self.max_page_size = max_page_size or settings.API_MAX_PAGE_SIZE
+        self.request = None
+        self.rows = []
+        self.has_next = False
+        self.has_previous = False
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    @abc.abstractmethod
+    def get_next_link(self):
+        pass
+
+    @abc.abstractmethod
+    def get_previous_link(self):
+        pass
+
+    def get_link_header(self):
+        links = []
+        for rel, url in (('next', self.get_next_link()), ('prev', self.get_previous_link())):
+            if url:
+                links.append('<{}>; rel="{}"'.format(url, rel))
+        return ', '.join(links)
+
+    def get_paginated_response(self, response):
+        link_header = self.get_link_header()
+        if link_header:
+            response['Link'] = link_header
+        return response
+
+
+class PagePaginator(BasePaginator):
+    """
+    Page number pagination for result sets whose values depend on the rows
+    before them, like a rank computed over the whole set.
+    """
+    page_query_param = 'page'
+
+    def __init__(self, page_size=None, max_page_size=None):
+        super(PagePaginator, self).__init__(page_size, max_page_size)
+        self.page = 1
+
+    def paginate(self, fetch_rows, request):
+        """
+        Returns the requested page, ``fetch_rows(offset, limit)`` loads the rows.
+
+        Raises InvalidPage for a page that is not a positive integer and, like
+        DRF's ``PageNumberPagination``, PageNotFound for one past the last page.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        try:
+            self.page = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise InvalidPage('Invalid page.')
+        if self.page < 1:
+            raise InvalidPage('Invalid page.')
+        offset = (self.page - 1) * page_size
+        if offset > MAX_OFFSET:
+            raise PageNotFound('Invalid page.')
+
+        rows = list(fetch_rows(offset, page_size + 1))
+        if not rows and self.page > 1:
+            raise PageNotFound('Invalid page.')
+        self.has_next = len(rows) > page_size
+        self.has_previous = self.page > 1
+        self.rows = rows[:page_size]
+        return self.rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page + 1)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page - 1)
+
+
+class KeysetPaginator(BasePaginator):
+    """
+    Keyset ("seek") pagination over a unique ordering.
+
+    Instead of an OFFSET every page is selected with a row comparison against the
+    last seen key, so each page is a bounded index range scan however deep it is.
+    The response body stays a plain list, links to neighbouring pages are exposed
+    through the ``Link`` header.
+    """
+    after_query_param = 'after'
+    before_query_param = 'before'
+
+    def __init__(self, ordering, page_size=None, max_page_size=None):
+        super(KeysetPaginator, self).__init__(page_size, max_page_size)
+        self.ordering = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        after = self.decode_cursor(request.query_params.get(self.after_query_param))
+        before = self.decode_cursor(request.query_params.get(self.before_query_param))
+        after = self.clean_cursor(after, queryset.model)
+        before = self.clean_cursor(before, queryset.model)
+
+        if before is not None:
+            queryset = queryset.filter(self.seek_filter(before, backwards=True))
+            rows = list(queryset.order_by(*self.order_by(backwards=True))[:page_size + 1])
+            self.has_previous = len(rows) > page_size
+            self.has_next = True
+            rows = rows[:page_size][::-1]
+        else:
+            if after is not None:
+                queryset = queryset.filter(self.seek_filter(after))
+            rows = list(queryset.order_by(*self.order_by())[:page_size + 1])
+            self.has_next = len(rows) > page_size
+            self.has_previous = after is not None
+            rows = rows[:page_size]
+
+        self.rows = rows
+        return rows
+
+    def order_by(self, backwards=False):
+        return ['{}{}'.format('-' if descending != backwards else '', field) for field, descending in self.ordering]
+
+    def seek_filter(self, cursor, backwards=False):
+        if len(cursor) != len(self.ordering):
+            raise InvalidCursor('Cursor does not match the ordering.')
+        seek = Q()
+        for position, (field, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition = Q(**{'{}__{}'.format(field, lookup): cursor[position]})
+            for previous_position, (previous_field, _) in enumerate(self.ordering[:position]):
+                condition &= Q(**{previous_field: cursor[previous_position]})
+            seek |= condition
+        return seek
+
+    def clean_cursor(self, cursor, model):
+        """
+        Converts the values of a decoded cursor with the ordering fields of ``model``.
+
+        A cursor comes from the client, a value of the wrong type (or out of the
+        column's range) would only fail in the query.
+        """
+        if cursor is None:
+            return None
+        if len(cursor) != len(self.ordering):
+            raise InvalidCursor('Cursor does not match the ordering.')
+        try:
+            return [model._meta.get_field(field).clean(value, None) for field, value in zip(self.fields, cursor)]
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor.')
+
+    @property
+    def fields(self):
+        return [field for field, _ in self.ordering]
+
+    def row_key(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.fields]
+        return [getattr(row, field) for field in self.fields]
+
+    @staticmethod
+    def encode_value(value):
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def encode_cursor(self, row):
+        key = [self.encode_value(value) for value in self.row_key(row)]
+        return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        if not cursor:
+            return None
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError):
+            raise InvalidCursor('Invalid cursor.')
+        if not isinstance(key, list):
+            raise InvalidCursor('Invalid cursor.')
+        return key
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.before_query_param)
+        return replace_query_param(url, self.after_query_param, self.encode_cursor(self.rows[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.rows:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.after_query_param)
+        return replace_query_param(url, self.before_query_param, self.encode_cursor(self.rows[0]))
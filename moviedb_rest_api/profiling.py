@@ -0,0 +1,131 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from moviedb_rest_api import metrics
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class RequestProfile(object):
+    """Time spent in, and number of, the calls of every kind (``omdb``, ``render``) made while serving a request."""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, name, duration):
+        self.durations[name] += duration
+        self.counts[name] += 1
+
+
+def current():
+    """Profile of the request served by this thread, None outside of a profiled request."""
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def timing(name):
+    """Adds the duration of the block to the current request's profile, if any."""
+    profile = current()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - start)
+
+
+def server_timing(durations, counts, queries_count):
+    entries = ['db;dur={:.1f};desc="{} queries"'.format(durations['db'] * 1000, queries_count)]
+    if counts['omdb']:
+        entries.append('omdb;dur={:.1f};desc="{} requests"'.format(durations['omdb'] * 1000, counts['omdb']))
+    if counts['render']:
+        entries.append('render;dur={:.1f}'.format(durations['render'] * 1000))
+    entries.append('total;dur={:.1f}'.format(durations['total'] * 1000))
+    return ', '.join(entries)
+
+
+class RequestProfilingMiddleware(object):
+    """
+    Measures where the time of every request goes.
+
+    Queries are captured from the debug cursors Django uses anyway with
+    ``DEBUG = True`` (Django 1.11 has no ``execute_wrapper``), OMDb requests made
+    by the request's thread and the rendering of the response are timed with
+    ``timing``. The breakdown is sent back in the ``Server-Timing`` header and
+    added up per view in ``metrics``, served by ``/metrics/``. A sample
+    (``REQUEST_PROFILING_SAMPLE_RATE``) of the requests slower than
+    ``REQUEST_PROFILING_SLOW_SECONDS`` gets its queries logged.
+
+    Capturing the queries makes every query of the request go through a debug
+    cursor, so with ``DEBUG`` off ``REQUEST_PROFILING`` is off unless enabled.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_PROFILING:
+            return self.get_response(request)
+
+        profile = _local.profile = RequestProfile()
+        debug_cursors = {}
+        for connection in connections.all():
+            # The query log is reset when a request starts, with the offset it still works in nested test clients.
+            debug_cursors[connection.alias] = connection.force_debug_cursor, len(connection.queries_log)
+            connection.force_debug_cursor = True
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.durations['total'] = time.perf_counter() - start
+            del _local.profile
+            queries = []
+            for connection in connections.all():
+                force_debug_cursor, offset = debug_cursors.get(connection.alias, (False, 0))
+                queries += list(connection.queries_log)[offset:]
+                connection.force_debug_cursor = force_debug_cursor
+        profile.durations['db'] = sum(float(query['time']) for query in queries)
+
+        view = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+        self.record(view, request.method, response.status_code, profile, len(queries))
+        response['Server-Timing'] = server_timing(profile.durations, profile.counts, len(queries))
+        if (profile.durations['total'] >= settings.REQUEST_PROFILING_SLOW_SECONDS
+                and random.random() < settings.REQUEST_PROFILING_SAMPLE_RATE):
+            logger.warning(
+                'Slow request %s %s took %.0f ms, %d queries:\n%s', request.method, request.get_full_path(),
+                profile.durations['total'] * 1000, len(queries),
+                '\n'.join('{}s {}'.format(query['time'], query['sql']) for query in queries)
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        profile = current()
+        if profile is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                profile.add('render', time.perf_counter() - start)
+            response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def record(view, method, status_code, profile, queries_count):
+        metrics.increment('http_requests_total', view=view, method=method, status=status_code)
+        metrics.observe('http_request_duration_seconds', profile.durations['total'], view=view, method=method)
+        metrics.observe('http_request_db_seconds', profile.durations['db'], view=view)
+        metrics.increment('http_request_db_queries_total', queries_count, view=view)
+        metrics.increment('http_request_omdb_requests_total', profile.counts['omdb'], view=view)
+        metrics.increment('http_request_omdb_seconds_total', profile.durations['omdb'], view=view)
+        metrics.increment('http_request_render_seconds_total', profile.durations['render'], view=view)
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from moviedb_rest_api import cache, metrics, omdb
+from moviedb_rest_api.importer import RateLimiter, batches
+from moviedb_rest_api.models import Movie
+
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+
+
+class MovieRefresher(object):
+    """
+    Re-fetches the OMDb data of the movies fetched longest ago.
+
+    The stalest ``limit`` ready movies are fetched by a bounded, rate limited
+    thread pool. Only the movies whose data changed are written back, ``batch_size``
+    of them per ``UPDATE ... FROM (VALUES ...)``, the rest just get their
+    ``last_fetched_at`` bumped with one more query. Movies OMDb failed to answer
+    for stay stale and are picked up again by the next run.
+    """
+
+    def __init__(self, client=None, workers=None, rate=None, batch_size=None):
+        self.client = client or omdb.get_client()
+        self.workers = workers or settings.MOVIE_IMPORT_WORKERS
+        self.rate_limiter = RateLimiter(settings.MOVIE_REFRESH_RATE if rate is None else rate)
+        self.batch_size = batch_size or settings.MOVIE_IMPORT_BATCH_SIZE
+
+    def run(self, limit=None, max_age=None):
+        """Refreshes the stale movies, returns how many of them ended up ``changed``, ``unchanged`` or ``failed``."""
+        limit = limit or settings.MOVIE_REFRESH_LIMIT
+        max_age = settings.MOVIE_REFRESH_MAX_AGE if max_age is None else max_age
+        movies = list(
+            Movie.objects.filter(
+                status=Movie.READY, last_fetched_at__lt=timezone.now() - timedelta(seconds=max_age)
+            ).order_by('last_fetched_at', 'id').values('id', 'title', 'additional_data')[:limit]
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            fetched = list(executor.map(self.fetch, movies))
+
+        changed = {}
+        unchanged = []
+        for movie, data in zip(movies, fetched):
+            if data is None:
+                continue
+            if data == movie['additional_data']:
+                unchanged.append(movie['id'])
+            else:
+                changed[movie['id']] = data
+
+        for batch in batches(list(changed.items()), self.batch_size):
+            Movie.objects.refresh_omdb_data(dict(batch))
+        if unchanged:
+            Movie.objects.filter(id__in=unchanged).update(last_fetched_at=timezone.now())
+        if changed:
+            cache.movie_updated()
+
+        totals = {CHANGED: len(changed), UNCHANGED: len(unchanged)}
+        totals[FAILED] = len(movies) - totals[CHANGED] - totals[UNCHANGED]
+        for status, count in totals.items():
+            metrics.increment('movie_refresh_movies_total', count, status=status)
+        return totals
+
+    def fetch(self, movie):
+        """
+        Returns the current OMDb data of the movie, or None when OMDb did not answer with it.
+
+        A title OMDb no longer finds keeps its stored data - it still counts as
+        fetched, so it is not retried on every run.
+        """
+        self.rate_limiter.wait()
+        try:
+            status_code, data = self.client.get_movie(movie['title'])
+        except omdb.OmdbUnavailable:
+            return None
+        if status_code == 200 and 'Error' not in data:
+            return data
+        if data.get('Error') == omdb.MOVIE_NOT_FOUND:
+            return movie['additional_data']
+        return None
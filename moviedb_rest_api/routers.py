@@ -0,0 +1,174 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from moviedb_rest_api import metrics
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Set on the responses to writes, holds the time until which the client reads from the primary.
+STICKY_COOKIE = 'db_primary_until'
+# Seconds the replica is behind the primary. 0 when it has replayed all the WAL it received, an idle primary
+# writes none, or when it is no standby at all.
+LAG_SQL = (
+    'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+_state = threading.local()
+
+
+class ReplicaLagMonitor(object):
+    """
+    Replication lag of the ``DATABASE_REPLICAS``.
+
+    The lag of a replica is queried at most every
+    ``DATABASE_REPLICA_LAG_CHECK_INTERVAL`` seconds per process. Replicas behind
+    by more than ``DATABASE_REPLICA_MAX_LAG`` seconds, or failing the check, are
+    left out until a later check finds them caught up.
+    """
+
+    def __init__(self):
+        self.lags = {}
+
+    def lag(self, alias):
+        now = time.monotonic()
+        checked_at, lag = self.lags.get(alias, (None, None))
+        if checked_at is None or now - checked_at >= settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+            lag = self.check(alias)
+            self.lags[alias] = (now, lag)
+        return lag
+
+    @staticmethod
+    def check(alias):
+        """Seconds ``alias`` is behind the primary, None when it could not be queried."""
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError as exc:
+            logger.warning('Could not check the lag of the %s database (%s).', alias, exc)
+            connections[alias].close()
+            return None
+
+    def available(self):
+        max_lag = settings.DATABASE_REPLICA_MAX_LAG
+        return [
+            alias for alias, lag in ((alias, self.lag(alias)) for alias in settings.DATABASE_REPLICAS)
+            if lag is not None and lag <= max_lag
+        ]
+
+    def reset(self):
+        self.lags.clear()
+
+
+lag_monitor = ReplicaLagMonitor()
+
+
+def start_request(read_only):
+    _state.read_only = read_only
+    _state.database = None
+
+
+def end_request(**kwargs):
+    _state.read_only = False
+    _state.database = None
+
+
+def read_database():
+    """
+    Database the reads of the current request go to, None outside of read-only requests.
+
+    Picked on the first query of the request among the replicas that are not
+    lagging, the primary when all of them are. The later queries of the request
+    stay on the same database.
+    """
+    if not getattr(_state, 'read_only', False):
+        return None
+    if _state.database is None:
+        replicas = lag_monitor.available()
+        _state.database = random.choice(replicas) if replicas else 'default'
+        metrics.increment('db_read_requests_total', database=_state.database)
+    return _state.database
+
+
+@contextmanager
+def use_primary():
+    """Sends the reads made within the block to the primary, also in a read-only request."""
+    read_only = getattr(_state, 'read_only', False)
+    _state.read_only = False
+    try:
+        yield
+    finally:
+        _state.read_only = read_only
+
+
+def is_sticky(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def sticky_until():
+    """Value of the cookie keeping a client that just wrote on the primary."""
+    return '{:.3f}'.format(time.time() + settings.DATABASE_PRIMARY_STICKY_SECONDS)
+
+
+def sticky_cookie_header():
+    """``Set-Cookie`` header value of the cookie, for the responses not made by Django."""
+    cookie = SimpleCookie()
+    cookie[STICKY_COOKIE] = sticky_until()
+    cookie[STICKY_COOKIE]['max-age'] = settings.DATABASE_PRIMARY_STICKY_SECONDS
+    cookie[STICKY_COOKIE]['path'] = '/'
+    return cookie[STICKY_COOKIE].OutputString()
+
+
+class ReplicaRouter(object):
+    """
+    Routes the reads of read-only requests to the replicas, everything else to ``default``.
+
+    The queries made outside of requests (management commands, background
+    enrichment) keep to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = ['default'] + settings.DATABASE_REPLICAS
+        return obj1._state.db in databases and obj2._state.db in databases
+
+
+class ReplicaRoutingMiddleware(object):
+    """
+    Lets the queries of GET and HEAD requests go to the ``DATABASE_REPLICAS``.
+
+    The responses to writes carry a cookie pinning the client to the primary
+    for ``DATABASE_PRIMARY_STICKY_SECONDS``, so it reads its own writes while
+    the replicas catch up. The request stays read-only until
+    ``request_finished``, also while a streamed response is being written.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        start_request(request.method in SAFE_METHODS and not is_sticky(request))
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(STICKY_COOKIE, sticky_until(), max_age=settings.DATABASE_PRIMARY_STICKY_SECONDS)
+        return response
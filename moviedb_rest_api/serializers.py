@@ -1,39 +1,169 @@
+import re
+
+from django.contrib.postgres.fields.jsonb import KeyTransform
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
 from rest_framework import serializers
 
+from moviedb_rest_api.fastjson import RawJSON
 from moviedb_rest_api.models import Movie, Comment
 
+# Keys of JSON fields that can be selected, they end up quoted in the SQL.
+JSON_KEY_RE = re.compile(r'^[A-Za-z][A-Za-z0-9_]*$')
+
+
+class InvalidFields(ValueError):
+    pass
+
 
 class MovieSerializer(serializers.ModelSerializer):
     movie_id = serializers.IntegerField(source='id', read_only=True)
 
     class Meta:
         model = Movie
-        fields = ('movie_id', 'title', 'additional_data', 'created_at')
+        fields = ('movie_id', 'title', 'status', 'additional_data', 'created_at')
 
 
 class CommentSerializer(serializers.ModelSerializer):
     comment_id = serializers.IntegerField(source='id', read_only=True)
-    movie_id = serializers.IntegerField(source='movie.id', read_only=True)
+    movie_id = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Comment
         fields = ('movie_id', 'comment_id', 'body', 'created_at')
 
 
-class TopMoviesSerializer(serializers.ModelSerializer):
-    comments_count = None
-    movie_rank = 0
+class ValuesSerializer(object):
+    """
+    Flat serializer for ``QuerySet.values()`` rows.
 
-    movie_id = serializers.IntegerField(source='id', read_only=True)
-    total_comments = serializers.IntegerField(source='comments_count', read_only=True)
-    rank = serializers.SerializerMethodField()
+    Produces the same representation as the corresponding model serializer, but
+    skips building model instances and running every value through DRF fields,
+    which dominates the cost of serializing long lists.
+    """
+    fields = ()
+    datetime_fields = ()
+    datetime_field = serializers.DateTimeField()
+    # Sources fetched even when a projection leaves them out, e.g. the pagination key.
+    key_sources = ()
+    # (output name, source) of the JSON field whose keys can be projected one by one.
+    json_field = None
+    # (key, alias) pairs of the projected JSON keys.
+    json_keys = ()
+    # JSON fields fetched as text by the source alias they map to, they reach the response as ``RawJSON``.
+    raw_json_sources = {}
+
+    def __init__(self, instance, many=False):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def project(cls, requested):
+        """
+        Serializer limited to the ``requested`` comma separated output names,
+        ``<json field>.<key>`` selects a single key of the JSON field. Only the
+        selected columns and keys are fetched by ``values``.
+        """
+        if not requested:
+            return cls
+        available = dict(cls.fields)
+        names, json_keys = set(), set()
+        for name in filter(None, (name.strip() for name in requested.split(','))):
+            json_name, _, key = name.partition('.')
+            if key and cls.json_field and json_name == cls.json_field[0] and JSON_KEY_RE.match(key):
+                json_keys.add(key)
+            elif name in available:
+                names.add(name)
+            else:
+                raise InvalidFields('Unknown field {}.'.format(name))
+        if not names and not json_keys:
+            raise InvalidFields('No fields selected.')
+        if cls.json_field and cls.json_field[0] in names:
+            json_keys = set()
+        return type(cls.__name__, (cls,), {
+            'fields': tuple((name, source) for name, source in cls.fields if name in names),
+            'datetime_fields': tuple(name for name in cls.datetime_fields if name in names),
+            'json_keys': tuple((key, 'json_key_{}'.format(position)) for position, key in enumerate(sorted(json_keys))),
+        })
+
+    @classmethod
+    def values(cls, queryset, key_sources=None):
+        sources = [source for _, source in cls.fields]
+        key_sources = cls.key_sources if key_sources is None else key_sources
+        sources += [source for source in key_sources if source not in sources]
+        raw_json_sources = [source for source in sources if source in cls.raw_json_sources]
+        if raw_json_sources:
+            queryset = queryset.annotate(**{
+                source: Cast(cls.raw_json_sources[source], TextField()) for source in raw_json_sources
+            })
+        if cls.json_keys:
+            queryset = queryset.annotate(**{
+                alias: KeyTransform(key, cls.json_field[1]) for key, alias in cls.json_keys
+            })
+        return queryset.values(*sources, *[alias for _, alias in cls.json_keys])
+
+    @classmethod
+    def pick(cls, data):
+        """Projects the full representation ``data`` of an already loaded object."""
+        picked = {name: data[name] for name, _ in cls.fields}
+        if cls.json_keys:
+            json_data = data[cls.json_field[0]] or {}
+            picked[cls.json_field[0]] = {key: json_data.get(key) for key, _ in cls.json_keys}
+        return picked
+
+    def to_representation(self, row):
+        data = {name: row[source] for name, source in self.fields}
+        for name in self.datetime_fields:
+            if data[name] is not None:
+                data[name] = self.datetime_field.to_representation(data[name])
+        for name, source in self.fields:
+            if source in self.raw_json_sources and data[name] is not None:
+                data[name] = RawJSON(data[name])
+        if self.json_keys:
+            data[self.json_field[0]] = {key: row[alias] for key, alias in self.json_keys}
+        return data
+
+    @property
+    def data(self):
+        if self.many:
+            return [self.to_representation(row) for row in self.instance]
+        return self.to_representation(self.instance)
+
+
+class MovieValuesSerializer(ValuesSerializer):
+    fields = (
+        ('movie_id', 'id'),
+        ('title', 'title'),
+        ('status', 'status'),
+        ('additional_data', 'additional_data_text'),
+        ('created_at', 'created_at'),
+    )
+    datetime_fields = ('created_at',)
+    key_sources = ('id',)
+    json_field = ('additional_data', 'additional_data')
+    raw_json_sources = {'additional_data_text': 'additional_data'}
+
+
+class MovieSearchValuesSerializer(MovieValuesSerializer):
+    fields = MovieValuesSerializer.fields + (
+        ('score', 'score'),
+    )
+
+
+class CommentValuesSerializer(ValuesSerializer):
+    fields = (
+        ('movie_id', 'movie_id'),
+        ('comment_id', 'id'),
+        ('body', 'body'),
+        ('created_at', 'created_at'),
+    )
+    datetime_fields = ('created_at',)
 
-    class Meta:
-        model = Movie
-        fields = ('movie_id', 'total_comments', 'rank')
 
-    def get_rank(self, obj):
-        if not self.comments_count or obj.comments_count < self.comments_count:
-            self.comments_count = obj.comments_count
-            self.movie_rank += 1
-        return self.movie_rank
+class TopMoviesValuesSerializer(ValuesSerializer):
+    fields = (
+        ('movie_id', 'id'),
+        ('total_comments', 'comment_count'),
+        ('rank', 'rank'),
+    )
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
 from getenv import env
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -24,10 +25,14 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = '$a)$_knq*#zn&rv!cvy(c62@=im-idlcct9(3b3u+@b0d$cl28'
 
+ENVIRONMENT = env('ENVIRONMENT', 'development')
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Besides leaking internals, DEBUG keeps every query of a request in memory.
+DEBUG = env('DEBUG', ENVIRONMENT == 'development')
 
-ALLOWED_HOSTS = []
+# Comma separated, e.g. "api.example.com,www.example.com".
+ALLOWED_HOSTS = [host.strip() for host in str(env('ALLOWED_HOSTS', '')).split(',') if host.strip()]
 
 
 # Application definition
@@ -40,11 +45,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # Registers the trigram_similar lookup of fuzzy movie search.
+    'django.contrib.postgres',
     'rest_framework',
 ]
 
 
 MIDDLEWARE = [
+    'moviedb_rest_api.profiling.RequestProfilingMiddleware',
+    'moviedb_rest_api.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,9 +94,40 @@ DATABASES = {
         'USER': 'postgres',
         'HOST': 'db',
         'PORT': 5432,
+        # Seconds a connection is kept open for the next requests of the same worker thread, 0 closes it after
+        # every request. Connections dropped by the database meanwhile are detected at the start of a request
+        # unless DATABASE_CONN_HEALTH_CHECKS is off.
+        'CONN_MAX_AGE': env('DATABASE_CONN_MAX_AGE', 60),
     }
 }
 
+DATABASE_CONN_HEALTH_CHECKS = env('DATABASE_CONN_HEALTH_CHECKS', True)
+
+# GET and HEAD requests read from the streaming replicas of the default database on DATABASE_REPLICA_HOSTS
+# ('host' or 'host:port', comma separated), the replicas behind by more than DATABASE_REPLICA_MAX_LAG seconds
+# are skipped. Clients read from the primary for DATABASE_PRIMARY_STICKY_SECONDS after they write.
+DATABASE_REPLICA_HOSTS = [host.strip() for host in str(env('DATABASE_REPLICA_HOSTS', '')).split(',') if host.strip()]
+DATABASE_REPLICAS = ['replica_{}'.format(index) for index in range(1, len(DATABASE_REPLICA_HOSTS) + 1)]
+DATABASE_REPLICA_MAX_LAG = env('DATABASE_REPLICA_MAX_LAG', 5)
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = env('DATABASE_REPLICA_LAG_CHECK_INTERVAL', 5)
+DATABASE_PRIMARY_STICKY_SECONDS = env('DATABASE_PRIMARY_STICKY_SECONDS', 10)
+DATABASE_ROUTERS = ['moviedb_rest_api.routers.ReplicaRouter']
+
+# Threads of an ASGI process running Django views and database queries, each keeps its own connection.
+ASGI_THREADS = env('ASGI_THREADS', 16)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Responses of the read endpoints and the versions they and the ETags are keyed on. Point it at a shared
+    # backend (e.g. django_redis.cache.RedisCache) when running more than one worker.
+    'responses': {
+        'BACKEND': env('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env('RESPONSE_CACHE_LOCATION', 'responses'),
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -127,11 +167,107 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 OMDB_API_KEY = env('OMDB_SECRET', 'change me!')
-OMDB_API_URL = 'http://www.omdbapi.com/'
+OMDB_API_URL = env('OMDB_API_URL', 'http://www.omdbapi.com/')
+OMDB_CONNECT_TIMEOUT = env('OMDB_CONNECT_TIMEOUT', 3.05)
+OMDB_READ_TIMEOUT = env('OMDB_READ_TIMEOUT', 5)
+OMDB_MAX_RETRIES = env('OMDB_MAX_RETRIES', 2)
+OMDB_RETRY_BACKOFF = env('OMDB_RETRY_BACKOFF', 0.2)
+OMDB_POOL_SIZE = env('OMDB_POOL_SIZE', 10)
+# Keep-alive connections to OMDb shared by the requests the ASGI application (moviedb_rest_api.asgi) waits on.
+OMDB_ASYNC_POOL_SIZE = env('OMDB_ASYNC_POOL_SIZE', 100)
+OMDB_CIRCUIT_FAILURE_THRESHOLD = env('OMDB_CIRCUIT_FAILURE_THRESHOLD', 5)
+OMDB_CIRCUIT_RESET_TIMEOUT = env('OMDB_CIRCUIT_RESET_TIMEOUT', 30)
+
+# OMDb "Movie not found" responses are remembered for NEGATIVE_CACHE_TTL seconds in an in-process LRU,
+# and in the NEGATIVE_CACHE_BACKEND cache alias too if it is set.
+NEGATIVE_CACHE_TTL = env('NEGATIVE_CACHE_TTL', 3600)
+NEGATIVE_CACHE_MAX_SIZE = env('NEGATIVE_CACHE_MAX_SIZE', 10000)
+NEGATIVE_CACHE_BACKEND = env('NEGATIVE_CACHE_BACKEND', None)
+# How often (seconds) a worker checks the shared tier for purges made by the other workers.
+NEGATIVE_CACHE_CHECK_INTERVAL = env('NEGATIVE_CACHE_CHECK_INTERVAL', 1)
+
+# Granularity of the comment activity rollup - 'hour' or 'day'. Run `manage.py rebuild_comment_activity` after changing.
+COMMENT_ACTIVITY_BUCKET = env('COMMENT_ACTIVITY_BUCKET', 'hour')
+
+# Movies posted with async=true are enriched with their OMDb data in the background: by a thread pool of
+# MOVIE_ENRICHMENT_THREADS threads in the web process ('thread') or only by `manage.py enrich_movies` ('worker').
+MOVIE_ENRICHMENT_BACKEND = env('MOVIE_ENRICHMENT_BACKEND', 'thread')
+MOVIE_ENRICHMENT_THREADS = env('MOVIE_ENRICHMENT_THREADS', 4)
+# Movies still without OMDb data after this many failed fetches are marked as failed.
+MOVIE_ENRICHMENT_MAX_ATTEMPTS = env('MOVIE_ENRICHMENT_MAX_ATTEMPTS', 5)
+# Seconds a worker holds a claimed movie, after that another worker may fetch it. Has to outlast an OMDb fetch
+# with its retries.
+MOVIE_ENRICHMENT_LEASE = env('MOVIE_ENRICHMENT_LEASE', 60)
+
+# 'postgres' coordinates OMDb fetches of all the workers with advisory locks, 'local' only within the process.
+SINGLE_FLIGHT_LOCK_BACKEND = env('SINGLE_FLIGHT_LOCK_BACKEND', 'postgres')
+
+# Seconds GET /movies/, /comments/ and /top/ responses are cached for, 0 turns the response cache off.
+RESPONSE_CACHE_TIMEOUT = env('RESPONSE_CACHE_TIMEOUT', 0)
+RESPONSE_CACHE_ALIAS = 'responses'
+
+API_PAGE_SIZE = env('API_PAGE_SIZE', 100)
+API_MAX_PAGE_SIZE = env('API_MAX_PAGE_SIZE', 1000)
+
+# JSON of the API is encoded and decoded with 'orjson' (the standard library's json when it is not installed)
+# or 'stdlib'.
+JSON_BACKEND = env('JSON_BACKEND', 'orjson')
+
+REST_FRAMEWORK = {
+    # The browsable API renders a whole HTML page around every response, production serves plain JSON.
+    'DEFAULT_RENDERER_CLASSES': ['moviedb_rest_api.fastjson.FastJSONRenderer'] + (
+        ['rest_framework.renderers.BrowsableAPIRenderer'] if env('API_BROWSABLE', DEBUG) else []
+    ),
+    'DEFAULT_PARSER_CLASSES': [
+        'moviedb_rest_api.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
 
-ENVIRONMENT = env('ENVIRONMENT', 'development')
+# Bulk movie imports fetch from OMDb with MOVIE_IMPORT_WORKERS threads, at most MOVIE_IMPORT_RATE requests
+# a second (0 - unlimited), and insert MOVIE_IMPORT_BATCH_SIZE movies per query.
+MOVIE_IMPORT_WORKERS = env('MOVIE_IMPORT_WORKERS', 4)
+MOVIE_IMPORT_RATE = env('MOVIE_IMPORT_RATE', 10)
+MOVIE_IMPORT_BATCH_SIZE = env('MOVIE_IMPORT_BATCH_SIZE', 500)
+# Seconds a POST /movies/import/ request spends fetching from OMDb, the titles left are reported as failed.
+# Keep it below the gunicorn timeout (GUNICORN_TIMEOUT), or the worker is killed in the middle of the import.
+MOVIE_IMPORT_TIME_LIMIT = env('MOVIE_IMPORT_TIME_LIMIT', env('GUNICORN_TIMEOUT', 30) - 10)
+# Limit of titles accepted by one POST /movies/import/ request, use `manage.py import_movies` for more. By
+# default as many as MOVIE_IMPORT_RATE lets fetch within MOVIE_IMPORT_TIME_LIMIT.
+MOVIE_IMPORT_MAX_TITLES = env(
+    'MOVIE_IMPORT_MAX_TITLES', MOVIE_IMPORT_RATE * MOVIE_IMPORT_TIME_LIMIT if MOVIE_IMPORT_RATE else 1000
+)
+# Comments inserted per query by POST /comments/import/, counters are updated once per batch.
+COMMENT_IMPORT_BATCH_SIZE = env('COMMENT_IMPORT_BATCH_SIZE', 1000)
+
+# Time spent in the database, OMDb and rendering is reported in the Server-Timing header and by /metrics/.
+# REQUEST_PROFILING_SAMPLE_RATE of the requests slower than REQUEST_PROFILING_SLOW_SECONDS get their queries logged.
+# Off by default with DEBUG off: it logs every query, which DEBUG does anyway, and that costs time and memory.
+REQUEST_PROFILING = env('REQUEST_PROFILING', DEBUG)
+REQUEST_PROFILING_SLOW_SECONDS = env('REQUEST_PROFILING_SLOW_SECONDS', 1.0)
+REQUEST_PROFILING_SAMPLE_RATE = env('REQUEST_PROFILING_SAMPLE_RATE', 0.0)
+
+# Every run of `manage.py refresh_movies` re-fetches up to MOVIE_REFRESH_LIMIT movies whose OMDb data is older
+# than MOVIE_REFRESH_MAX_AGE seconds, at most MOVIE_REFRESH_RATE OMDb requests a second (0 - unlimited).
+MOVIE_REFRESH_LIMIT = env('MOVIE_REFRESH_LIMIT', 100)
+MOVIE_REFRESH_MAX_AGE = env('MOVIE_REFRESH_MAX_AGE', 7 * 24 * 60 * 60)
+MOVIE_REFRESH_RATE = env('MOVIE_REFRESH_RATE', 2)
 
 if ENVIRONMENT == 'heroku':
     # Configure Django App for Heroku.
     import django_heroku
     django_heroku.settings(locals())
+    DATABASES['default']['CONN_MAX_AGE'] = env('DATABASE_CONN_MAX_AGE', 60)
+
+# Checked after django_heroku, which sets its own ALLOWED_HOSTS.
+if not DEBUG and not ALLOWED_HOSTS:
+    # Django would answer every request with 400 Bad Request.
+    raise ImproperlyConfigured('ALLOWED_HOSTS must list the served host names when DEBUG is off.')
+
+# Replicas share the credentials and settings of the default database, tests use the default test database.
+for alias, replica_host in zip(DATABASE_REPLICAS, DATABASE_REPLICA_HOSTS):
+    replica_host, _, replica_port = replica_host.partition(':')
+    DATABASES[alias] = dict(
+        DATABASES['default'], HOST=replica_host, PORT=int(replica_port or 5432), TEST={'MIRROR': 'default'}
+    )
@@ -0,0 +1,102 @@
+import threading
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+# First key of the two-int advisory lock form, keeps our locks apart from anybody else's.
+ADVISORY_LOCK_NAMESPACE = 7034
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls for the same key within the process.
+
+    The first caller runs the function, callers arriving while it is in flight
+    wait for it and get the same result (or exception) back instead of repeating
+    the work.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        """Returns ``(result, shared)``, ``shared`` is True for the callers that waited."""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+
+def advisory_lock_id(key):
+    # crc32 is unsigned, advisory lock keys are signed int4.
+    return zlib.crc32(key.encode('utf-8')) - 2 ** 31
+
+
+def advisory_lock_query(function, key):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT {}(%s, %s)'.format(function), [ADVISORY_LOCK_NAMESPACE, advisory_lock_id(key)])
+        return cursor.fetchone()[0]
+
+
+def try_postgres_advisory_lock(key):
+    """Takes the advisory lock of ``key`` when it is free, returns whether it did. Does not wait."""
+    return advisory_lock_query('pg_try_advisory_lock', key)
+
+
+def postgres_advisory_unlock(key):
+    advisory_lock_query('pg_advisory_unlock', key)
+
+
+@contextmanager
+def postgres_advisory_lock(key):
+    advisory_lock_query('pg_advisory_lock', key)
+    try:
+        yield
+    finally:
+        postgres_advisory_unlock(key)
+
+
+@contextmanager
+def local_lock(key):
+    # SingleFlight already serializes callers within the process.
+    yield
+
+
+LOCK_BACKENDS = {
+    'postgres': postgres_advisory_lock,
+    'local': local_lock,
+}
+
+
+def worker_lock(key):
+    """Lock shared by all the workers, as configured by ``SINGLE_FLIGHT_LOCK_BACKEND``."""
+    return LOCK_BACKENDS[settings.SINGLE_FLIGHT_LOCK_BACKEND](key)
@@ -0,0 +1,53 @@
+from django.http import StreamingHttpResponse
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from moviedb_rest_api import fastjson
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_ndjson(items):
+    for item in items:
+        yield fastjson.dumps(item) + b'\n'
+
+
+def iter_json_array(items):
+    yield b'['
+    separator = b''
+    for item in items:
+        yield separator + fastjson.dumps(item)
+        separator = b','
+    yield b']'
+
+
+def streaming_response(items, stream_format):
+    """
+    Writes ``items`` to the client one by one as they are produced.
+
+    Combined with ``QuerySet.iterator()`` (a server-side cursor on PostgreSQL) the
+    worker never holds more than a single fetch chunk of rows in memory.
+    """
+    chunks = iter_ndjson(items) if stream_format == 'ndjson' else iter_json_array(items)
+    return StreamingHttpResponse(chunks, content_type=STREAM_FORMATS[stream_format])
+
+
+class NDJSONParser(BaseParser):
+    """Parses a newline delimited JSON request body into a list, blank lines are skipped."""
+    media_type = STREAM_FORMATS['ndjson']
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        items = []
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(fastjson.loads(line))
+            except ValueError as exc:
+                raise ParseError('NDJSON parse error on line {} - {}'.format(line_number, exc))
+        return items
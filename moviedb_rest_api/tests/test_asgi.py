@@ -0,0 +1,186 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+
+from model_mommy import mommy
+
+from moviedb_rest_api import metrics
+from moviedb_rest_api.async_app import Application
+from moviedb_rest_api.models import Movie
+from moviedb_rest_api.negative_cache import negative_cache
+from moviedb_rest_api.omdb_async import AsyncOmdbClient
+from moviedb_rest_api.omdb_stub import OmdbStub
+from moviedb_rest_api.singleflight import postgres_advisory_lock
+
+THREADS = 4
+
+
+class TestAsgiApplication(TransactionTestCase):
+	def setUp(self):
+		self.stub = OmdbStub(movies={
+			'alien': {'Title': 'Alien', 'Year': '1979', 'imdbRating': '8.5'},
+			'heat': {'Title': 'Heat', 'Year': '1995'},
+		}).start()
+		self.addCleanup(self.stub.stop)
+		negative_cache.purge()
+
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.addCleanup(asyncio.set_event_loop, None)
+		self.addCleanup(self.loop.close)
+		self.executor = ThreadPoolExecutor(max_workers=THREADS)
+		self.addCleanup(self.close_connections)
+		self.client = AsyncOmdbClient(api_url=self.stub.url, api_key='key', max_retries=0)
+		self.addCleanup(lambda: self.loop.run_until_complete(self.client.close()))
+		self.application = Application(get_wsgi_application(), executor=self.executor, client=self.client)
+		self.addCleanup(self.application.movies_view.worker_lock.close)
+
+	def close_connections(self):
+		# Every pool thread has its own database connection, close them all before the test database goes away.
+		barrier = threading.Barrier(THREADS)
+
+		def close():
+			barrier.wait()
+			connections.close_all()
+		for future in [self.executor.submit(close) for _ in range(THREADS)]:
+			future.result()
+		self.executor.shutdown()
+
+	async def request(
+		self, method, path, body=b'', query_string=b'', content_type=b'application/json', host=b'testserver'
+	):
+		scope = {
+			'type': 'http', 'http_version': '1.1', 'method': method, 'path': path, 'root_path': '',
+			'scheme': 'http', 'query_string': query_string, 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+			'headers': [(b'host', host), (b'content-type', content_type)],
+		}
+		messages = [{'type': 'http.request', 'body': body}]
+		sent = []
+
+		async def receive():
+			return messages.pop(0)
+
+		async def send(message):
+			sent.append(message)
+
+		await self.application(scope, receive, send)
+		body = b''.join(message.get('body', b'') for message in sent[1:])
+		headers = dict(sent[0]['headers'])
+		is_json = headers.get(b'content-type', b'').startswith(b'application/json')
+		return sent[0]['status'], headers, json.loads(body.decode()) if body and is_json else body
+
+	def post_movie(self, movie_title, query_string=b''):
+		body = json.dumps({'movie_title': movie_title}).encode()
+		return self.loop.run_until_complete(self.request('POST', '/movies/', body, query_string))
+
+	def test_post_movie(self):
+		status_code, headers, data = self.post_movie('alien')
+
+		movie = Movie.objects.get()
+		self.assertEqual(status_code, 201)
+		self.assertEqual(headers[b'content-type'], b'application/json')
+		self.assertEqual(data['movie_id'], movie.id)
+		self.assertEqual(data['title'], 'Alien')
+		self.assertEqual(data['additional_data']['Year'], '1979')
+		self.assertEqual(movie.imdb_rating, 8.5)
+
+		status_code, _, data = self.post_movie('ALIEN')
+		self.assertEqual(status_code, 200)
+		self.assertEqual(data['movie_id'], movie.id)
+		self.assertEqual(self.stub.requests, ['alien'])
+
+	def test_post_movie_fields(self):
+		status_code, _, data = self.post_movie('alien', query_string=b'fields=title,additional_data.Year')
+		self.assertEqual((status_code, data), (201, {'title': 'Alien', 'additional_data': {'Year': '1979'}}))
+
+	def test_post_form(self):
+		status_code, _, data = self.loop.run_until_complete(self.request(
+			'POST', '/movies/', b'movie_title=heat', content_type=b'application/x-www-form-urlencoded'
+		))
+		self.assertEqual((status_code, data['title']), (201, 'Heat'))
+
+	def test_post_invalid(self):
+		self.assertEqual(self.post_movie('')[::2], (400, {}))
+		status_code, _, data = self.loop.run_until_complete(self.request('POST', '/movies/', b'{'))
+		self.assertEqual(status_code, 400)
+		self.assertIn('JSON parse error', data['detail'])
+		self.assertEqual(self.post_movie('alien', query_string=b'fields=nope')[::2], (400, {}))
+
+	def test_movie_not_found(self):
+		self.assertEqual(self.post_movie('adsczx')[::2], (200, {'OMDB_Error': 'Movie not found!'}))
+		self.assertEqual(self.post_movie('adsczx')[::2], (200, {'OMDB_Error': 'Movie not found!'}))
+		self.assertEqual(len(self.stub.requests), 1)
+
+	def test_omdb_unavailable(self):
+		self.stub.failures = [503]
+		self.assertEqual(self.post_movie('alien')[::2], (503, {'OMDB_Error': 'OMDb is unavailable, try again later.'}))
+		self.assertFalse(Movie.objects.exists())
+
+	def test_concurrent_posts_share_one_fetch(self):
+		self.stub.delay = 0.1
+		results = self.loop.run_until_complete(asyncio.gather(*[
+			self.request('POST', '/movies/', json.dumps({'movie_title': 'alien'}).encode()) for _ in range(10)
+		]))
+		self.assertEqual(sorted(status_code for status_code, _, _ in results), [200] * 9 + [201])
+		self.assertEqual(len(self.stub.requests), 1)
+
+	def test_waits_for_fetch_of_other_worker(self):
+		body = json.dumps({'movie_title': 'alien'}).encode()
+		with postgres_advisory_lock('alien'):
+			request = self.loop.create_task(self.request('POST', '/movies/', body))
+			self.loop.run_until_complete(asyncio.sleep(0.3))
+			self.assertFalse(request.done())
+			movie = mommy.make(Movie, title='Alien', additional_data={})
+		status_code, _, data = self.loop.run_until_complete(request)
+
+		self.assertEqual((status_code, data['movie_id']), (200, movie.id))
+		self.assertEqual(self.stub.requests, [])
+
+	@override_settings(SINGLE_FLIGHT_LOCK_BACKEND='local')
+	def test_local_lock(self):
+		with postgres_advisory_lock('alien'):
+			self.assertEqual(self.post_movie('alien')[0], 201)
+
+	def test_disallowed_host(self):
+		body = json.dumps({'movie_title': 'alien'}).encode()
+		status_code, _, _ = self.loop.run_until_complete(self.request('POST', '/movies/', body, host=b'evil.example'))
+		self.assertEqual(status_code, 400)
+		self.assertEqual(self.stub.requests, [])
+
+	@override_settings(REQUEST_PROFILING=True)
+	def test_metrics(self):
+		requests = metrics.counters.get('http_requests_total', view='movies', method='POST', status=201)
+		self.post_movie('alien')
+		self.assertEqual(
+			metrics.counters.get('http_requests_total', view='movies', method='POST', status=201), requests + 1
+		)
+
+	def test_waiting_for_omdb_does_not_hold_threads(self):
+		self.stub.delay = 0.2
+		self.stub.movies.update({'movie {}'.format(index): {'Title': 'Movie'} for index in range(50)})
+		start = time.monotonic()
+		results = self.loop.run_until_complete(asyncio.gather(*[
+			self.request('POST', '/movies/', json.dumps({'movie_title': 'movie {}'.format(index)}).encode())
+			for index in range(50)
+		]))
+		# 50 sequential OMDb requests would take 10 s, the 4 threads could not wait for more than 4 at once.
+		self.assertLess(time.monotonic() - start, 2)
+		self.assertEqual([status_code for status_code, _, _ in results], [201] * 50)
+
+	def test_other_requests_go_to_django(self):
+		movie = mommy.make(Movie, title='Heat', additional_data={})
+		status_code, headers, data = self.loop.run_until_complete(self.request('GET', '/movies/'))
+		self.assertEqual(status_code, 200)
+		self.assertIn(b'etag', headers)
+		self.assertEqual([item['movie_id'] for item in data], [movie.id])
+
+		status_code, _, data = self.post_movie('alien', query_string=b'async=true')
+		self.assertEqual((status_code, data['status']), (202, 'pending'))
+		self.assertEqual(self.stub.requests, [])
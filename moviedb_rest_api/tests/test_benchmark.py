@@ -0,0 +1,101 @@
+import json
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase
+
+from mock import patch
+
+from moviedb_rest_api import benchmark
+from moviedb_rest_api.management.commands.benchmark import Command
+from moviedb_rest_api.models import Comment, Movie
+
+
+@contextmanager
+def current_database(command):
+	# Every run seeds the same data, roll it back instead of creating another test database.
+	with transaction.atomic():
+		yield
+		transaction.set_rollback(True)
+
+
+def scenario(**values):
+	measurements = {'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 30, 'queries_per_request': 2, 'errors': 0, 'max_rss_mb': 50}
+	measurements.update(values)
+	return measurements
+
+
+class TestCompare(SimpleTestCase):
+	def setUp(self):
+		self.baseline = {'settings': {}, 'scenarios': {'get_movies': scenario()}}
+
+	def test_within_threshold(self):
+		results = {'settings': {}, 'scenarios': {'get_movies': scenario(p50_ms=12.5, p99_ms=100), 'new': scenario()}}
+		self.assertEqual(benchmark.compare(results, self.baseline, 0.2), [])
+
+	def test_regressions(self):
+		results = {'settings': {}, 'scenarios': {'get_movies': scenario(
+			p95_ms=26, queries_per_request=3, errors=1, max_rss_mb=70
+		)}}
+		self.assertEqual(benchmark.compare(results, self.baseline, 0.2), [
+			'get_movies: 1 failed requests',
+			'get_movies: p95_ms 26 > 20',
+			'get_movies: max_rss_mb 70 > 50',
+			'get_movies: queries_per_request 3 > 2',
+		])
+
+	def test_percentile(self):
+		values = list(range(1, 101))
+		self.assertEqual(benchmark.percentile(values, 0.5), 50)
+		self.assertEqual(benchmark.percentile(values, 0.99), 99)
+		self.assertEqual(benchmark.percentile([7], 0.95), 7)
+
+
+class TestBenchmark(TestCase):
+	def test_seed(self):
+		movie_ids = benchmark.seed(50, 500, random.Random(0), batch_size=20)
+
+		self.assertEqual(Movie.objects.count(), 50)
+		self.assertEqual(Comment.objects.count(), 500)
+		self.assertEqual(Movie.objects.aggregate(Sum('comment_count'))['comment_count__sum'], 500)
+		counts = dict(Movie.objects.values_list('id', 'comment_count'))
+		self.assertGreater(counts[movie_ids[0]], counts[movie_ids[-1]] * 5)
+		self.assertIsNotNone(Movie.objects.get(id=movie_ids[0]).imdb_rating)
+
+	def test_run(self):
+		results = benchmark.Benchmark(movies=20, comments=100, requests=3).run()
+
+		self.assertEqual(results['settings'], {'movies': 20, 'comments': 100, 'requests': 3, 'seed': 0})
+		self.assertIn('post_movie_new', results['scenarios'])
+		self.assertIn('get_top_activity', results['scenarios'])
+		for name, measurements in results['scenarios'].items():
+			self.assertEqual(measurements['errors'], 0, name)
+			self.assertGreater(measurements['queries_per_request'], 0, name)
+		self.assertEqual(Movie.objects.filter(title__startswith='Fresh Benchmark Movie').count(), 8)
+
+	@patch.object(Command, 'test_database', current_database)
+	def test_command(self):
+		path = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+		arguments = ['benchmark', '--movies', '10', '--comments', '50', '--requests', '2']
+		out = StringIO()
+		call_command(*arguments + ['--save', path], stdout=out)
+
+		self.assertIn('get_movies', out.getvalue())
+		with open(path) as baseline_file:
+			baseline = json.load(baseline_file)
+		self.assertEqual(baseline['settings']['movies'], 10)
+
+		baseline['scenarios']['get_movies']['queries_per_request'] -= 1
+		with open(path, 'w') as baseline_file:
+			json.dump(baseline, baseline_file)
+		with self.assertRaisesRegex(CommandError, 'get_movies: queries_per_request'):
+			call_command(*arguments + ['--baseline', path], stdout=StringIO())
+		with self.assertRaisesRegex(CommandError, 'different settings'):
+			call_command('benchmark', '--movies', '20', '--baseline', path, stdout=StringIO())
@@ -0,0 +1,199 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.test import TestCase, Client, override_settings
+
+from freezegun import freeze_time
+from model_mommy import mommy
+from mock import patch, Mock
+
+from moviedb_rest_api import cache, metrics
+from moviedb_rest_api.models import Movie, Comment
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=60)
+class TestResponseCache(TestCase):
+	def setUp(self):
+		self.client = Client()
+		caches['responses'].clear()
+		# Like a shared backend, the conditional GETs are validated with the versions.
+		shared_patcher = patch('moviedb_rest_api.cache.shared_versions', return_value=True)
+		shared_patcher.start()
+		self.addCleanup(shared_patcher.stop)
+
+	def test_movies_cached(self):
+		mommy.make(Movie, _quantity=2)
+		hits = metrics.counters.get('response_cache_hits_total', view='movies')
+		first_response = self.client.get(reverse('movies'))
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse('movies'))
+
+		self.assertEqual(response.json(), first_response.json())
+		self.assertEqual(metrics.counters.get('response_cache_hits_total', view='movies'), hits + 1)
+
+	def test_query_params_normalized(self):
+		mommy.make(Movie, _quantity=3)
+		first_response = self.client.get('{}?page_size=2&after='.format(reverse('movies')))
+		with self.assertNumQueries(0):
+			response = self.client.get('{}?after=&page_size=2'.format(reverse('movies')))
+		self.assertEqual(response.json(), first_response.json())
+		self.assertEqual(response['Link'], first_response['Link'])
+
+		with self.assertNumQueries(1):
+			self.client.get('{}?page_size=3'.format(reverse('movies')))
+
+	def test_streaming_not_cached(self):
+		mommy.make(Movie)
+		self.client.get(reverse('movies'), data={'stream': 'ndjson'})
+		with self.assertNumQueries(1):
+			response = self.client.get(reverse('movies'), data={'stream': 'ndjson'})
+			self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+	def test_errors_not_cached(self):
+		self.client.get(reverse('movies'), data={'after': 'not a cursor'})
+		hits = metrics.counters.get('response_cache_hits_total', view='movies')
+		self.client.get(reverse('movies'), data={'after': 'not a cursor'})
+		self.assertEqual(metrics.counters.get('response_cache_hits_total', view='movies'), hits)
+
+	@patch('moviedb_rest_api.omdb.requests.Session.get')
+	def test_movie_post_invalidates_movies_and_top(self, omdb_get_patch):
+		omdb_get_patch.return_value = Mock(status_code=200, json=Mock(return_value={'Title': 'Terminator'}))
+		top_url = '{}?date_from=0&date_to=4102444800'.format(reverse('top'))
+		self.assertEqual(self.client.get(reverse('movies')).json(), [])
+		self.assertEqual(self.client.get(top_url).json(), [])
+
+		self.client.post(reverse('movies'), data={'movie_title': 'terminator'})
+		self.assertEqual(len(self.client.get(reverse('movies')).json()), 1)
+		self.assertEqual(len(self.client.get(top_url).json()), 1)
+
+	@freeze_time("2018-10-05")
+	def test_comment_post_invalidates_only_its_movie(self):
+		movie_1, movie_2 = mommy.make(Movie, _quantity=2)
+		movie_1_url = '{}?movie_id={}'.format(reverse('comments'), movie_1.id)
+		movie_2_url = '{}?movie_id={}'.format(reverse('comments'), movie_2.id)
+		top_url = '{}?date_from=1538611200.0&date_to=1538784000.0'.format(reverse('top'))
+		for url in (movie_1_url, movie_2_url, reverse('comments'), top_url):
+			self.client.get(url)
+
+		self.client.post(reverse('comments'), data={'movie_id': movie_1.id, 'comment_body': 'comment'})
+
+		with self.assertNumQueries(0):
+			self.assertEqual(self.client.get(movie_2_url).json(), [])
+		with self.assertNumQueries(1):
+			self.assertEqual(len(self.client.get(movie_1_url).json()), 1)
+		with self.assertNumQueries(1):
+			self.assertEqual(len(self.client.get(reverse('comments')).json()), 1)
+		with self.assertNumQueries(1):
+			self.assertEqual(self.client.get(top_url).json()[0]['total_comments'], 1)
+
+	def test_comment_post_invalidates_padded_movie_id(self):
+		movie = mommy.make(Movie)
+		url = '{}?movie_id=0{}'.format(reverse('comments'), movie.id)
+		self.assertEqual(self.client.get(url).json(), [])
+
+		self.client.post(reverse('comments'), data={'movie_id': movie.id, 'comment_body': 'comment'})
+		self.assertEqual(len(self.client.get(url).json()), 1)
+
+	@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+	def test_disabled(self):
+		self.client.get(reverse('comments'))
+		with self.assertNumQueries(1):
+			self.client.get(reverse('comments'))
+
+
+class TestConditionalGet(TestCase):
+	def setUp(self):
+		self.client = Client()
+		shared_patcher = patch('moviedb_rest_api.cache.shared_versions', return_value=True)
+		shared_patcher.start()
+		self.addCleanup(shared_patcher.stop)
+
+	def test_movies_etag(self):
+		mommy.make(Movie, _quantity=2)
+		response = self.client.get(reverse('movies'))
+		self.assertFalse(response.has_header('Last-Modified'))
+
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse('movies'), HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response.content, b'')
+		self.assertTrue(response.has_header('ETag'))
+
+	def test_etag_changes_with_collection(self):
+		mommy.make(Movie)
+		etag = self.client.get(reverse('movies'))['ETag']
+		mommy.make(Movie)
+		cache.movie_created()
+		response = self.client.get(reverse('movies'), HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.json()), 2)
+		self.assertNotEqual(response['ETag'], etag)
+
+	def test_etag_depends_on_query_params(self):
+		mommy.make(Movie, _quantity=3)
+		etag = self.client.get(reverse('movies'))['ETag']
+		response = self.client.get(reverse('movies'), data={'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+
+	def test_comments_etag(self):
+		movie_1, movie_2 = mommy.make(Movie, _quantity=2)
+		url = '{}?movie_id={}'.format(reverse('comments'), movie_1.id)
+		etag = self.client.get(url)['ETag']
+		self.client.post(reverse('comments'), data={'movie_id': movie_2.id, 'comment_body': 'comment'})
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+		self.client.post(reverse('comments'), data={'movie_id': movie_1.id, 'comment_body': 'comment'})
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+	def test_comment_edit_changes_etag(self):
+		comment = mommy.make(Comment)
+		for url in (reverse('comments'), '{}?movie_id={}'.format(reverse('comments'), comment.movie_id)):
+			with self.subTest(url=url):
+				etag = self.client.get(url)['ETag']
+				comment.body = 'edited'
+				comment.save()
+				self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+	@freeze_time("2018-10-05")
+	def test_top_etag(self):
+		movie = mommy.make(Movie)
+		for ranking in ('created', 'activity'):
+			url = '{}?date_from=1538611200.0&date_to=1538784000.0&ranking={}'.format(reverse('top'), ranking)
+			response = self.client.get(url)
+			self.assertFalse(response.has_header('Last-Modified'))
+			self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+			self.client.post(reverse('comments'), data={'movie_id': movie.id, 'comment_body': 'comment'})
+			self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+	def test_invalid_requests_not_validated(self):
+		response = self.client.get('{}?movie_id=abc'.format(reverse('comments')))
+		self.assertEqual(response.status_code, 400)
+		self.assertFalse(response.has_header('ETag'))
+
+
+class TestConditionalGetLocalCache(TestCase):
+	"""The versions of a per-process cache miss the other workers' writes, the validators come from the rows."""
+	def setUp(self):
+		self.client = Client()
+
+	def test_local_backends_not_shared(self):
+		self.assertFalse(cache.shared_versions())
+		memcached = {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache'}
+		with self.settings(CACHES=dict(settings.CACHES, responses=memcached)):
+			self.assertTrue(cache.shared_versions())
+
+	def test_movies_etag(self):
+		with freeze_time("2018-10-05"):
+			mommy.make(Movie, _quantity=2)
+		response = self.client.get(reverse('movies'))
+		self.assertEqual(response['Last-Modified'], 'Fri, 05 Oct 2018 00:00:00 GMT')
+
+		with self.assertNumQueries(1):
+			response = self.client.get(reverse('movies'), HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(response.status_code, 304)
+
+	def test_etag_changes_with_rows_written_elsewhere(self):
+		mommy.make(Movie)
+		etag = self.client.get(reverse('movies'))['ETag']
+		# No version is bumped, as by a write handled by another worker.
+		mommy.make(Movie)
+		self.assertEqual(self.client.get(reverse('movies'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+
+from mock import Mock, patch
+
+from moviedb_rest_api.db import close_unusable_connections
+
+
+class TestCloseUnusableConnections(SimpleTestCase):
+	def connection(self, connected=True, usable=True, conn_max_age=60):
+		return Mock(
+			connection=Mock() if connected else None, settings_dict={'CONN_MAX_AGE': conn_max_age},
+			is_usable=Mock(return_value=usable)
+		)
+
+	def test_closes_only_broken_persistent_connections(self):
+		broken = self.connection(usable=False)
+		healthy = self.connection()
+		closed = self.connection(connected=False)
+		per_request = self.connection(usable=False, conn_max_age=0)
+		with patch('moviedb_rest_api.db.connections') as connections:
+			connections.all.return_value = [broken, healthy, closed, per_request]
+			close_unusable_connections()
+
+		broken.close.assert_called_once_with()
+		healthy.close.assert_not_called()
+		closed.is_usable.assert_not_called()
+		per_request.is_usable.assert_not_called()
@@ -0,0 +1,167 @@
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+
+from freezegun import freeze_time
+from model_mommy import mommy
+from mock import patch
+
+from moviedb_rest_api import enrichment
+from moviedb_rest_api.models import Comment, Movie
+from moviedb_rest_api.negative_cache import negative_cache
+from moviedb_rest_api.omdb import OmdbClient
+from moviedb_rest_api.omdb_stub import OmdbStub
+
+
+class OmdbStubMixin(object):
+	def start_omdb_stub(self):
+		self.omdb_data = {'Title': 'Alien', 'Year': '1979', 'Genre': 'Horror, Sci-Fi', 'Plot': 'In space...'}
+		self.stub = OmdbStub(movies={'alien': self.omdb_data}).start()
+		self.addCleanup(self.stub.stop)
+		client = OmdbClient(api_url=self.stub.url, api_key='key', max_retries=0)
+		client_patcher = patch('moviedb_rest_api.omdb.get_client', return_value=client)
+		client_patcher.start()
+		self.addCleanup(client_patcher.stop)
+		negative_cache.purge()
+
+
+@override_settings(MOVIE_ENRICHMENT_BACKEND='worker', MOVIE_ENRICHMENT_MAX_ATTEMPTS=2)
+class TestAsyncMoviePost(OmdbStubMixin, TestCase):
+	def setUp(self):
+		self.client = Client()
+		self.start_omdb_stub()
+
+	def post_async(self, movie_title):
+		return self.client.post('{}?async=true'.format(reverse('movies')), data={'movie_title': movie_title})
+
+	def test_post_async(self):
+		with self.assertNumQueries(3):
+			response = self.post_async('alien')
+
+		movie = Movie.objects.get()
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(response.json()['movie_id'], movie.id)
+		self.assertEqual(response.json()['status'], 'pending')
+		self.assertEqual(response.json()['additional_data'], {})
+		self.assertEqual(self.stub.requests, [])
+
+		response = self.post_async('ALIEN')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['movie_id'], movie.id)
+
+	def test_enrich_pending(self):
+		movie_id = self.post_async('alien').json()['movie_id']
+		self.assertEqual(enrichment.enrich_pending(), 1)
+
+		movie = Movie.objects.get(id=movie_id)
+		self.assertEqual(movie.status, Movie.READY)
+		self.assertEqual(movie.additional_data, self.omdb_data)
+		self.assertEqual((movie.year, movie.genres), (1979, ['horror', 'sci-fi']))
+		self.assertEqual(Movie.objects.search('space', ['text']).get().id, movie_id)
+		self.assertEqual(enrichment.enrich_pending(), 0)
+		self.assertEqual(len(self.stub.requests), 1)
+
+	def test_enrich_not_found(self):
+		movie_id = self.post_async('adsczx').json()['movie_id']
+		mommy.make(Comment, movie_id=movie_id)
+		self.assertEqual(enrichment.enrich_pending(), 1)
+		self.assertEqual(Movie.objects.get(id=movie_id).status, Movie.FAILED)
+		self.assertEqual(Comment.objects.get().movie_id, movie_id)
+
+		response = self.post_async('adsczx')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json(), {'OMDB_Error': 'Movie not found!'})
+		self.assertEqual(len(self.stub.requests), 1)
+
+	def test_enrich_retries_and_fails(self):
+		movie_id = self.post_async('alien').json()['movie_id']
+		self.stub.failures = [500, 500]
+		self.assertEqual(enrichment.enrich_pending(), 0)
+		self.assertEqual(Movie.objects.get(id=movie_id).status, Movie.PENDING)
+		self.assertEqual(enrichment.enrich_pending(), 1)
+		self.assertEqual(Movie.objects.get(id=movie_id).status, Movie.FAILED)
+
+		response = self.post_async('alien')
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(response.json()['status'], 'pending')
+		self.assertEqual(enrichment.enrich_pending(), 1)
+		self.assertEqual(Movie.objects.get(id=movie_id).status, Movie.READY)
+
+	def test_enrich_keeps_comment_count(self):
+		movie_id = self.post_async('alien').json()['movie_id']
+		movie, = enrichment.claim(Movie.objects.filter(id=movie_id), 1)
+		Movie.objects.filter(id=movie_id).update(comment_count=3)
+		enrichment.enrich(movie)
+		self.assertEqual(Movie.objects.get(id=movie_id).comment_count, 3)
+
+	def test_claimed_movies_are_leased(self):
+		with freeze_time('2018-10-05 12:00:00'):
+			movie_id = self.post_async('alien').json()['movie_id']
+			stale, = enrichment.claim(Movie.objects.all(), 10)
+			self.assertEqual(enrichment.claim(Movie.objects.all(), 10), [])
+		with freeze_time('2018-10-05 12:05:00'):
+			movie, = enrichment.claim(Movie.objects.all(), 10)
+
+		self.assertFalse(enrichment.enrich(stale))
+		self.assertEqual(Movie.objects.get(id=movie_id).status, Movie.PENDING)
+		self.assertTrue(enrichment.enrich(movie))
+		self.assertEqual(Movie.objects.get(id=movie_id).status, Movie.READY)
+		self.assertIsNone(Movie.objects.get(id=movie_id).claimed_until)
+
+	def test_enrich_movies_command(self):
+		self.post_async('alien')
+		self.post_async('adsczx')
+		out = StringIO()
+		call_command('enrich_movies', once=True, stdout=out)
+		self.assertIn('Enriched 2 pending movie(s).', out.getvalue())
+		self.assertEqual(list(Movie.objects.order_by('id').values_list('status', flat=True)), [Movie.READY, Movie.FAILED])
+
+
+class TestMovieDetailView(TestCase):
+	def setUp(self):
+		self.client = Client()
+
+	def test_get_movie(self):
+		movie = mommy.make(Movie, title='Alien', additional_data={'Year': '1979'})
+		with self.assertNumQueries(2):
+			response = self.client.get(reverse('movie', kwargs={'movie_id': movie.id}), data={'fields': 'title,status'})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json(), {'title': 'Alien', 'status': 'ready'})
+
+	def test_get_movie_not_found(self):
+		response = self.client.get(reverse('movie', kwargs={'movie_id': 1}))
+		self.assertEqual(response.status_code, 404)
+
+	def test_poll_with_etag(self):
+		with freeze_time('2018-10-05'):
+			movie = mommy.make(Movie, title='Alien', additional_data={}, status=Movie.PENDING)
+		url = reverse('movie', kwargs={'movie_id': movie.id})
+		etag = self.client.get(url)['ETag']
+		with self.assertNumQueries(1):
+			self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+		with freeze_time('2018-10-06'):
+			movie.status = Movie.READY
+			movie.save()
+		response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Last-Modified'], 'Sat, 06 Oct 2018 00:00:00 GMT')
+
+
+@override_settings(MOVIE_ENRICHMENT_BACKEND='thread')
+class TestThreadEnrichment(OmdbStubMixin, TransactionTestCase):
+	def setUp(self):
+		self.start_omdb_stub()
+
+	def test_post_async_enriched_in_background(self):
+		response = Client().post('{}?async=1'.format(reverse('movies')), data={'movie_title': 'alien'})
+		self.assertEqual(response.status_code, 202)
+
+		deadline = time.time() + 5
+		while Movie.objects.get().status == Movie.PENDING and time.time() < deadline:
+			time.sleep(0.05)
+		self.assertEqual(Movie.objects.get().status, Movie.READY)
+		self.assertEqual(Movie.objects.get().additional_data, self.omdb_data)
@@ -0,0 +1,103 @@
+import datetime
+import json
+import pickle
+import uuid
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase, Client
+from django.test.utils import override_settings
+from django.utils.timezone import utc
+
+from model_mommy import mommy
+from mock import patch
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from moviedb_rest_api import fastjson
+from moviedb_rest_api.fastjson import FastJSONParser, FastJSONRenderer, RawJSON
+from moviedb_rest_api.models import Movie
+from moviedb_rest_api.serializers import MovieValuesSerializer
+
+
+class TestFastJSONRenderer(SimpleTestCase):
+	data = {
+		'title': 'Amélie  ',
+		'created_at': datetime.datetime(2018, 10, 5, 12, 30, 15, 123456, tzinfo=utc),
+		'day': datetime.date(2018, 10, 5),
+		'rating': Decimal('7.5'),
+		'id': uuid.UUID('12345678123456781234567812345678'),
+		'scores': (1, 2.5, None, True),
+		1: 'integer key',
+	}
+
+	def test_same_output_as_json_renderer(self):
+		for backend in ('orjson', 'stdlib'):
+			for media_type in (None, 'application/json; indent=2', 'application/json; indent=4'):
+				with self.subTest(backend=backend, media_type=media_type), override_settings(JSON_BACKEND=backend):
+					self.assertEqual(
+						FastJSONRenderer().render(self.data, media_type), JSONRenderer().render(self.data, media_type)
+					)
+
+	def test_raw_json_written_as_is(self):
+		data = [{'additional_data': RawJSON('{"Year": "1979"}')}, {'additional_data': RawJSON('[]'), 'x': 'y'}]
+		for backend in ('orjson', 'stdlib'):
+			with self.subTest(backend=backend), override_settings(JSON_BACKEND=backend):
+				self.assertEqual(
+					FastJSONRenderer().render(data), b'[{"additional_data":{"Year": "1979"}},{"additional_data":[],"x":"y"}]'
+				)
+
+	def test_placeholder_lookalikes_left_alone(self):
+		data = {'raw': RawJSON('1'), 'text': 'rawjson-0123456789abcdef0123456789abcdef-0'}
+		self.assertEqual(json.loads(FastJSONRenderer().render(data).decode()), {'raw': 1, 'text': data['text']})
+
+	def test_raw_json_pickles(self):
+		self.assertEqual(pickle.loads(pickle.dumps(RawJSON('{}'))), RawJSON('{}'))
+
+	@override_settings(JSON_BACKEND='orjson')
+	def test_orjson_not_installed(self):
+		with patch('moviedb_rest_api.fastjson.orjson', None):
+			self.assertEqual(fastjson.get_backend(), fastjson.JSON_BACKENDS['stdlib'])
+
+
+class TestFastJSONParser(SimpleTestCase):
+	def test_parse(self):
+		for backend in ('orjson', 'stdlib'):
+			with self.subTest(backend=backend), override_settings(JSON_BACKEND=backend):
+				self.assertEqual(
+					FastJSONParser().parse(BytesIO('{"movie_title": "Amélie"}'.encode())), {'movie_title': 'Amélie'}
+				)
+				with self.assertRaises(ParseError):
+					FastJSONParser().parse(BytesIO(b'{"movie_title": '))
+				with self.assertRaises(ParseError):
+					FastJSONParser().parse(BytesIO(b'{"rating": NaN}'))
+
+	def test_parse_other_encoding(self):
+		body = BytesIO('{"movie_title": "Amélie"}'.encode('latin1'))
+		self.assertEqual(FastJSONParser().parse(body, parser_context={'encoding': 'latin1'}), {'movie_title': 'Amélie'})
+
+
+class TestRawJSONPassthrough(TestCase):
+	def setUp(self):
+		self.movie = mommy.make(Movie, title='Alien', additional_data={'Year': '1979', 'Genre': 'Sci-Fi'})
+
+	def test_values_fetch_json_as_text(self):
+		data = MovieValuesSerializer(MovieValuesSerializer.values(Movie.objects.all()).get()).data
+		self.assertIsInstance(data['additional_data'], RawJSON)
+		self.assertEqual(json.loads(data['additional_data'].text), {'Year': '1979', 'Genre': 'Sci-Fi'})
+
+	def test_responses(self):
+		client = Client()
+		for url, params in (
+			(reverse('movies'), {}),
+			(reverse('movies'), {'stream': 'ndjson'}),
+			(reverse('movie', args=[self.movie.id]), {}),
+			(reverse('movies'), {'fields': 'title,additional_data.Year'}),
+		):
+			with self.subTest(url=url, params=params):
+				response = client.get(url, params)
+				content = b''.join(response.streaming_content) if response.streaming else response.content
+				data = json.loads(content.decode())
+				movie = data[0] if isinstance(data, list) else data
+				self.assertEqual(movie['additional_data']['Year'], '1979')
@@ -0,0 +1,240 @@
+import json
+import datetime
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase, Client
+from django.utils.timezone import utc
+
+from freezegun import freeze_time
+from model_mommy import mommy
+from mock import patch
+
+from moviedb_rest_api.importer import TIME_LIMIT_ERROR, CommentImporter, MovieImporter, RateLimiter
+from moviedb_rest_api.models import Comment, CommentActivity, Movie
+from moviedb_rest_api.negative_cache import negative_cache
+from moviedb_rest_api.omdb import OmdbClient
+from moviedb_rest_api.omdb_stub import OmdbStub
+
+
+class TestRateLimiter(SimpleTestCase):
+	def setUp(self):
+		self.now = 0
+		self.sleeps = []
+
+	def sleep(self, seconds):
+		self.sleeps.append(seconds)
+
+	def test_spaces_calls(self):
+		rate_limiter = RateLimiter(rate=4, clock=lambda: self.now, sleep=self.sleep)
+		for _ in range(3):
+			rate_limiter.wait()
+		self.assertEqual(self.sleeps, [0.25, 0.5])
+
+		self.now = 10
+		rate_limiter.wait()
+		self.assertEqual(len(self.sleeps), 2)
+
+	def test_disabled(self):
+		rate_limiter = RateLimiter(rate=0, clock=lambda: self.now, sleep=self.sleep)
+		for _ in range(3):
+			rate_limiter.wait()
+		self.assertEqual(self.sleeps, [])
+
+
+class TestMovieImporter(TestCase):
+	def setUp(self):
+		self.stub = OmdbStub(movies={
+			'alien': {'Title': 'Alien', 'Year': '1979'},
+			'heat': {'Title': 'Heat', 'Year': '1995'},
+			'terminator': {'Title': 'Terminator', 'Year': '1984'},
+		}).start()
+		self.addCleanup(self.stub.stop)
+		self.client = OmdbClient(api_url=self.stub.url, api_key='key', max_retries=0)
+		client_patcher = patch('moviedb_rest_api.omdb.get_client', return_value=self.client)
+		client_patcher.start()
+		self.addCleanup(client_patcher.stop)
+		negative_cache.purge()
+
+	def test_run(self):
+		terminator = mommy.make(Movie, title='Terminator', additional_data={})
+		results = MovieImporter(rate=0).run(['TERMINATOR', 'Alien', ' alien', '', 'adsczx', 'heat'])
+
+		movies = dict(Movie.objects.values_list('normalized_title', 'id'))
+		self.assertEqual(results, [
+			{'title': 'TERMINATOR', 'status': 'existing', 'movie_id': terminator.id},
+			{'title': 'Alien', 'status': 'created', 'movie_id': movies['alien']},
+			{'title': ' alien', 'status': 'duplicate'},
+			{'title': '', 'status': 'invalid'},
+			{'title': 'adsczx', 'status': 'not_found', 'error': 'Movie not found!'},
+			{'title': 'heat', 'status': 'created', 'movie_id': movies['heat']},
+		])
+		self.assertEqual(sorted(self.stub.requests), ['Alien', 'adsczx', 'heat'])
+		self.assertEqual(Movie.objects.get(normalized_title='heat').title, 'Heat')
+		self.assertEqual(Movie.objects.get(normalized_title='heat').additional_data, {'Title': 'Heat', 'Year': '1995'})
+
+	def test_not_found_titles_are_remembered(self):
+		MovieImporter(rate=0).run(['adsczx'])
+		results = MovieImporter(rate=0).run(['ADSCZX'])
+		self.assertEqual(results[0]['status'], 'not_found')
+		self.assertEqual(len(self.stub.requests), 1)
+
+	def test_omdb_failures(self):
+		self.stub.failures = [500]
+		results = MovieImporter(workers=1, rate=0).run(['alien', 'heat'])
+		self.assertEqual([result['status'] for result in results], ['failed', 'created'])
+		self.assertIn('error', results[0])
+
+	def test_inserts_in_batches(self):
+		with self.assertNumQueries(7):
+			results = MovieImporter(rate=0, batch_size=2).run(['alien', 'heat', 'terminator'])
+		self.assertEqual([result['status'] for result in results], ['created'] * 3)
+		self.assertEqual(Movie.objects.count(), 3)
+
+	def test_time_limit(self):
+		clock = iter([0, 5, 20])
+		results = MovieImporter(workers=1, rate=0, time_limit=10, clock=lambda: next(clock)).run(['alien', 'heat'])
+		self.assertEqual([result['status'] for result in results], ['created', 'failed'])
+		self.assertEqual(results[1]['error'], TIME_LIMIT_ERROR)
+		self.assertEqual(self.stub.requests, ['alien'])
+
+	def test_fetches_get_the_remaining_time(self):
+		clock = iter([0, 4])
+		with patch.object(self.client, 'get_movie', wraps=self.client.get_movie) as get_movie:
+			MovieImporter(workers=1, rate=0, time_limit=10, clock=lambda: next(clock)).run(['alien'])
+		get_movie.assert_called_once_with('alien', time_limit=6)
+
+	def test_save_falls_back_on_conflict(self):
+		heat = mommy.make(Movie, title='Heat', additional_data={})
+		fetched = [({'title': 'alien'}, {'Title': 'Alien'}), ({'title': 'HEAT'}, {'Title': 'Heat'})]
+		MovieImporter(rate=0).save(fetched)
+
+		self.assertEqual(fetched[0][0]['status'], 'created')
+		self.assertEqual(fetched[1][0], {'title': 'HEAT', 'status': 'existing', 'movie_id': heat.id})
+		self.assertEqual(Movie.objects.count(), 2)
+
+	def test_post_movie_titles(self):
+		response = Client().post(
+			reverse('movies-import'), data=json.dumps({'movie_titles': ['alien', 'heat']}), content_type='application/json'
+		)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([result['status'] for result in response.json()], ['created', 'created'])
+		self.assertEqual(Movie.objects.count(), 2)
+
+	def test_post_invalid_movie_titles(self):
+		for data in ({}, {'movie_titles': 'alien'}, {'movie_titles': []}):
+			response = Client().post(reverse('movies-import'), data=json.dumps(data), content_type='application/json')
+			self.assertEqual(response.status_code, 400)
+
+		with self.settings(MOVIE_IMPORT_MAX_TITLES=1):
+			response = Client().post(
+				reverse('movies-import'), data=json.dumps({'movie_titles': ['alien', 'heat']}), content_type='application/json'
+			)
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(self.stub.requests, [])
+
+	def test_import_movies_command(self):
+		with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as titles_file:
+			titles_file.write('Alien\n\nheat\nadsczx\n')
+		self.addCleanup(os.remove, titles_file.name)
+
+		out = StringIO()
+		call_command('import_movies', titles_file.name, rate=0, stdout=out)
+		self.assertIn('created\tAlien', out.getvalue())
+		self.assertIn('Imported 3 title(s): 2 created, 1 not_found.', out.getvalue())
+		self.assertEqual(Movie.objects.count(), 2)
+
+
+@freeze_time("2018-10-05 12:30")
+class TestCommentImporter(TestCase):
+	def setUp(self):
+		self.movie_1, self.movie_2 = mommy.make(Movie, _quantity=2)
+
+	def test_run(self):
+		results = CommentImporter().run([
+			{'movie_id': self.movie_1.id, 'comment_body': 'first'},
+			{'movie_id': str(self.movie_2.id), 'comment_body': 'second', 'created_at': '2010-01-01T10:15:00'},
+			{'movie_id': self.movie_1.id, 'comment_body': 'third'},
+			{'movie_id': self.movie_2.id + 1000, 'comment_body': 'no movie'},
+			{'movie_id': self.movie_1.id},
+			{'movie_id': 'abc', 'comment_body': 'bad id'},
+			{'movie_id': self.movie_1.id, 'comment_body': 'bad date', 'created_at': 'yesterday'},
+			'comment',
+		])
+
+		comments = dict(Comment.objects.values_list('body', 'id'))
+		self.assertEqual(results[:3], [
+			{'movie_id': self.movie_1.id, 'status': 'created', 'comment_id': comments['first']},
+			{'movie_id': self.movie_2.id, 'status': 'created', 'comment_id': comments['second']},
+			{'movie_id': self.movie_1.id, 'status': 'created', 'comment_id': comments['third']},
+		])
+		self.assertEqual(results[3]['error'], 'Movie does not exist.')
+		self.assertEqual([result['status'] for result in results[4:]], ['invalid'] * 4)
+		self.assertEqual(len(comments), 3)
+
+		self.assertEqual(
+			Comment.objects.get(body='second').created_at, datetime.datetime(2010, 1, 1, 10, 15, tzinfo=utc)
+		)
+		self.assertEqual(
+			Comment.objects.get(body='first').created_at, datetime.datetime(2018, 10, 5, 12, 30, tzinfo=utc)
+		)
+		self.assertEqual(Movie.objects.get(id=self.movie_1.id).comment_count, 2)
+		self.assertEqual(Movie.objects.get(id=self.movie_2.id).comment_count, 1)
+		self.assertEqual(sorted(CommentActivity.objects.values_list('movie_id', 'bucket', 'comment_count')), [
+			(self.movie_1.id, datetime.datetime(2018, 10, 5, 12, tzinfo=utc), 2),
+			(self.movie_2.id, datetime.datetime(2010, 1, 1, 10, tzinfo=utc), 1),
+		])
+
+	def test_created_at_with_offset_is_bucketed_in_utc(self):
+		CommentImporter().run([
+			{'movie_id': self.movie_1.id, 'comment_body': 'first', 'created_at': '2010-01-01T00:45:00+05:30'},
+			{'movie_id': self.movie_1.id, 'comment_body': 'second', 'created_at': '2009-12-31T19:05:00Z'},
+		])
+		self.assertEqual(
+			Comment.objects.get(body='first').created_at, datetime.datetime(2009, 12, 31, 19, 15, tzinfo=utc)
+		)
+		self.assertEqual(list(CommentActivity.objects.values_list('bucket', 'comment_count')), [
+			(datetime.datetime(2009, 12, 31, 19, tzinfo=utc), 2),
+		])
+
+		Comment.objects.get(body='first').delete()
+		self.assertEqual(CommentActivity.objects.get().comment_count, 1)
+
+	def test_counters_updated_once_per_batch(self):
+		items = [{'movie_id': movie.id, 'comment_body': 'body'} for movie in (self.movie_1, self.movie_2, self.movie_1)]
+		with self.assertNumQueries(11):
+			results = CommentImporter(batch_size=2).run(items)
+		self.assertEqual([result['status'] for result in results], ['created'] * 3)
+		self.assertEqual(Movie.objects.get(id=self.movie_1.id).comment_count, 2)
+		self.assertEqual(CommentActivity.objects.get(movie=self.movie_1).comment_count, 2)
+
+	def test_post_json(self):
+		response = Client().post(reverse('comments-import'), content_type='application/json', data=json.dumps([
+			{'movie_id': self.movie_1.id, 'comment_body': 'first'},
+			{'movie_id': self.movie_1.id},
+		]))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([result['status'] for result in response.json()], ['created', 'invalid'])
+		self.assertEqual(Comment.objects.get().body, 'first')
+
+	def test_post_ndjson(self):
+		lines = [json.dumps({'movie_id': movie.id, 'comment_body': 'body'}) for movie in (self.movie_1, self.movie_2)]
+		response = Client().post(
+			reverse('comments-import'), data='\n'.join(lines) + '\n\n', content_type='application/x-ndjson'
+		)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([result['status'] for result in response.json()], ['created', 'created'])
+		self.assertEqual(Comment.objects.count(), 2)
+
+	def test_post_invalid_body(self):
+		for data, content_type in (
+			('{"movie_id": 1', 'application/x-ndjson'),
+			('{"movie_id": 1, "comment_body": "body"}', 'application/json'),
+			('[]', 'application/json'),
+		):
+			response = Client().post(reverse('comments-import'), data=data, content_type=content_type)
+			self.assertEqual(response.status_code, 400)
+		self.assertFalse(Comment.objects.exists())
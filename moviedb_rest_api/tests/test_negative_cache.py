@@ -0,0 +1,116 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+
+from mock import patch
+
+from moviedb_rest_api import metrics
+from moviedb_rest_api.negative_cache import LRUCache, NegativeCache
+
+
+class TestLRUCache(SimpleTestCase):
+	def setUp(self):
+		self.now = 0
+		self.lru = LRUCache(max_size=2, ttl=10, clock=lambda: self.now)
+
+	def test_get_set(self):
+		self.lru.set('a', 1)
+		self.assertEqual(self.lru.get('a'), 1)
+		self.assertIsNone(self.lru.get('b'))
+
+	def test_expires(self):
+		self.lru.set('a', 1)
+		self.now = 10
+		self.assertIsNone(self.lru.get('a'))
+		self.assertEqual(len(self.lru), 0)
+
+	def test_evicts_least_recently_used(self):
+		self.lru.set('a', 1)
+		self.lru.set('b', 2)
+		self.lru.get('a')
+		self.lru.set('c', 3)
+		self.assertEqual(self.lru.get('a'), 1)
+		self.assertIsNone(self.lru.get('b'))
+		self.assertEqual(self.lru.get('c'), 3)
+
+
+@override_settings(NEGATIVE_CACHE_BACKEND='default')
+class TestNegativeCache(SimpleTestCase):
+	def setUp(self):
+		cache.clear()
+		self.negative_cache = NegativeCache()
+
+	def test_normalizes_titles(self):
+		self.negative_cache.add('Adsczx', 'Movie not found!')
+		self.assertEqual(self.negative_cache.get(' ADSCZX'), 'Movie not found!')
+
+	def test_shared_tier(self):
+		self.negative_cache.add('adsczx', 'Movie not found!')
+		self.assertEqual(NegativeCache().get('adsczx'), 'Movie not found!')
+
+	def test_purge_titles(self):
+		self.negative_cache.add('adsczx', 'Movie not found!')
+		self.negative_cache.add('qwerty', 'Movie not found!')
+		self.negative_cache.purge(['ADSCZX'])
+		self.assertIsNone(self.negative_cache.get('adsczx'))
+		self.assertEqual(self.negative_cache.get('qwerty'), 'Movie not found!')
+
+	def test_purge_all(self):
+		self.negative_cache.add('adsczx', 'Movie not found!')
+		self.negative_cache.purge()
+		self.assertIsNone(self.negative_cache.get('adsczx'))
+		self.assertIsNone(NegativeCache().get('adsczx'))
+
+	@override_settings(NEGATIVE_CACHE_CHECK_INTERVAL=5)
+	def test_purge_reaches_other_processes(self):
+		self.now = 0
+		other_process = NegativeCache(clock=lambda: self.now)
+		self.negative_cache.add('adsczx', 'Movie not found!')
+		self.negative_cache.add('qwerty', 'Movie not found!')
+		self.assertEqual(other_process.get('adsczx'), 'Movie not found!')
+		self.assertEqual(other_process.get('qwerty'), 'Movie not found!')
+
+		self.negative_cache.purge(['adsczx'])
+		self.assertEqual(other_process.get('adsczx'), 'Movie not found!')
+		self.now = 5
+		self.assertIsNone(other_process.get('adsczx'))
+		self.assertEqual(other_process.get('qwerty'), 'Movie not found!')
+
+		self.negative_cache.purge()
+		self.now = 10
+		self.assertIsNone(other_process.get('qwerty'))
+
+	@override_settings(NEGATIVE_CACHE_CHECK_INTERVAL=5)
+	def test_counters_checked_once_per_interval(self):
+		self.now = 0
+		negative_cache = NegativeCache(clock=lambda: self.now)
+		with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+			negative_cache.get('adsczx')
+			negative_cache.get('qwerty')
+			self.assertEqual(get_many.call_count, 1)
+			self.now = 5
+			negative_cache.get('adsczx')
+			self.assertEqual(get_many.call_count, 2)
+
+	def test_counts_hits_and_misses(self):
+		hits = metrics.counters.get('omdb_negative_cache_hits_total')
+		misses = metrics.counters.get('omdb_negative_cache_misses_total')
+		self.negative_cache.add('adsczx', 'Movie not found!')
+		self.negative_cache.get('adsczx')
+		self.negative_cache.get('qwerty')
+		self.assertEqual(metrics.counters.get('omdb_negative_cache_hits_total'), hits + 1)
+		self.assertEqual(metrics.counters.get('omdb_negative_cache_misses_total'), misses + 1)
+
+	def test_purge_command(self):
+		self.negative_cache.add('adsczx', 'Movie not found!')
+		stdout = StringIO()
+		call_command('purge_negative_cache', 'adsczx', stdout=stdout)
+		self.assertIn('Purged 1 title(s)', stdout.getvalue())
+		self.assertIsNone(NegativeCache().get('adsczx'))
+
+	@override_settings(NEGATIVE_CACHE_BACKEND=None)
+	def test_purge_command_needs_shared_backend(self):
+		with self.assertRaises(CommandError):
+			call_command('purge_negative_cache', stdout=StringIO())
@@ -0,0 +1,135 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from mock import patch
+
+from moviedb_rest_api.omdb import CircuitBreaker, OmdbClient, OmdbUnavailable, movie_attributes
+from moviedb_rest_api.omdb_stub import OmdbStub
+
+
+class TestOmdbClient(SimpleTestCase):
+	def setUp(self):
+		self.omdb_data = {'Title': 'Terminator', 'Year': '1984'}
+		self.stub = OmdbStub(movies={'terminator': self.omdb_data}).start()
+		self.addCleanup(self.stub.stop)
+		backoff_patcher = patch.object(OmdbClient, 'backoff', return_value=0)
+		self.backoff_patch = backoff_patcher.start()
+		self.addCleanup(backoff_patcher.stop)
+
+	def get_client(self, **kwargs):
+		options = {'api_url': self.stub.url, 'api_key': 'key', 'max_retries': 2}
+		options.update(kwargs)
+		return OmdbClient(**options)
+
+	def test_get_movie(self):
+		status_code, data = self.get_client().get_movie('Terminator')
+		self.assertEqual(status_code, 200)
+		self.assertDictEqual(data, self.omdb_data)
+
+	def test_get_movie_not_found(self):
+		status_code, data = self.get_client().get_movie('adsczx')
+		self.assertEqual(status_code, 200)
+		self.assertEqual(data['Error'], 'Movie not found!')
+
+	def test_retries_server_errors(self):
+		self.stub.failures = [500, 503]
+		status_code, data = self.get_client().get_movie('terminator')
+		self.assertEqual(status_code, 200)
+		self.assertEqual(len(self.stub.requests), 3)
+		self.assertEqual(self.backoff_patch.call_count, 2)
+
+	def test_gives_up_after_max_retries(self):
+		self.stub.failures = [500, 500, 500]
+		with self.assertRaises(OmdbUnavailable):
+			self.get_client().get_movie('terminator')
+		self.assertEqual(len(self.stub.requests), 3)
+
+	def test_client_errors_are_not_retried(self):
+		self.stub.failures = [401]
+		status_code, data = self.get_client().get_movie('terminator')
+		self.assertEqual(status_code, 401)
+		self.assertEqual(len(self.stub.requests), 1)
+
+	def test_read_timeout(self):
+		self.stub.delay = 0.5
+		with self.assertRaises(OmdbUnavailable):
+			self.get_client(read_timeout=0.05, max_retries=1).get_movie('terminator')
+		self.assertEqual(len(self.stub.requests), 2)
+
+	def test_time_limit(self):
+		self.stub.delay = 0.5
+		with self.assertRaises(OmdbUnavailable):
+			self.get_client(max_retries=5).get_movie('terminator', time_limit=0.05)
+		self.assertEqual(len(self.stub.requests), 1)
+
+	def test_connection_refused(self):
+		self.stub.stop()
+		with self.assertRaises(OmdbUnavailable):
+			self.get_client(max_retries=0).get_movie('terminator')
+
+	def test_circuit_opens_and_fails_fast(self):
+		client = self.get_client(max_retries=0, circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+		self.stub.failures = [500, 500]
+		for _ in range(2):
+			with self.assertRaises(OmdbUnavailable):
+				client.get_movie('terminator')
+		with self.assertRaises(OmdbUnavailable):
+			client.get_movie('terminator')
+		self.assertEqual(len(self.stub.requests), 2)
+
+	def test_reuses_connections(self):
+		client = self.get_client()
+		client.get_movie('terminator')
+		client.get_movie('terminator')
+		self.assertEqual(len(self.stub.client_ports), 1)
+
+
+class TestCircuitBreaker(SimpleTestCase):
+	def setUp(self):
+		self.now = 0
+		self.circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: self.now)
+
+	def test_opens_after_threshold(self):
+		self.circuit_breaker.record_failure()
+		self.assertTrue(self.circuit_breaker.allow_request())
+		self.circuit_breaker.record_failure()
+		self.assertFalse(self.circuit_breaker.allow_request())
+
+	def test_half_open_trial_closes_circuit(self):
+		self.circuit_breaker.record_failure()
+		self.circuit_breaker.record_failure()
+		self.now = 10
+		self.assertTrue(self.circuit_breaker.allow_request())
+		self.assertFalse(self.circuit_breaker.allow_request())
+		self.circuit_breaker.record_success()
+		self.assertTrue(self.circuit_breaker.allow_request())
+
+	def test_half_open_failure_reopens_circuit(self):
+		self.circuit_breaker.record_failure()
+		self.circuit_breaker.record_failure()
+		self.now = 10
+		self.assertTrue(self.circuit_breaker.allow_request())
+		self.circuit_breaker.record_failure()
+		self.assertFalse(self.circuit_breaker.allow_request())
+
+
+class TestMovieAttributes(SimpleTestCase):
+	def test_movie_attributes(self):
+		self.assertEqual(movie_attributes({
+			'Year': '1984', 'imdbID': 'tt0088247', 'imdbRating': '8.0', 'Runtime': '107 min',
+			'Genre': 'Action, Sci-Fi',
+		}), {
+			'year': 1984, 'imdb_id': 'tt0088247', 'imdb_rating': Decimal('8.0'), 'runtime_minutes': 107,
+			'genres': ['action', 'sci-fi'],
+		})
+
+	def test_missing_attributes(self):
+		empty = {'year': None, 'imdb_id': None, 'imdb_rating': None, 'runtime_minutes': None, 'genres': []}
+		self.assertEqual(movie_attributes({}), empty)
+		self.assertEqual(movie_attributes({
+			'Year': 'N/A', 'imdbID': 'N/A', 'imdbRating': 'N/A', 'Runtime': 'N/A', 'Genre': 'N/A',
+		}), empty)
+
+	def test_series_year_range(self):
+		self.assertEqual(movie_attributes({'Year': '2005–2010'})['year'], 2005)
@@ -0,0 +1,85 @@
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+
+from model_mommy import mommy
+from mock import patch
+
+from moviedb_rest_api import metrics
+from moviedb_rest_api.models import Movie
+from moviedb_rest_api.omdb import OmdbClient
+from moviedb_rest_api.omdb_stub import OmdbStub
+
+
+class TestHistograms(SimpleTestCase):
+	def test_render(self):
+		counters = metrics.Counters()
+		histograms = metrics.Histograms(buckets=(0.1, 1))
+		counters.increment('requests_total', 2, view='movies')
+		histograms.observe('duration_seconds', 0.1, view='movies')
+		histograms.observe('duration_seconds', 0.5, view='movies')
+		histograms.observe('duration_seconds', 3, view='movies')
+
+		with patch.object(metrics, 'counters', counters), patch.object(metrics, 'histograms', histograms):
+			self.assertEqual(metrics.render(), '\n'.join([
+				'# TYPE requests_total counter',
+				'requests_total{view="movies"} 2',
+				'# TYPE duration_seconds histogram',
+				'duration_seconds_bucket{view="movies",le="0.1"} 1',
+				'duration_seconds_bucket{view="movies",le="1.0"} 2',
+				'duration_seconds_bucket{view="movies",le="+Inf"} 3',
+				'duration_seconds_sum{view="movies"} 3.6',
+				'duration_seconds_count{view="movies"} 3',
+			]) + '\n')
+
+	def test_escapes_label_values(self):
+		self.assertEqual(metrics.format_labels((('title', 'a "b"\n'),)), '{title="a \\"b\\"\\n"}')
+
+
+@override_settings(REQUEST_PROFILING=True)
+class TestRequestProfiling(TestCase):
+	def setUp(self):
+		self.client = Client()
+
+	def server_timing(self, response):
+		return dict(
+			(entry.split(';')[0], entry.split(';')[1:]) for entry in response['Server-Timing'].split(', ')
+		)
+
+	def test_server_timing(self):
+		mommy.make(Movie, additional_data={}, _quantity=2)
+		response = self.client.get(reverse('movies'))
+
+		timing = self.server_timing(response)
+		self.assertEqual(sorted(timing), ['db', 'render', 'total'])
+		self.assertIn('desc="2 queries"', timing['db'])
+
+	def test_omdb_requests(self):
+		stub = OmdbStub(movies={'alien': {'Title': 'Alien'}}).start()
+		self.addCleanup(stub.stop)
+		client = OmdbClient(api_url=stub.url, api_key='key', max_retries=0)
+		with patch('moviedb_rest_api.omdb.get_client', return_value=client):
+			response = self.client.post(reverse('movies'), data={'movie_title': 'alien'})
+
+		self.assertEqual(response.status_code, 201)
+		self.assertIn('desc="1 requests"', self.server_timing(response)['omdb'])
+		self.assertGreaterEqual(metrics.counters.get('http_request_omdb_requests_total', view='movies'), 1)
+
+	def test_metrics(self):
+		self.client.get(reverse('movies'))
+		response = self.client.get(reverse('metrics'))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+		content = response.content.decode()
+		self.assertIn('# TYPE http_request_duration_seconds histogram', content)
+		self.assertIn('http_request_duration_seconds_bucket{method="GET",view="movies",le="+Inf"}', content)
+
+	@override_settings(REQUEST_PROFILING_SLOW_SECONDS=0, REQUEST_PROFILING_SAMPLE_RATE=1)
+	def test_logs_slow_requests_queries(self):
+		with self.assertLogs('moviedb_rest_api.profiling', 'WARNING') as logs:
+			self.client.get(reverse('movies'))
+		self.assertIn('SELECT', logs.output[0])
+
+	@override_settings(REQUEST_PROFILING=False)
+	def test_disabled(self):
+		self.assertFalse(self.client.get(reverse('movies')).has_header('Server-Timing'))
@@ -0,0 +1,79 @@
+import datetime
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from model_mommy import mommy
+from mock import patch
+
+from moviedb_rest_api.models import Movie
+from moviedb_rest_api.omdb import OmdbClient
+from moviedb_rest_api.omdb_stub import OmdbStub
+from moviedb_rest_api.refresh import MovieRefresher
+
+
+class TestMovieRefresher(TestCase):
+	def setUp(self):
+		self.alien_data = {'Title': 'Alien', 'Year': '1979', 'imdbRating': '8.5'}
+		self.heat_data = {'Title': 'Heat', 'Year': '1995', 'imdbRating': '8.3'}
+		self.stub = OmdbStub(movies={
+			'alien': dict(self.alien_data, imdbRating='8.4'),
+			'heat': self.heat_data,
+			'terminator': {'Title': 'Terminator', 'Year': '1984'},
+		}).start()
+		self.addCleanup(self.stub.stop)
+		client = OmdbClient(api_url=self.stub.url, api_key='key', max_retries=0)
+		client_patcher = patch('moviedb_rest_api.omdb.get_client', return_value=client)
+		client_patcher.start()
+		self.addCleanup(client_patcher.stop)
+
+		self.long_ago = timezone.now() - datetime.timedelta(days=30)
+		self.alien = mommy.make(Movie, title='Alien', additional_data=self.alien_data)
+		self.heat = mommy.make(Movie, title='Heat', additional_data=self.heat_data)
+		self.terminator = mommy.make(Movie, title='Terminator', additional_data={'Title': 'Terminator'})
+		Movie.objects.filter(id__in=[self.alien.id, self.heat.id]).update(last_fetched_at=self.long_ago)
+
+	def test_run(self):
+		with self.assertNumQueries(3):
+			totals = MovieRefresher(rate=0).run(max_age=60)
+
+		self.assertEqual(totals, {'changed': 1, 'unchanged': 1, 'failed': 0})
+		self.assertEqual(sorted(self.stub.requests), ['Alien', 'Heat'])
+		alien = Movie.objects.get(id=self.alien.id)
+		self.assertEqual(alien.additional_data['imdbRating'], '8.4')
+		self.assertEqual(alien.imdb_rating, Decimal('8.4'))
+		self.assertGreater(alien.last_fetched_at, self.long_ago)
+		self.assertGreater(alien.updated_at, self.alien.updated_at)
+		heat = Movie.objects.get(id=self.heat.id)
+		self.assertGreater(heat.last_fetched_at, self.long_ago)
+		self.assertEqual(heat.updated_at, self.heat.updated_at)
+
+		self.stub.requests.clear()
+		self.assertEqual(MovieRefresher(rate=0).run(max_age=60), {'changed': 0, 'unchanged': 0, 'failed': 0})
+		self.assertEqual(self.stub.requests, [])
+
+	def test_stalest_movies_first(self):
+		Movie.objects.filter(id=self.heat.id).update(last_fetched_at=self.long_ago - datetime.timedelta(days=1))
+		MovieRefresher(rate=0).run(limit=1, max_age=60)
+		self.assertEqual(self.stub.requests, ['Heat'])
+
+	def test_skips_pending_movies(self):
+		Movie.objects.filter(id=self.alien.id).update(status=Movie.PENDING)
+		MovieRefresher(rate=0).run(max_age=60)
+		self.assertEqual(self.stub.requests, ['Heat'])
+
+	def test_omdb_failures(self):
+		self.stub.failures = [500]
+		totals = MovieRefresher(workers=1, rate=0).run(max_age=60)
+		self.assertEqual(totals['failed'], 1)
+		self.assertEqual(
+			Movie.objects.filter(id__in=[self.alien.id, self.heat.id], last_fetched_at=self.long_ago).count(), 1
+		)
+
+	def test_refresh_movies_command(self):
+		out = StringIO()
+		call_command('refresh_movies', '--max-age', '60', '--rate', '0', stdout=out)
+		self.assertEqual(out.getvalue(), 'Refreshed 2 movie(s): 1 changed, 0 failed, 1 unchanged.\n')
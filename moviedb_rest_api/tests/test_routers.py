@@ -0,0 +1,170 @@
+import time
+from http.cookies import SimpleCookie
+
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, Client
+from django.test.utils import override_settings
+
+from mock import patch
+
+from moviedb_rest_api.models import CommentActivity, Movie
+from moviedb_rest_api.routers import (
+	STICKY_COOKIE, ReplicaLagMonitor, ReplicaRouter, end_request, lag_monitor, start_request, sticky_cookie_header,
+	use_primary
+)
+
+REPLICA = 'routing_test_replica'
+
+
+@override_settings(
+	DATABASE_REPLICAS=['replica_1', 'replica_2'], DATABASE_REPLICA_MAX_LAG=5, DATABASE_REPLICA_LAG_CHECK_INTERVAL=60
+)
+class TestReplicaRouter(SimpleTestCase):
+	def setUp(self):
+		self.router = ReplicaRouter()
+		self.lags = {'replica_1': 0.0, 'replica_2': 0.0}
+		check_patcher = patch.object(ReplicaLagMonitor, 'check', side_effect=lambda alias: self.lags[alias])
+		self.check = check_patcher.start()
+		self.addCleanup(check_patcher.stop)
+		self.addCleanup(lag_monitor.reset)
+		self.addCleanup(end_request)
+
+	def test_reads_outside_of_requests_go_to_primary(self):
+		self.assertIsNone(self.router.db_for_read(Movie))
+		self.check.assert_not_called()
+
+	def test_read_only_request_stays_on_one_replica(self):
+		start_request(read_only=True)
+		database = self.router.db_for_read(Movie)
+		self.assertIn(database, ('replica_1', 'replica_2'))
+		self.assertEqual({self.router.db_for_read(Movie) for _ in range(10)}, {database})
+
+		end_request()
+		self.assertIsNone(self.router.db_for_read(Movie))
+
+	def test_writing_request_reads_from_primary(self):
+		start_request(read_only=False)
+		self.assertIsNone(self.router.db_for_read(Movie))
+		self.assertEqual(self.router.db_for_write(Movie), 'default')
+
+	def test_lagging_and_unreachable_replicas_skipped(self):
+		self.lags = {'replica_1': 30.0, 'replica_2': None}
+		start_request(read_only=True)
+		self.assertEqual(self.router.db_for_read(Movie), 'default')
+
+		lag_monitor.reset()
+		self.lags['replica_2'] = 1.5
+		start_request(read_only=True)
+		self.assertEqual(self.router.db_for_read(Movie), 'replica_2')
+
+	def test_lag_checked_once_per_interval(self):
+		for _ in range(3):
+			start_request(read_only=True)
+			self.router.db_for_read(Movie)
+		self.assertEqual(self.check.call_count, 2)
+
+		with override_settings(DATABASE_REPLICA_LAG_CHECK_INTERVAL=0):
+			start_request(read_only=True)
+			self.router.db_for_read(Movie)
+		self.assertEqual(self.check.call_count, 4)
+
+	def test_use_primary(self):
+		start_request(read_only=True)
+		with use_primary():
+			self.assertIsNone(self.router.db_for_read(Movie))
+		self.assertIn(self.router.db_for_read(Movie), ('replica_1', 'replica_2'))
+
+	@override_settings(DATABASE_PRIMARY_STICKY_SECONDS=10)
+	def test_sticky_cookie_header(self):
+		cookie = SimpleCookie(sticky_cookie_header())[STICKY_COOKIE]
+		self.assertEqual(cookie['max-age'], '10')
+		self.assertAlmostEqual(float(cookie.value), time.time() + 10, delta=1)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], DATABASE_REPLICA_MAX_LAG=5, DATABASE_REPLICA_LAG_CHECK_INTERVAL=0)
+class TestReplicaRouting(TransactionTestCase):
+	"""
+	Runs against two local databases, a second test database stands in for the replica.
+
+	Nothing replicates the writes to it, so the rows found there show which
+	database a request read from.
+	"""
+	multi_db = True
+
+	@classmethod
+	def setUpClass(cls):
+		connections.databases[REPLICA] = dict(connections.databases['default'], NAME='replica', TEST={})
+		connections[REPLICA].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+		super(TestReplicaRouting, cls).setUpClass()
+
+	@classmethod
+	def tearDownClass(cls):
+		super(TestReplicaRouting, cls).tearDownClass()
+		connections[REPLICA].creation.destroy_test_db('replica', verbosity=0)
+		del connections.databases[REPLICA]
+		delattr(connections._connections, REPLICA)
+
+	def setUp(self):
+		self.movie = Movie.objects.create(title='Alien', additional_data={})
+		Movie.objects.using(REPLICA).create(title='Heat', additional_data={})
+		lag_monitor.reset()
+		self.addCleanup(lag_monitor.reset)
+
+	def titles(self, client, **params):
+		response = client.get(reverse('movies'), params)
+		self.assertEqual(response.status_code, 200)
+		if response.streaming:
+			return b''.join(response.streaming_content).decode().splitlines()
+		return [movie['title'] for movie in response.json()]
+
+	def test_reads_go_to_replica(self):
+		self.assertEqual(self.titles(Client()), ['Heat'])
+
+	def test_streamed_response_reads_from_replica(self):
+		lines = self.titles(Client(), stream='ndjson', fields='title')
+		self.assertEqual(lines, ['{"title":"Heat"}'])
+
+	def test_client_reads_its_writes(self):
+		client = Client()
+		response = client.post(reverse('comments'), {'movie_id': self.movie.id, 'comment_body': 'comment'})
+		self.assertEqual(response.status_code, 201)
+		self.assertIn(STICKY_COOKIE, response.cookies)
+
+		self.assertEqual(self.titles(client), ['Alien'])
+		self.assertEqual(self.titles(Client()), ['Heat'])
+
+		client.cookies[STICKY_COOKIE] = str(time.time() - 1)
+		self.assertEqual(self.titles(client), ['Heat'])
+
+	def test_lagging_replica_skipped(self):
+		self.assertEqual(ReplicaLagMonitor.check(REPLICA), 0)
+		with patch.object(ReplicaLagMonitor, 'check', return_value=60.0):
+			self.assertEqual(self.titles(Client()), ['Alien'])
+
+	def test_raw_sql_writes_go_to_primary(self):
+		start_request(read_only=True)
+		self.addCleanup(end_request)
+		self.assertEqual(Movie.objects.db, REPLICA)
+
+		movie, created = Movie.objects.insert_or_get(title='Brazil', additional_data={})
+		self.assertTrue(created)
+		self.assertEqual(movie._state.db, 'default')
+		self.assertEqual(Movie.objects.insert_or_get(title='Alien', additional_data={}), (self.movie, False))
+		CommentActivity.objects.record(self.movie.id, self.movie.created_at)
+
+		end_request()
+		self.assertEqual(list(Movie.objects.order_by('id').values_list('title', flat=True)), ['Alien', 'Brazil'])
+		self.assertEqual(CommentActivity.objects.get().movie_id, self.movie.id)
+		self.assertFalse(CommentActivity.objects.using(REPLICA).exists())
+
+	def test_version_validated_responses_read_from_primary(self):
+		# The ETag comes from versions the write already bumped, the body must not be older.
+		with patch('moviedb_rest_api.cache.shared_versions', return_value=True):
+			self.assertEqual(self.titles(Client()), ['Alien'])
+
+	@override_settings(RESPONSE_CACHE_TIMEOUT=60)
+	def test_cached_responses_read_from_primary(self):
+		self.addCleanup(caches['responses'].clear)
+		self.assertEqual(self.titles(Client()), ['Alien'])
@@ -1,11 +1,29 @@
+import base64
+import datetime
+import json
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.color import no_style
 from django.core.urlresolvers import reverse
-from django.test import TestCase, Client
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import utc
 
 from freezegun import freeze_time
 from model_mommy import mommy
 from mock import patch, Mock
 
-from moviedb_rest_api.models import Movie, Comment
+from moviedb_rest_api import metrics
+from moviedb_rest_api.models import SEARCH_FUZZY, Movie, Comment, CommentActivity
+from moviedb_rest_api.negative_cache import negative_cache
+from moviedb_rest_api.omdb import OmdbUnavailable
+from moviedb_rest_api.pagination import KeysetPaginator
+from moviedb_rest_api.serializers import CommentSerializer
 
 
 @freeze_time("2018-10-05")
@@ -13,7 +31,7 @@ class TestMoviesViewPost(TestCase):
 	def setUp(self):
 		self.title = 'terminator'
 		self.client = Client()
-		requests_get_patcher = patch('moviedb_rest_api.views.requests.get')
+		requests_get_patcher = patch('moviedb_rest_api.omdb.requests.Session.get')
 		self.omdb_get_patch = requests_get_patcher.start()
 		self.addCleanup(requests_get_patcher.stop)
 		self.omdb_data = {
@@ -24,6 +42,7 @@ class TestMoviesViewPost(TestCase):
 		self.excepted_data = {
 			'movie_id': 1,
 			'title': 'Terminator',
+			'status': 'ready',
 			'additional_data': self.omdb_data,
 			'created_at': '2018-10-05T00:00:00Z'
 		}
@@ -31,9 +50,10 @@ class TestMoviesViewPost(TestCase):
 			status_code=200,
 			json=Mock(return_value=self.omdb_data)
 		)
+		negative_cache.purge()
 
 	def test_post_valid_new_movie_title_create_record(self):
-		with self.assertNumQueries(2):
+		with self.assertNumQueries(5):
 			response = self.client.post(reverse('movies'), data={'movie_title': self.title})
 		json_data = response.json()
 
@@ -52,21 +72,52 @@ class TestMoviesViewPost(TestCase):
 			status_code=200,
 			json=Mock(return_value={'Response': 'False', 'Error': 'Movie not found!'})
 		)
-		with self.assertNumQueries(1):
+		with self.assertNumQueries(4):
 			response = self.client.post(reverse('movies'), data={'movie_title': 'adsczx'})
 		self.assertEqual(response.status_code, 200)
 		self.assertDictEqual(response.json(), {'OMDB_Error': 'Movie not found!'})
 
+	def test_post_movie_not_found_is_cached(self):
+		self.omdb_get_patch.return_value = Mock(
+			status_code=200,
+			json=Mock(return_value={'Response': 'False', 'Error': 'Movie not found!'})
+		)
+		self.client.post(reverse('movies'), data={'movie_title': 'adsczx'})
+		hits = metrics.counters.get('omdb_negative_cache_hits_total')
+		with self.assertNumQueries(1):
+			response = self.client.post(reverse('movies'), data={'movie_title': 'ADSCZX'})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertDictEqual(response.json(), {'OMDB_Error': 'Movie not found!'})
+		self.assertEqual(self.omdb_get_patch.call_count, 1)
+		self.assertEqual(metrics.counters.get('omdb_negative_cache_hits_total'), hits + 1)
+
+	def test_post_invalid_api_key_is_not_cached(self):
+		self.omdb_get_patch.return_value = Mock(
+			status_code=401,
+			json=Mock(return_value={'Response': 'False', 'Error': 'Invalid API key!'})
+		)
+		self.client.post(reverse('movies'), data={'movie_title': self.title})
+		self.client.post(reverse('movies'), data={'movie_title': self.title})
+		self.assertEqual(self.omdb_get_patch.call_count, 2)
+
 	def test_post_invalid_api_key(self):
 		self.omdb_get_patch.return_value = Mock(
 			status_code=401,
 			json=Mock(return_value={'Response': 'False', 'Error': 'Invalid API key!'})
 		)
-		with self.assertNumQueries(1):
+		with self.assertNumQueries(4):
 			response = self.client.post(reverse('movies'), data={'movie_title': self.title})
 		self.assertEqual(response.status_code, 200)
 		self.assertDictEqual(response.json(), {'OMDB_Error': 'Invalid API key!'})
 
+	def test_post_omdb_unavailable(self):
+		with patch('moviedb_rest_api.omdb.OmdbClient.get_movie', side_effect=OmdbUnavailable):
+			response = self.client.post(reverse('movies'), data={'movie_title': self.title})
+		self.assertEqual(response.status_code, 503)
+		self.assertIn('OMDB_Error', response.json())
+		self.assertFalse(Movie.objects.exists())
+
 	def test_post_valid_new_movie_title_get_record(self):
 		movie = mommy.make(Movie, id=1, title=self.title.title(), additional_data=self.omdb_data)
 		with self.assertNumQueries(1):
@@ -78,6 +129,40 @@ class TestMoviesViewPost(TestCase):
 		self.assertEqual(self.omdb_get_patch.call_count, 0)
 		self.assertEqual(json_data['movie_id'], movie.id)
 
+	def test_post_existing_movie_title_different_case(self):
+		mommy.make(Movie, id=1, title=self.title.title(), additional_data=self.omdb_data)
+		with self.assertNumQueries(1):
+			response = self.client.post(reverse('movies'), data={'movie_title': ' TERMINATOR '})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertDictEqual(response.json(), self.excepted_data)
+		self.assertEqual(self.omdb_get_patch.call_count, 0)
+
+	def test_title_unique_case_insensitive(self):
+		mommy.make(Movie, title=self.title.title(), additional_data=self.omdb_data)
+		with self.assertRaises(IntegrityError):
+			mommy.make(Movie, title=self.title.upper(), additional_data=self.omdb_data)
+
+	def test_post_fields(self):
+		response = self.client.post(
+			'{}?fields=movie_id,additional_data.Year'.format(reverse('movies')), data={'movie_title': self.title}
+		)
+		movie = Movie.objects.get()
+		self.assertEqual(response.status_code, 201)
+		self.assertDictEqual(response.json(), {'movie_id': movie.id, 'additional_data': {'Year': '2001'}})
+
+		with self.assertNumQueries(1):
+			response = self.client.post(
+				'{}?fields=title,additional_data.Plot'.format(reverse('movies')), data={'movie_title': self.title}
+			)
+		self.assertEqual(response.status_code, 200)
+		self.assertDictEqual(response.json(), {'title': 'Terminator', 'additional_data': {'Plot': None}})
+
+	def test_post_invalid_fields(self):
+		response = self.client.post('{}?fields=plot'.format(reverse('movies')), data={'movie_title': self.title})
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(self.omdb_get_patch.call_count, 0)
+
 	def test_post_no_movie_title(self):
 		with self.assertNumQueries(0):
 			response = self.client.post(reverse('movies'), data={})
@@ -85,6 +170,69 @@ class TestMoviesViewPost(TestCase):
 		self.assertEqual(response.status_code, 400)
 		self.assertDictEqual(response.json(), {})
 
+	def test_post_movie_title_not_a_string(self):
+		for movie_title in (123, ['alien']):
+			response = self.client.post(
+				reverse('movies'), data=json.dumps({'movie_title': movie_title}), content_type='application/json'
+			)
+			self.assertEqual(response.status_code, 400)
+			self.assertDictEqual(response.json(), {})
+		self.assertEqual(self.omdb_get_patch.call_count, 0)
+
+
+class TestMoviesViewConcurrentPost(TransactionTestCase):
+	def setUp(self):
+		self.omdb_data = {'Title': 'Terminator', 'Year': '1984'}
+		self.release_omdb = threading.Event()
+		requests_get_patcher = patch('moviedb_rest_api.omdb.requests.Session.get', side_effect=self.slow_omdb_get)
+		self.omdb_get_patch = requests_get_patcher.start()
+		self.addCleanup(requests_get_patcher.stop)
+
+	def slow_omdb_get(self, *args, **kwargs):
+		self.release_omdb.wait(5)
+		return Mock(status_code=200, json=Mock(return_value=self.omdb_data))
+
+	def post_movie(self, movie_title, responses):
+		try:
+			responses.append(Client().post(reverse('movies'), data={'movie_title': movie_title}))
+		finally:
+			connection.close()
+
+	def test_concurrent_posts_fetch_once(self):
+		responses = []
+		threads = [
+			threading.Thread(target=self.post_movie, args=(movie_title, responses))
+			for movie_title in ('terminator', 'Terminator', 'TERMINATOR', 'terminator ')
+		]
+		for thread in threads:
+			thread.start()
+		time.sleep(0.2)
+		self.release_omdb.set()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(self.omdb_get_patch.call_count, 1)
+		self.assertEqual(Movie.objects.count(), 1)
+		self.assertEqual(sorted(response.status_code for response in responses), [200, 200, 200, 201])
+		movie_ids = {response.json()['movie_id'] for response in responses}
+		self.assertEqual(movie_ids, {Movie.objects.get().id})
+
+	def test_insert_or_get_existing_title(self):
+		movie = mommy.make(Movie, title='Terminator', additional_data=self.omdb_data)
+		existing_movie, created = Movie.objects.insert_or_get(title='TERMINATOR', additional_data={})
+
+		self.assertFalse(created)
+		self.assertEqual(existing_movie.id, movie.id)
+		self.assertEqual(Movie.objects.count(), 1)
+
+	def test_insert_or_get_new_title(self):
+		movie, created = Movie.objects.insert_or_get(title='Terminator', additional_data=self.omdb_data)
+
+		self.assertTrue(created)
+		self.assertEqual(Movie.objects.get().id, movie.id)
+		self.assertEqual(movie.normalized_title, 'terminator')
+		self.assertIsNotNone(movie.created_at)
+
 
 @freeze_time("2018-10-05")
 class TestMoviesViewGet(TestCase):
@@ -93,7 +241,7 @@ class TestMoviesViewGet(TestCase):
 		self.client = Client()
 
 	def test_get_movies_no_records(self):
-		with self.assertNumQueries(1):
+		with self.assertNumQueries(2):
 			response = self.client.get(reverse('movies'))
 
 		self.assertEqual(response.status_code, 200)
@@ -106,7 +254,7 @@ class TestMoviesViewGet(TestCase):
 		)
 		movie_2 = mommy.make(Movie, id=2, title='Robot Chicken: Star Wars III', additional_data={'Year': '2010'})
 		movie_3 = mommy.make(Movie, id=3, title='Star Wars: Episode IV - A New Hope', additional_data={'Year': '1977'})
-		with self.assertNumQueries(1):
+		with self.assertNumQueries(2):
 			response = self.client.get(reverse('movies'))
 		json_data = response.json()
 
@@ -114,22 +262,261 @@ class TestMoviesViewGet(TestCase):
 		excepted_data = [{
 			'movie_id': 1,
 			'title': 'Star Wars I: The Phantom Menace in the Playroom',
+			'status': 'ready',
 			'additional_data': {'Year': '2012'},
 			'created_at': '2018-10-05T00:00:00Z'
 		}, {
 			'movie_id': 2,
 			'title': 'Robot Chicken: Star Wars III',
+			'status': 'ready',
 			'additional_data': {'Year': '2010'},
 			'created_at': '2018-10-05T00:00:00Z'
 		}, {
 			'movie_id': 3,
 			'title': 'Star Wars: Episode IV - A New Hope',
+			'status': 'ready',
 			'additional_data': {'Year': '1977'},
 			'created_at': '2018-10-05T00:00:00Z'
 		}]
 		for i, movie_data in enumerate(excepted_data):
 			self.assertDictEqual(movie_data, json_data[i])
 
+	def test_get_movies_query_count_does_not_grow_with_rows(self):
+		mommy.make(Movie, additional_data={'Year': '2010', 'Ratings': []}, _quantity=25)
+		with self.assertNumQueries(2):
+			response = self.client.get(reverse('movies'))
+		self.assertEqual(len(response.json()), 25)
+
+	def test_get_movies_paginated(self):
+		movies = mommy.make(Movie, _quantity=5)
+		with self.assertNumQueries(2):
+			response = self.client.get(reverse('movies'), data={'page_size': 2})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([movie['movie_id'] for movie in response.json()], [movies[0].id, movies[1].id])
+		self.assertIn('rel="next"', response['Link'])
+		self.assertNotIn('rel="prev"', response['Link'])
+
+	def test_get_movies_follow_cursors(self):
+		movies = mommy.make(Movie, _quantity=5)
+		seen_ids = []
+		url = '{}?page_size=2'.format(reverse('movies'))
+		while url:
+			response = self.client.get(url)
+			seen_ids.extend(movie['movie_id'] for movie in response.json())
+			url = self.get_link(response, 'next')
+		self.assertEqual(seen_ids, [movie.id for movie in movies])
+
+	def test_get_movies_previous_page(self):
+		movies = mommy.make(Movie, _quantity=5)
+		cursor = KeysetPaginator(ordering=('id',)).encode_cursor(movies[3])
+		response = self.client.get(reverse('movies'), data={'page_size': 2, 'after': cursor})
+		self.assertEqual([movie['movie_id'] for movie in response.json()], [movies[4].id])
+
+		response = self.client.get(self.get_link(response, 'prev'))
+		self.assertEqual([movie['movie_id'] for movie in response.json()], [movies[2].id, movies[3].id])
+		self.assertIsNotNone(self.get_link(response, 'next'))
+
+	def test_get_movies_last_page_has_no_next_link(self):
+		mommy.make(Movie, _quantity=2)
+		response = self.client.get(reverse('movies'), data={'page_size': 2})
+		self.assertFalse(response.has_header('Link'))
+
+	def test_get_movies_invalid_cursor(self):
+		with self.assertNumQueries(1):
+			response = self.client.get(reverse('movies'), data={'after': 'not a cursor'})
+		self.assertEqual(response.status_code, 400)
+
+	def test_get_movies_cursor_of_wrong_type(self):
+		cursor = base64.urlsafe_b64encode(json.dumps(['x']).encode('utf-8')).decode('ascii')
+		response = self.client.get(reverse('movies'), data={'after': cursor})
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.data, [])
+
+	def test_get_movies_stream_ndjson(self):
+		movies = mommy.make(Movie, _quantity=3)
+		response = self.client.get(reverse('movies'), data={'stream': 'ndjson'})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+		lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+		self.assertEqual([json.loads(line)['movie_id'] for line in lines], [movie.id for movie in movies])
+
+	def test_get_movies_stream_json(self):
+		movies = mommy.make(Movie, _quantity=3)
+		response = self.client.get(reverse('movies'), data={'stream': 'json'})
+
+		self.assertEqual(response.status_code, 200)
+		json_data = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+		self.assertEqual([movie['movie_id'] for movie in json_data], [movie.id for movie in movies])
+
+	def test_get_movies_unsupported_stream_format(self):
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse('movies'), data={'stream': 'xml'})
+		self.assertEqual(response.status_code, 400)
+
+	def test_get_movies_fields(self):
+		movie = mommy.make(Movie, title='Alien', additional_data={'Year': '1979', 'Plot': 'In space...', 'Ratings': []})
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('movies'), data={'fields': 'title,additional_data.Year,additional_data.Ratings'})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json(), [{'title': 'Alien', 'additional_data': {'Ratings': [], 'Year': '1979'}}])
+		sql = queries.captured_queries[-1]['sql']
+		self.assertIn("-> 'Year'", sql)
+		self.assertNotIn('"moviedb_rest_api_movie"."additional_data",', sql)
+		self.assertNotIn('"created_at"', sql)
+
+		response = self.client.get(reverse('movies'), data={'fields': 'movie_id,additional_data,additional_data.Year'})
+		self.assertEqual(response.json(), [{'movie_id': movie.id, 'additional_data': movie.additional_data}])
+
+	def test_get_movies_fields_follow_cursors(self):
+		movies = mommy.make(Movie, _quantity=3)
+		response = self.client.get(reverse('movies'), data={'page_size': 2, 'fields': 'title'})
+		self.assertEqual(response.json(), [{'title': movie.title} for movie in movies[:2]])
+
+		response = self.client.get(self.get_link(response, 'next'))
+		self.assertEqual(response.json(), [{'title': movies[2].title}])
+
+	def test_get_movies_stream_fields(self):
+		movies = mommy.make(Movie, _quantity=2)
+		response = self.client.get(reverse('movies'), data={'stream': 'ndjson', 'fields': 'movie_id'})
+		lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+		self.assertEqual([json.loads(line) for line in lines], [{'movie_id': movie.id} for movie in movies])
+
+	def make_movies_with_attributes(self):
+		return [
+			mommy.make(Movie, title=title, additional_data={'Year': year, 'Genre': genre, 'imdbRating': rating})
+			for title, year, genre, rating in (
+				('Alien', '1979', 'Horror, Sci-Fi', '8.5'),
+				('Heat', '1995', 'Crime, Drama', '8.3'),
+				('Aliens', '1986', 'Action, Sci-Fi', '8.4'),
+				('Unknown', 'N/A', 'N/A', 'N/A'),
+			)
+		]
+
+	def test_movie_omdb_attributes_saved(self):
+		alien = self.make_movies_with_attributes()[0]
+		alien = Movie.objects.get(id=alien.id)
+		self.assertEqual((alien.year, alien.imdb_rating, alien.genres), (1979, Decimal('8.5'), ['horror', 'sci-fi']))
+
+	def test_get_movies_filters(self):
+		alien, heat, aliens, unknown = self.make_movies_with_attributes()
+		for params, expected in (
+			({'genre': 'Sci-Fi'}, [alien, aliens]),
+			({'year': 1995}, [heat]),
+			({'year_from': 1980, 'year_to': 1990}, [aliens]),
+			({'min_rating': '8.4', 'genre': 'sci-fi'}, [alien, aliens]),
+			({'min_rating': '8.4', 'year_from': 1980}, [aliens]),
+		):
+			response = self.client.get(reverse('movies'), data=params)
+			self.assertEqual([movie['movie_id'] for movie in response.json()], [movie.id for movie in expected], params)
+
+	def test_get_movies_ordering(self):
+		alien, heat, aliens, unknown = self.make_movies_with_attributes()
+		response = self.client.get(reverse('movies'), data={'ordering': 'year'})
+		self.assertEqual([movie['movie_id'] for movie in response.json()], [alien.id, aliens.id, heat.id])
+
+		seen_ids = []
+		url = '{}?ordering=-imdb_rating&page_size=1&fields=title'.format(reverse('movies'))
+		while url:
+			response = self.client.get(url)
+			seen_ids.extend(movie['title'] for movie in response.json())
+			url = self.get_link(response, 'next')
+		self.assertEqual(seen_ids, ['Alien', 'Aliens', 'Heat'])
+
+	def test_get_movies_invalid_filters(self):
+		for params in ({'year': 'abc'}, {'min_rating': 'nan'}, {'ordering': 'title'}, {'ordering': '--year'}):
+			response = self.client.get(reverse('movies'), data=params)
+			self.assertEqual(response.status_code, 400, params)
+
+	def test_get_movies_invalid_fields(self):
+		for fields in ('plot', 'additional_data.', "additional_data.Year'--", 'title.Year', ','):
+			response = self.client.get(reverse('movies'), data={'fields': fields})
+			self.assertEqual(response.status_code, 400, fields)
+
+	@staticmethod
+	def get_link(response, rel):
+		if not response.has_header('Link'):
+			return None
+		for link in response['Link'].split(', '):
+			url, link_rel = link.split('; ')
+			if link_rel == 'rel="{}"'.format(rel):
+				return url.strip('<>')
+
+
+class TestMovieSearchView(TestCase):
+	def setUp(self):
+		self.client = Client()
+		self.terminator = mommy.make(Movie, title='The Terminator', additional_data={
+			'Plot': 'A cyborg assassin is sent back in time to kill the mother of the future resistance leader.'
+		})
+		self.terminator_2 = mommy.make(Movie, title='Terminator 2: Judgment Day', additional_data={
+			'Plot': 'A cyborg, identical to the one who failed to kill Sarah Connor, must now protect her son.'
+		})
+		self.alien = mommy.make(Movie, title='Alien', additional_data={
+			'Plot': 'The crew of a commercial spacecraft encounter a deadly lifeform.'
+		})
+
+	def search(self, **params):
+		response = self.client.get(reverse('movie-search'), data=params)
+		self.assertEqual(response.status_code, 200)
+		return [movie['movie_id'] for movie in response.json()]
+
+	def test_prefix_search(self):
+		self.assertEqual(self.search(q='TERMIN', mode='prefix'), [self.terminator_2.id])
+		self.assertEqual(self.search(q='the term', mode='prefix'), [self.terminator.id])
+
+	def test_full_text_search(self):
+		self.assertEqual(self.search(q='spacecraft crew', mode='text'), [self.alien.id])
+		self.assertEqual(self.search(q='cyborgs', mode='text'), [self.terminator.id, self.terminator_2.id])
+
+	def test_title_matches_rank_first(self):
+		self.assertEqual(self.search(q='terminator'), [self.terminator_2.id, self.terminator.id])
+		self.assertEqual(self.search(q='the terminator')[0], self.terminator.id)
+
+	def test_search_vector_follows_updates(self):
+		self.alien.additional_data = {'Plot': 'A xenomorph hunts the crew.'}
+		self.alien.save()
+		Movie.objects.insert_or_get(title='Aliens', additional_data={'Plot': 'The xenomorph returns.'})
+
+		self.assertEqual(len(self.search(q='xenomorph', mode='text')), 2)
+		self.assertEqual(self.search(q='spacecraft', mode='text'), [])
+
+	def test_fuzzy_search(self):
+		if not Movie.objects.has_trigram_support():
+			self.skipTest('pg_trgm is not installed.')
+		self.assertEqual(self.search(q='Termnator', mode='fuzzy')[0], self.terminator_2.id)
+		self.assertIn(self.alien.id, self.search(q='allien'))
+
+	def test_fuzzy_search_query(self):
+		# Built without running it, so it is checked also where pg_trgm is not installed.
+		query = str(Movie.objects.search('Termnator', modes=[SEARCH_FUZZY]).query)
+		self.assertIn('"normalized_title" % termnator', query)
+		self.assertIn('SIMILARITY("moviedb_rest_api_movie"."normalized_title", termnator)', query)
+
+	@patch('moviedb_rest_api.models.MovieManager.has_trigram_support', return_value=False)
+	def test_fuzzy_search_not_available(self, has_trigram_support_patch):
+		self.assertEqual(self.search(q='terminator'), [self.terminator_2.id, self.terminator.id])
+		response = self.client.get(reverse('movie-search'), data={'q': 'terminator', 'mode': 'fuzzy'})
+		self.assertEqual(response.status_code, 400)
+
+	def test_search_fields(self):
+		response = self.client.get(reverse('movie-search'), data={'q': 'alien', 'fields': 'title,score'})
+		self.assertEqual(list(response.json()[0]), ['title', 'score'])
+		self.assertEqual(response.json()[0]['title'], 'Alien')
+		self.assertGreater(response.json()[0]['score'], 2)
+
+	def test_search_paginated(self):
+		response = self.client.get(reverse('movie-search'), data={'q': 'cyborg', 'page_size': 1})
+		self.assertEqual(len(response.json()), 1)
+		self.assertIn('rel="next"', response['Link'])
+
+	def test_invalid_search(self):
+		for params in ({}, {'q': ' '}, {'q': 'alien', 'mode': 'regex'}, {'q': 'alien', 'fields': 'plot'}):
+			response = self.client.get(reverse('movie-search'), data=params)
+			self.assertEqual(response.status_code, 400, params)
+
 
 @freeze_time("2018-10-05")
 class TestCommentsViewPost(TestCase):
@@ -165,7 +552,7 @@ class TestCommentsViewPost(TestCase):
 
 	def test_create_comment(self):
 		movie = mommy.make(Movie, title='Robot Chicken: Star Wars III', additional_data={'Year': '2010'})
-		with self.assertNumQueries(2):
+		with self.assertNumQueries(6):
 			response = self.client.post(reverse('comments'), data={'movie_id': movie.id, 'comment_body': 'comment'})
 
 		self.assertEqual(response.status_code, 201)
@@ -175,14 +562,50 @@ class TestCommentsViewPost(TestCase):
 			'body': 'comment', 'created_at': '2018-10-05T00:00:00Z'
 		}
 		self.assertDictEqual(response.json(), expected_data)
+		movie.refresh_from_db()
+		self.assertEqual(movie.comment_count, 1)
+
+	def test_comment_count_maintained(self):
+		movie = mommy.make(Movie)
+		comments = mommy.make(Comment, movie=movie, _quantity=3)
+		comments[0].delete()
+		comments[1].body = 'edited'
+		comments[1].save()
+		movie.refresh_from_db()
+		self.assertEqual(movie.comment_count, 2)
+
+	@freeze_time("2018-10-05 10:15")
+	def test_comment_count_maintained_on_bulk_delete(self):
+		movie_1, movie_2 = mommy.make(Movie, _quantity=2)
+		mommy.make(Comment, movie=movie_1, _quantity=3)
+		mommy.make(Comment, movie=movie_2, _quantity=2)
+		Comment.objects.filter(id__in=Comment.objects.filter(movie=movie_1).values('id')[:2]).delete()
+		movie_1.refresh_from_db()
+		self.assertEqual(movie_1.comment_count, 1)
+		self.assertEqual(CommentActivity.objects.get(movie=movie_1).comment_count, 1)
+
+		movie_1.delete()
+		movie_2.comments.all().delete()
+		movie_2.refresh_from_db()
+		self.assertEqual(movie_2.comment_count, 0)
+		self.assertFalse(CommentActivity.objects.filter(movie=movie_1).exists())
 
 
+@freeze_time("2018-10-05")
 class TestCommentsViewGet(TestCase):
+	"""
+	Movie ids start from 1 in every test, and comments made together share their
+	created_at, so the newest first listing orders them by id.
+	"""
 	def setUp(self):
 		self.client = Client()
+		sequences = [{'table': Movie._meta.db_table, 'column': 'id'}]
+		with connection.cursor() as cursor:
+			for sql in connection.ops.sequence_reset_by_name_sql(no_style(), sequences):
+				cursor.execute(sql)
 
 	def test_get_no_comments_no_movie_id(self):
-		with self.assertNumQueries(1):
+		with self.assertNumQueries(2):
 			response = self.client.get(reverse('comments'))
 
 		self.assertEqual(response.status_code, 200)
@@ -190,7 +613,7 @@ class TestCommentsViewGet(TestCase):
 
 	def test_get_comments_no_movie_id(self):
 		mommy.make(Comment, _quantity=4)
-		with self.assertNumQueries(5):
+		with self.assertNumQueries(2):
 			response = self.client.get(reverse('comments'))
 
 		self.assertEqual(response.status_code, 200)
@@ -199,12 +622,20 @@ class TestCommentsViewGet(TestCase):
 		for i, comment in enumerate(json_data, 1):
 			self.assertEqual(comment['movie_id'], i)
 
+	def test_get_comments_of_their_movies(self):
+		comments = mommy.make(Comment, _quantity=4)
+		response = self.client.get(reverse('comments'))
+		self.assertEqual(
+			[(comment['comment_id'], comment['movie_id']) for comment in response.json()],
+			[(comment.id, comment.movie_id) for comment in comments]
+		)
+
 	def test_get_movie_comments(self):
 		movie = mommy.make(Movie)
 		queried_comments_number = 2
 		mommy.make(Comment, _quantity=4)
 		mommy.make(Comment, movie=movie, _quantity=queried_comments_number)
-		with self.assertNumQueries(3):
+		with self.assertNumQueries(2):
 			response = self.client.get('{}?movie_id={}'.format(reverse('comments'), movie.id))
 
 		self.assertEqual(response.status_code, 200)
@@ -213,11 +644,67 @@ class TestCommentsViewGet(TestCase):
 		for comment in json_data:
 			self.assertEqual(comment['movie_id'], movie.id)
 
+	def test_get_comments_query_count_does_not_grow_with_rows(self):
+		mommy.make(Comment, _quantity=25)
+		with self.assertNumQueries(2):
+			response = self.client.get(reverse('comments'))
+		self.assertEqual(len(response.json()), 25)
+
+	def test_get_comments_matches_model_serializer(self):
+		comment = mommy.make(Comment)
+		response = self.client.get(reverse('comments'))
+		self.assertDictEqual(response.json()[0], dict(CommentSerializer(comment).data))
+
 	def test_get_comments_unsupported_id(self):
 		with self.assertNumQueries(0):
 			response = self.client.get('{}?movie_id=48c8e82ebebc0aec49ab0e0fe2197bf1'.format(reverse('comments')))
 		self.assertEqual(response.status_code, 400)
 
+	def make_comments(self, movie, dates):
+		comments = []
+		for date in dates:
+			with freeze_time(date):
+				comments.append(mommy.make(Comment, movie=movie))
+		return comments
+
+	def test_get_movie_comments_newest_first(self):
+		movie = mommy.make(Movie)
+		old, new, same_time_1, same_time_2 = self.make_comments(
+			movie, ('2018-10-01', '2018-10-05', '2018-10-03', '2018-10-03')
+		)
+		mommy.make(Comment)
+		response = self.client.get(reverse('comments'), data={'movie_id': movie.id})
+		self.assertEqual(
+			[comment['comment_id'] for comment in response.json()], [new.id, same_time_1.id, same_time_2.id, old.id]
+		)
+
+	def test_get_movie_comments_follow_cursors(self):
+		movie = mommy.make(Movie)
+		comments = self.make_comments(movie, ('2018-10-01', '2018-10-02', '2018-10-02', '2018-10-03', '2018-10-04'))
+		seen_ids = []
+		url = '{}?movie_id={}&page_size=2'.format(reverse('comments'), movie.id)
+		while url:
+			with self.assertNumQueries(2):
+				response = self.client.get(url)
+			seen_ids.extend(comment['comment_id'] for comment in response.json())
+			url = TestMoviesViewGet.get_link(response, 'next')
+		self.assertEqual(seen_ids, [comment.id for comment in reversed(comments[3:])] + [
+			comments[1].id, comments[2].id, comments[0].id
+		])
+
+		response = self.client.get(TestMoviesViewGet.get_link(response, 'prev'))
+		self.assertEqual([comment['comment_id'] for comment in response.json()], [comments[1].id, comments[2].id])
+
+	def test_get_comments_invalid_cursor(self):
+		response = self.client.get(reverse('comments'), data={'before': 'not a cursor'})
+		self.assertEqual(response.status_code, 400)
+
+	def test_get_comments_cursor_of_wrong_type(self):
+		cursor = base64.urlsafe_b64encode(json.dumps(['yesterday', 1]).encode('utf-8')).decode('ascii')
+		response = self.client.get(reverse('comments'), data={'after': cursor})
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.data, [])
+
 
 class TestTopMoviesView(TestCase):
 	def setUp(self):
@@ -235,7 +722,7 @@ class TestTopMoviesView(TestCase):
 		movie_4 = mommy.make(Movie)
 		mommy.make(Comment, movie=movie_4, _quantity=movie_3_4_comments_quantity)
 
-		with self.assertNumQueries(1):
+		with self.assertNumQueries(2):
 			response = self.client.get('{}?date_from=1538611200.0&date_to=1538784000.0'.format(reverse('top')))
 		json_data = response.json()
 		self.assertEqual(response.status_code, 200)
@@ -285,12 +772,152 @@ class TestTopMoviesView(TestCase):
 			'rank': 3
 		}]
 
-		with self.assertNumQueries(1):
+		with self.assertNumQueries(2):
 			response = self.client.get('{}?date_from=1538611200.0&date_to=1538784000.0'.format(reverse('top')))
 		json_data = response.json()
 		for i, expected_movie in enumerate(expected_data):
 			self.assertDictEqual(expected_movie, json_data[i])
 
+	@freeze_time("2018-10-05")
+	def test_top_movies_query_count_does_not_grow_with_rows(self):
+		for movie in mommy.make(Movie, _quantity=10):
+			mommy.make(Comment, movie=movie, _quantity=3)
+		with self.assertNumQueries(2):
+			response = self.client.get('{}?date_from=1538611200.0&date_to=1538784000.0'.format(reverse('top')))
+		self.assertEqual(len(response.json()), 10)
+
+	@freeze_time("2018-10-05")
+	def test_zero_comment_movies_share_rank(self):
+		movies = mommy.make(Movie, _quantity=3)
+		response = self.client.get('{}?date_from=1538611200.0&date_to=1538784000.0'.format(reverse('top')))
+		self.assertEqual(response.json(), [
+			{'movie_id': movie.id, 'total_comments': 0, 'rank': 1} for movie in movies
+		])
+
+	@freeze_time("2018-10-05")
+	def test_ranking_is_stable_across_requests(self):
+		movie_1, movie_2, movie_3 = mommy.make(Movie, _quantity=3)
+		mommy.make(Comment, movie=movie_1, _quantity=2)
+		mommy.make(Comment, movie=movie_2, _quantity=2)
+		url = '{}?date_from=1538611200.0&date_to=1538784000.0'.format(reverse('top'))
+		first_response = self.client.get(url).json()
+		self.assertEqual([movie['rank'] for movie in first_response], [1, 1, 2])
+		self.assertEqual(self.client.get(url).json(), first_response)
+
+	@freeze_time("2018-10-05")
+	def test_pagination_continues_ranking(self):
+		movie_1, movie_2, movie_3, movie_4 = mommy.make(Movie, _quantity=4)
+		mommy.make(Comment, movie=movie_1, _quantity=3)
+		mommy.make(Comment, movie=movie_2, _quantity=2)
+		mommy.make(Comment, movie=movie_3, _quantity=2)
+		url = '{}?date_from=1538611200.0&date_to=1538784000.0&page_size=2'.format(reverse('top'))
+
+		with self.assertNumQueries(2):
+			response = self.client.get(url)
+		self.assertEqual(response.json(), [
+			{'movie_id': movie_1.id, 'total_comments': 3, 'rank': 1},
+			{'movie_id': movie_2.id, 'total_comments': 2, 'rank': 2},
+		])
+		self.assertIn('rel="next"', response['Link'])
+
+		with self.assertNumQueries(2):
+			response = self.client.get('{}&page=2'.format(url))
+		self.assertEqual(response.json(), [
+			{'movie_id': movie_3.id, 'total_comments': 2, 'rank': 2},
+			{'movie_id': movie_4.id, 'total_comments': 0, 'rank': 3},
+		])
+		self.assertNotIn('rel="next"', response['Link'])
+		self.assertIn('rel="prev"', response['Link'])
+
+	def test_activity_pagination_continues_ranking(self):
+		movie_1, movie_2, movie_3 = mommy.make(Movie, _quantity=3)
+		with freeze_time("2018-10-04 10:15"):
+			mommy.make(Comment, movie=movie_1, _quantity=3)
+			mommy.make(Comment, movie=movie_2, _quantity=3)
+			mommy.make(Comment, movie=movie_3, _quantity=1)
+		url = '{}?date_from=1538611200.0&date_to=1538784000.0&ranking=activity&page_size=2'.format(reverse('top'))
+
+		response = self.client.get('{}&page=2'.format(url))
+		self.assertEqual(response.json(), [{'movie_id': movie_3.id, 'total_comments': 1, 'rank': 2}])
+
+	def test_invalid_page(self):
+		with self.assertNumQueries(1):
+			response = self.client.get('{}?date_from=1538611200.0&date_to=1538784000.0&page=0'.format(reverse('top')))
+		self.assertEqual(response.status_code, 400)
+
+	def test_page_not_found(self):
+		mommy.make(Movie)
+		url = '{}?date_from=1538611200.0&date_to=1538784000.0'.format(reverse('top'))
+		self.assertEqual(self.client.get('{}&page=2'.format(url)).status_code, 404)
+		with self.assertNumQueries(1):
+			response = self.client.get('{}&page=99999999999999999999'.format(url))
+		self.assertEqual(response.status_code, 404)
+
+	def test_rank_by_comment_activity(self):
+		movie_1 = mommy.make(Movie)
+		movie_2 = mommy.make(Movie)
+		with freeze_time("2018-10-03 23:30"):
+			mommy.make(Comment, movie=movie_1, _quantity=5)
+		with freeze_time("2018-10-04 10:15"):
+			mommy.make(Comment, movie=movie_1, _quantity=1)
+			mommy.make(Comment, movie=movie_2, _quantity=2)
+		with freeze_time("2018-10-05 23:59"):
+			mommy.make(Comment, movie=movie_1, _quantity=2)
+		with freeze_time("2018-10-06"):
+			mommy.make(Comment, movie=movie_2, _quantity=4)
+		expected_data = [{
+			'movie_id': movie_1.id,
+			'total_comments': 3,
+			'rank': 1
+		}, {
+			'movie_id': movie_2.id,
+			'total_comments': 2,
+			'rank': 2
+		}]
+
+		with self.assertNumQueries(2):
+			response = self.client.get(
+				'{}?date_from=1538611200.0&date_to=1538784000.0&ranking=activity'.format(reverse('top'))
+			)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json(), expected_data)
+
+	def test_activity_counts_comments_up_to_date_to(self):
+		movie_1, movie_2 = mommy.make(Movie, _quantity=2)
+		with freeze_time("2018-10-04 10:15"):
+			mommy.make(Comment, movie=movie_1, _quantity=2)
+			mommy.make(Comment, movie=movie_2, _quantity=1)
+		with freeze_time("2018-10-04 10:45"):
+			mommy.make(Comment, movie=movie_2, _quantity=3)
+
+		# 2018-10-04 00:00 - 2018-10-04 10:30, the last hour only half in range.
+		response = self.client.get(
+			'{}?date_from=1538611200.0&date_to=1538649000.0&ranking=activity'.format(reverse('top'))
+		)
+		self.assertEqual(response.json(), [
+			{'movie_id': movie_1.id, 'total_comments': 2, 'rank': 1},
+			{'movie_id': movie_2.id, 'total_comments': 1, 'rank': 2},
+		])
+
+	def test_rebuild_comment_activity(self):
+		movie = mommy.make(Movie)
+		with freeze_time("2018-10-04 10:15"):
+			mommy.make(Comment, movie=movie, _quantity=3)
+		CommentActivity.objects.all().delete()
+
+		call_command('rebuild_comment_activity', stdout=StringIO())
+		activity = CommentActivity.objects.get()
+		self.assertEqual(activity.movie_id, movie.id)
+		self.assertEqual(activity.comment_count, 3)
+		self.assertEqual(activity.bucket, datetime.datetime(2018, 10, 4, 10, tzinfo=utc))
+
+	def test_invalid_ranking(self):
+		with self.assertNumQueries(0):
+			response = self.client.get(
+				'{}?date_from=1538611200.0&date_to=1538784000.0&ranking=rating'.format(reverse('top'))
+			)
+		self.assertEqual(response.status_code, 400)
+
 	def test_missing_date_range(self):
 		with self.assertNumQueries(0):
 			response = self.client.get('{}'.format(reverse('top')))
@@ -22,8 +22,13 @@ from moviedb_rest_api import views
 
 urlpatterns = [
     url(r'^comments/$', views.CommentsView.as_view(), name='comments'),
+    url(r'^comments/import/$', views.CommentsImportView.as_view(), name='comments-import'),
     url(r'^movies/$', views.MoviesView.as_view(), name='movies'),
+    url(r'^movies/(?P<movie_id>\d+)/$', views.MovieDetailView.as_view(), name='movie'),
+    url(r'^movies/search/$', views.MovieSearchView.as_view(), name='movie-search'),
+    url(r'^movies/import/$', views.MoviesImportView.as_view(), name='movies-import'),
     url(r'^top/$', views.TopMoviesView.as_view(), name='top'),
+    url(r'^metrics/$', views.MetricsView.as_view(), name='metrics'),
     url(r'^admin/', admin.site.urls),
     url(r'^$', RedirectView.as_view(url='movies', permanent=False), name='homepage')
 ]
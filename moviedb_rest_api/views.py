@@ -1,43 +1,119 @@
-import requests
 import datetime
+from decimal import Decimal, InvalidOperation
 
 from django.conf import settings
-from django.db.models import Count
+from django.db.models import Count, Max, Sum
+from django.db.models.expressions import RawSQL
 from django.template.loader import render_to_string
 from django.utils.html import mark_safe
 
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.renderers import BaseRenderer
 from rest_framework.views import APIView
 
-from moviedb_rest_api.models import Movie, Comment
-from moviedb_rest_api.serializers import MovieSerializer, CommentSerializer, TopMoviesSerializer
+from moviedb_rest_api import cache, enrichment, metrics, omdb
+from moviedb_rest_api.fastjson import FastJSONParser
+from moviedb_rest_api.importer import CommentImporter, MovieImporter
+from moviedb_rest_api.models import (
+    SEARCH_FUZZY, SEARCH_MODES, Movie, Comment, CommentActivity, activity_bucket, normalize_title
+)
+from moviedb_rest_api.negative_cache import negative_cache
+from moviedb_rest_api.pagination import InvalidCursor, InvalidPage, KeysetPaginator, PageNotFound, PagePaginator
+from moviedb_rest_api.serializers import (
+    InvalidFields, MovieSerializer, CommentSerializer, MovieValuesSerializer, MovieSearchValuesSerializer,
+    CommentValuesSerializer, TopMoviesValuesSerializer
+)
+from moviedb_rest_api.singleflight import SingleFlight, worker_lock
+from moviedb_rest_api.streaming import STREAM_FORMATS, NDJSONParser, streaming_response
+
+omdb_fetches = SingleFlight()
+
+SORTABLE_MOVIE_FIELDS = ('year', 'imdb_rating', 'runtime_minutes')
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
 
 
 class MoviesView(APIView):
 
     def post(self, request):
         movie_title = request.data.get('movie_title')
-        if not movie_title:
+        if not movie_title or not isinstance(movie_title, str):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            serializer_class = MovieValuesSerializer.project(request.query_params.get('fields'))
+        except InvalidFields:
             return Response({}, status=status.HTTP_400_BAD_REQUEST)
-        created, movie_data = self.get_movie_data(movie_title)
+        if request.query_params.get('async') in ('1', 'true'):
+            queued, movie_data = self.reserve_movie(movie_title, serializer_class)
+            return Response(movie_data, status=status.HTTP_202_ACCEPTED if queued else status.HTTP_200_OK)
+        try:
+            created, movie_data = self.get_movie_data(movie_title, serializer_class)
+        except omdb.OmdbUnavailable:
+            return Response(
+                {'OMDB_Error': 'OMDb is unavailable, try again later.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         return Response(movie_data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
+    @cache.conditional_get('movies')
+    @cache.cached_response('movies', lambda request: None if request.query_params.get('stream') else [cache.MOVIES])
     def get(self, request):
-        return Response(self.get_all_movies_serialized(), status=status.HTTP_200_OK)
+        try:
+            serializer_class = MovieValuesSerializer.project(request.query_params.get('fields'))
+        except InvalidFields:
+            return Response([], status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            movies, ordering = self.get_filtered_movies(request)
+        except ValueError:
+            return Response([], status=status.HTTP_400_BAD_REQUEST)
+
+        stream_format = request.query_params.get('stream')
+        if stream_format:
+            if stream_format not in STREAM_FORMATS:
+                return Response([], status=status.HTTP_400_BAD_REQUEST)
+            return streaming_response(
+                self.iter_all_movies_serialized(serializer_class, movies.order_by(*ordering)), stream_format
+            )
+
+        paginator = KeysetPaginator(ordering=ordering)
+        try:
+            movies = self.get_movies_serialized(paginator, request, serializer_class, movies)
+        except InvalidCursor:
+            return Response([], status=status.HTTP_400_BAD_REQUEST)
+        return paginator.get_paginated_response(Response(movies, status=status.HTTP_200_OK))
 
     def get_view_description(self, html=False):
         description_data = {
             "POST": {
                 "Accepted values": {
-                    "movie_title": 'Required - string'
+                    "movie_title": 'Required - string',
+                    "fields": "query param - same as in GET",
+                    "async": "query param - 'true' saves a pending movie and fetches its details in the background"
                 },
-                "description": "Finds and saves movie details to the db.",
+                "description": "Finds and saves movie details to the db. With async=true responds with 202 right "
+                               "away, poll /movies/<movie_id>/ until its status is 'ready'.",
                 "Returns": "Dictionary containing movie data."
             },
             "GET": {
-                "Accepted values": {},
-                "description": "Retrieve movies records from db.",
+                "Accepted values": {
+                    "page_size": "integer",
+                    "after": "string - cursor taken from the 'next' Link header",
+                    "before": "string - cursor taken from the 'prev' Link header",
+                    "stream": "'json' or 'ndjson' - stream every movie instead of returning a single page",
+                    "fields": "comma separated fields to return, e.g. 'movie_id,title,additional_data.Year' - "
+                              "'additional_data.<key>' selects a single key of the OMDb data",
+                    "year": "integer",
+                    "year_from": "integer",
+                    "year_to": "integer",
+                    "genre": "string",
+                    "min_rating": "number - minimal IMDb rating",
+                    "imdb_id": "string",
+                    "ordering": "one of {} or the same prefixed with '-' for descending order, "
+                                "movies without the value are left out".format(", ".join(SORTABLE_MOVIE_FIELDS))
+                },
+                "description": "Retrieve movies records from db, ordered by id unless ordering is given. "
+                               "Links to the neighbouring pages are returned in the Link header.",
                 "Returns": "List of dictionaries containing movies data."
             }
         }
@@ -46,28 +122,271 @@ class MoviesView(APIView):
         else:
             return description_data
 
-    def omdb_url(self, movie_title):
-        return '{host}?apikey={apikey}&t={movie_title}'.format(
-            host=settings.OMDB_API_URL, apikey=settings.OMDB_API_KEY, movie_title=movie_title
+    def get_movie_data(self, movie_title, serializer_class=MovieValuesSerializer):
+        movie_data = self.find_movie_data(movie_title, serializer_class)
+        if movie_data is not None:
+            return False, movie_data
+        # Concurrent requests for the same title wait for a single OMDb fetch.
+        (created, movie_data), shared = omdb_fetches.do(
+            normalize_title(movie_title), lambda: self.fetch_movie_data(movie_title)
         )
+        if 'OMDB_Error' not in movie_data:
+            # The waiting requests may ask for different fields than the one doing the fetch.
+            movie_data = serializer_class.pick(movie_data)
+        return created and not shared, movie_data
 
-    def get_movie_data(self, movie_title):
-        movie = Movie.objects.get_or_none(title__iexact=movie_title)
+    @staticmethod
+    def reserve_movie(movie_title, serializer_class=MovieValuesSerializer):
+        """
+        Saves a pending movie and queues the fetch of its OMDb data.
+
+        Returns ``(queued, movie_data)``, known titles are returned as they are,
+        failed ones are queued again.
+        """
+        # Movies OMDb does not know stay failed while the negative cache remembers them.
+        omdb_error = negative_cache.get(movie_title)
+        if omdb_error:
+            return False, {'OMDB_Error': omdb_error}
+        if enrichment.requeue_failed(normalize_title(movie_title)):
+            movie = Movie.objects.get_by_title(movie_title)
+            enrichment.schedule(movie.id)
+            cache.movie_updated()
+            return True, serializer_class.pick(MovieSerializer(movie).data)
+        movies = serializer_class.values(Movie.objects.filter(normalized_title=normalize_title(movie_title)))[:1]
+        if movies:
+            return False, serializer_class(movies[0]).data
+        movie, created = Movie.objects.insert_or_get(
+            title=movie_title.title(), additional_data={}, status=Movie.PENDING
+        )
+        if created:
+            cache.movie_created()
+            enrichment.schedule(movie.id)
+        return created, serializer_class.pick(MovieSerializer(movie).data)
+
+    @staticmethod
+    def find_movie_data(movie_title, serializer_class=MovieValuesSerializer):
+        """Data of the stored movie or the remembered OMDb error of the title, None when OMDb has to be asked."""
+        movies = serializer_class.values(Movie.objects.filter(normalized_title=normalize_title(movie_title)))[:1]
+        if movies:
+            return serializer_class(movies[0]).data
+        omdb_error = negative_cache.get(movie_title)
+        if omdb_error:
+            return {'OMDB_Error': omdb_error}
+        return None
+
+    @classmethod
+    def fetch_movie_data(cls, movie_title):
+        with worker_lock(normalize_title(movie_title)):
+            stored = cls.stored_movie_data(movie_title)
+            if stored is not None:
+                return stored
+            status_code, response_data = omdb.get_client().get_movie(movie_title)
+            return cls.save_omdb_response(movie_title, status_code, response_data)
+
+    @staticmethod
+    def stored_movie_data(movie_title):
+        """``(False, movie_data)`` of the movie another worker stored under ``worker_lock``, or None."""
+        movie = Movie.objects.get_by_title(movie_title)
         if movie:
             return False, MovieSerializer(movie).data
+        return None
+
+    @staticmethod
+    def save_omdb_response(movie_title, status_code, response_data):
+        """Stores the movie OMDb answered with, returns ``(created, movie_data)`` like ``get_movie_data``."""
+        if status_code == status.HTTP_200_OK and not 'Error' in response_data:
+            movie, created = Movie.objects.insert_or_get(title=movie_title.title(), additional_data=response_data)
+            if created:
+                cache.movie_created()
+            return created, MovieSerializer(movie).data
+        elif response_data.get('Error') == omdb.MOVIE_NOT_FOUND:
+            negative_cache.add(movie_title, omdb.MOVIE_NOT_FOUND)
+        return False, {'OMDB_Error': response_data.get('Error')}
+
+    @staticmethod
+    def get_validators(request):
+        if request.query_params.get('stream'):
+            return None
+        if cache.shared_versions():
+            return cache.get_versions([cache.MOVIES]), None
+        state = Movie.objects.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+        return (state['count'], state['last_modified']), state['last_modified']
+
+    @staticmethod
+    def get_filtered_movies(request):
+        """
+        Movies matching the filter params and their ordering, raises ValueError on invalid params.
+
+        Filters and ordering use the indexed OMDb attribute columns of ``Movie``.
+        """
+        params = request.query_params
+        filter_kwargs = {}
+        for param, lookup in (('year', 'year'), ('year_from', 'year__gte'), ('year_to', 'year__lte')):
+            if params.get(param):
+                filter_kwargs[lookup] = int(params[param])
+        if params.get('min_rating'):
+            try:
+                filter_kwargs['imdb_rating__gte'] = Decimal(params['min_rating'])
+            except InvalidOperation:
+                raise ValueError('Invalid rating.')
+            if not filter_kwargs['imdb_rating__gte'].is_finite():
+                raise ValueError('Invalid rating.')
+        if params.get('genre'):
+            filter_kwargs['genres__contains'] = [params['genre'].strip().lower()]
+        if params.get('imdb_id'):
+            filter_kwargs['imdb_id'] = params['imdb_id']
+
+        ordering = params.get('ordering')
+        if not ordering:
+            return Movie.objects.filter(**filter_kwargs), ('id',)
+        field = ordering.lstrip('-')
+        if field not in SORTABLE_MOVIE_FIELDS or ordering.startswith('--'):
+            raise ValueError('Unsupported ordering.')
+        # Keyset pagination needs comparable keys, so rows without the value are left out.
+        filter_kwargs['{}__isnull'.format(field)] = False
+        return Movie.objects.filter(**filter_kwargs), (ordering, '-id' if ordering.startswith('-') else 'id')
+
+    @staticmethod
+    def get_movies_serialized(paginator, request, serializer_class=MovieValuesSerializer, movies=None):
+        movies = Movie.objects.all() if movies is None else movies
+        movies = paginator.paginate_queryset(serializer_class.values(movies, key_sources=paginator.fields), request)
+        return serializer_class(movies, many=True).data
+
+    @staticmethod
+    def iter_all_movies_serialized(serializer_class=MovieValuesSerializer, movies=None):
+        serializer = serializer_class(None)
+        movies = Movie.objects.order_by('id') if movies is None else movies
+        for movie in serializer_class.values(movies).iterator():
+            yield serializer.to_representation(movie)
+
+
+class MovieDetailView(APIView):
+
+    @cache.conditional_get('movie')
+    def get(self, request, movie_id):
+        try:
+            serializer_class = MovieValuesSerializer.project(request.query_params.get('fields'))
+        except InvalidFields:
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        movies = serializer_class.values(Movie.objects.filter(id=movie_id))[:1]
+        if not movies:
+            return Response({}, status=status.HTTP_404_NOT_FOUND)
+        return Response(serializer_class(movies[0]).data, status=status.HTTP_200_OK)
+
+    def get_view_description(self, html=False):
+        description_data = {
+            "GET": {
+                "Accepted values": {
+                    "fields": "same as in GET /movies/"
+                },
+                "description": "Retrieve a single movie, e.g. to poll an asynchronously posted one until its status "
+                               "is 'ready'. Send the ETag back in If-None-Match to poll cheaply.",
+                "Returns": "Dictionary containing movie data."
+            }
+        }
+        if html:
+            return mark_safe(render_to_string('view_description.html', {'description_data': description_data}))
         else:
-            response = requests.get(self.omdb_url(movie_title))
-            response_data = response.json()
-            if response.status_code == status.HTTP_200_OK and not 'Error' in response_data:
-                movie = Movie.objects.create(title=movie_title.title(), additional_data=response_data)
-                return True, MovieSerializer(movie).data
-            else:
-                return False, {'OMDB_Error': response_data.get('Error')}
+            return description_data
+
+    @staticmethod
+    def get_validators(request, movie_id):
+        updated_at = Movie.objects.filter(id=movie_id).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None
+        return (movie_id, updated_at), updated_at
+
+
+class MovieSearchView(APIView):
+
+    @cache.conditional_get('movie-search')
+    @cache.cached_response('movie-search', lambda request: [cache.MOVIES])
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query or len(query) > Movie._meta.get_field('title').max_length:
+            return Response([], status=status.HTTP_400_BAD_REQUEST)
+        try:
+            modes = self.get_modes(request)
+            serializer_class = MovieSearchValuesSerializer.project(request.query_params.get('fields'))
+        except (ValueError, InvalidFields):
+            return Response([], status=status.HTTP_400_BAD_REQUEST)
+
+        movies = serializer_class.values(Movie.objects.search(query, modes))
+        paginator = PagePaginator()
+        try:
+            movies = paginator.paginate(lambda offset, limit: movies[offset:offset + limit], request)
+        except InvalidPage:
+            return Response([], status=status.HTTP_400_BAD_REQUEST)
+        except PageNotFound:
+            return Response([], status=status.HTTP_404_NOT_FOUND)
+        return paginator.get_paginated_response(Response(serializer_class(movies, many=True).data))
+
+    def get_view_description(self, html=False):
+        description_data = {
+            "GET": {
+                "Accepted values": {
+                    "q": "Required - string",
+                    "mode": "comma separated search modes, all of them by default: "
+                            "'prefix' - titles starting with q, 'fuzzy' - titles similar to q, tolerates typos, "
+                            "'text' - full-text search of titles and plots",
+                    "fields": "same as in GET /movies/, 'score' is available too",
+                    "page": "integer",
+                    "page_size": "integer"
+                },
+                "description": "Searches the movies stored in the db, best matches first.",
+                "Returns": "List of dictionaries containing movies data and their match score."
+            }
+        }
+        if html:
+            return mark_safe(render_to_string('view_description.html', {'description_data': description_data}))
+        else:
+            return description_data
+
+    @staticmethod
+    def get_modes(request):
+        modes = [mode.strip() for mode in request.query_params.get('mode', '').split(',') if mode.strip()]
+        if any(mode not in SEARCH_MODES for mode in modes):
+            raise ValueError('Unsupported search mode.')
+        modes = modes or list(SEARCH_MODES)
+        if SEARCH_FUZZY in modes and not Movie.objects.has_trigram_support():
+            if modes == [SEARCH_FUZZY]:
+                raise ValueError('Fuzzy search is not available.')
+            modes.remove(SEARCH_FUZZY)
+        return modes
 
     @staticmethod
-    def get_all_movies_serialized():
-        movies = Movie.objects.all()
-        return MovieSerializer(movies, many=True).data
+    def get_validators(request):
+        if not request.query_params.get('q', '').strip():
+            return None
+        return MoviesView.get_validators(request)
+
+
+class MoviesImportView(APIView):
+
+    def post(self, request):
+        movie_titles = request.data.get('movie_titles')
+        if not isinstance(movie_titles, list) or not 0 < len(movie_titles) <= settings.MOVIE_IMPORT_MAX_TITLES:
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        importer = MovieImporter(time_limit=settings.MOVIE_IMPORT_TIME_LIMIT)
+        return Response(importer.run(movie_titles), status=status.HTTP_200_OK)
+
+    def get_view_description(self, html=False):
+        description_data = {
+            "POST": {
+                "Accepted values": {
+                    "movie_titles": 'Required - list of strings'
+                },
+                "description": "Finds and saves details of many movies to the db at once.",
+                "Returns": "List of dictionaries with the title, import status ('created', 'existing', 'not_found', "
+                           "'failed', 'duplicate' or 'invalid') and movie id or OMDb error of every submitted title. "
+                           "Titles not fetched within MOVIE_IMPORT_TIME_LIMIT seconds are 'failed', import them again."
+            }
+        }
+        if html:
+            return mark_safe(render_to_string('view_description.html', {'description_data': description_data}))
+        else:
+            return description_data
+
 
 class CommentsView(APIView):
 
@@ -83,13 +402,22 @@ class CommentsView(APIView):
                 return Response({}, status=status.HTTP_400_BAD_REQUEST)
             return Response(comment, status=status.HTTP_201_CREATED)
 
+    @cache.conditional_get('comments')
+    @cache.cached_response('comments', lambda request: [
+        cache.movie_comments_scope(request.query_params['movie_id']) if request.query_params.get('movie_id')
+        else cache.COMMENTS
+    ])
     def get(self, request):
         movie_id = request.query_params.get('movie_id')
         if movie_id and not movie_id.isdigit():
             return Response([], status=status.HTTP_400_BAD_REQUEST)
 
-        comments = self.get_serialized_comments(movie_id)
-        return Response(comments, status=status.HTTP_200_OK)
+        paginator = KeysetPaginator(ordering=('-created_at', 'id'))
+        try:
+            comments = self.get_serialized_comments(movie_id, paginator, request)
+        except InvalidCursor:
+            return Response([], status=status.HTTP_400_BAD_REQUEST)
+        return paginator.get_paginated_response(Response(comments, status=status.HTTP_200_OK))
 
     def get_view_description(self, html=False):
         description_data = {
@@ -103,10 +431,14 @@ class CommentsView(APIView):
             },
             "GET": {
                 "Accepted values": {
-                    "movie_id": "integer"
+                    "movie_id": "integer",
+                    "page_size": "integer",
+                    "after": "string - cursor taken from the 'next' Link header",
+                    "before": "string - cursor taken from the 'prev' Link header"
                 },
-                "description": "Filters comments by movie id. "
-                               "You will get all comments saved in the db if movie id is not specified.",
+                "description": "Filters comments by movie id, newest first. "
+                               "You will get all comments saved in the db if movie id is not specified. "
+                               "Links to the neighbouring pages are returned in the Link header.",
                 "Returns": "List of dictionaries containing comments data."
             }
         }
@@ -121,36 +453,94 @@ class CommentsView(APIView):
             movie = Movie.objects.get_or_none(id=movie_id)
             if movie:
                 comment = Comment.objects.create(movie=movie, movie_id=movie_id, body=comment_body)
+                cache.comments_created([movie_id])
                 return CommentSerializer(comment).data
 
     @staticmethod
-    def get_serialized_comments(movie_id):
+    def get_validators(request):
+        movie_id = request.query_params.get('movie_id')
+        if movie_id and not movie_id.isdigit():
+            return None
+        if cache.shared_versions():
+            return cache.get_versions([cache.movie_comments_scope(movie_id) if movie_id else cache.COMMENTS]), None
+        comments = Comment.objects.filter(movie_id=movie_id) if movie_id else Comment.objects.all()
+        state = comments.aggregate(count=Count('id'), last_modified=Max('created_at'))
+        return (state['count'], state['last_modified']), state['last_modified']
+
+    @staticmethod
+    def get_serialized_comments(movie_id, paginator, request):
         filter_kwargs = {}
         if movie_id:
             filter_kwargs['movie_id'] = movie_id
-        comments = Comment.objects.filter(**filter_kwargs)
-        return CommentSerializer(comments, many=True).data
+        comments = CommentValuesSerializer.values(Comment.objects.filter(**filter_kwargs))
+        comments = paginator.paginate_queryset(comments, request)
+        return CommentValuesSerializer(comments, many=True).data
+
+
+class CommentsImportView(APIView):
+    parser_classes = (FastJSONParser, NDJSONParser)
+
+    def post(self, request):
+        if not isinstance(request.data, list) or not request.data:
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(CommentImporter().run(request.data), status=status.HTTP_200_OK)
+
+    def get_view_description(self, html=False):
+        description_data = {
+            "POST": {
+                "Accepted values": {
+                    "body": "Required - JSON array (application/json) or one JSON object per line "
+                            "(application/x-ndjson) of comments",
+                    "movie_id": "Required - integer",
+                    "comment_body": "Required - string",
+                    "created_at": "ISO 8601 date and time, defaults to now"
+                },
+                "description": "Saves many comments at once.",
+                "Returns": "List of dictionaries with the import status ('created', 'invalid' or 'failed') "
+                           "and comment id or error of every submitted comment, in the order they were sent."
+            }
+        }
+        if html:
+            return mark_safe(render_to_string('view_description.html', {'description_data': description_data}))
+        else:
+            return description_data
 
 
 class TopMoviesView(APIView):
+    RANKING_CREATED = 'created'
+    RANKING_ACTIVITY = 'activity'
+
+    @cache.conditional_get('top')
+    @cache.cached_response('top', lambda request: [cache.TOP])
     def get(self, request):
         try:
-            date_from = float(request.query_params.get('date_from'))
-            date_from = datetime.datetime.utcfromtimestamp(date_from)
-            date_to = float(request.query_params.get('date_to'))
-            date_to = datetime.datetime.utcfromtimestamp(date_to)
+            date_from, date_to, ranking = self.get_ranking_params(request)
         except (ValueError, TypeError):
             return Response([], status=status.HTTP_400_BAD_REQUEST)
-        else:
-            comments = self.get_top_comments(date_from, date_to)
-            return Response(comments, status=status.HTTP_200_OK)
+
+        paginator = PagePaginator()
+        try:
+            if ranking == self.RANKING_ACTIVITY:
+                comments = self.get_top_commented(date_from, date_to, paginator, request)
+            else:
+                comments = self.get_top_comments(date_from, date_to, paginator, request)
+        except InvalidPage:
+            return Response([], status=status.HTTP_400_BAD_REQUEST)
+        except PageNotFound:
+            return Response([], status=status.HTTP_404_NOT_FOUND)
+        return paginator.get_paginated_response(Response(comments, status=status.HTTP_200_OK))
 
     def get_view_description(self, html=False):
         description_data = {
             "GET": {
                 "Accepted values": {
                     "date_from": "Required - UTC timestamp",
-                    "date_to": "Required - UTC timestamp"
+                    "date_to": "Required - UTC timestamp",
+                    "ranking": "'created' (default) - movies added within the dates ranked by all their comments, "
+                               "'activity' - movies ranked by comments written within [date_from, date_to), "
+                               "date_from is rounded down to the start of its hour (or day, depending on settings)",
+                    "page": "integer",
+                    "page_size": "integer"
                 },
                 "description": "Filters movies by date.",
                 "Returns": "List of dictionaries containing movie id, number of comments and rank in the db."
@@ -161,9 +551,76 @@ class TopMoviesView(APIView):
         else:
             return description_data
 
+    def get_ranking_params(self, request):
+        date_from = float(request.query_params.get('date_from'))
+        date_from = datetime.datetime.utcfromtimestamp(date_from)
+        date_to = float(request.query_params.get('date_to'))
+        date_to = datetime.datetime.utcfromtimestamp(date_to)
+        ranking = request.query_params.get('ranking', self.RANKING_CREATED)
+        if ranking not in (self.RANKING_CREATED, self.RANKING_ACTIVITY):
+            raise ValueError('Unsupported ranking.')
+        return date_from, date_to, ranking
+
+    def get_validators(self, request):
+        try:
+            date_from, date_to, ranking = self.get_ranking_params(request)
+        except (ValueError, TypeError):
+            return None
+        if cache.shared_versions():
+            return cache.get_versions([cache.TOP]), None
+        if ranking == self.RANKING_ACTIVITY:
+            state = CommentActivity.objects.filter(
+                bucket__gte=activity_bucket(date_from), bucket__lt=date_to
+            ).aggregate(Count('id'), Sum('comment_count'))
+        else:
+            state = Movie.objects.filter(
+                created_at__gte=date_from, created_at__lte=date_to
+            ).aggregate(Count('id'), Sum('comment_count'), Max('created_at'))
+        # Adding a comment does not touch any created_at of the ranked movies, so no Last-Modified here.
+        return sorted(state.items()), None
+
     @staticmethod
-    def get_top_comments(date_from, date_to):
-        movies = Movie.objects.filter(
+    def get_top_comments(date_from, date_to, paginator, request):
+        # The rank is computed over the whole date range before the page is cut out of it,
+        # so following pages continue the ranking.
+        movies = TopMoviesValuesSerializer.values(Movie.objects.filter(
             created_at__gte=date_from, created_at__lte=date_to
-        ).annotate(comments_count=Count('comments')).order_by('-comments_count', 'id')
-        return TopMoviesSerializer(movies, many=True).data
+        ).annotate(rank=RawSQL('DENSE_RANK() OVER (ORDER BY comment_count DESC)', ())).order_by('-comment_count', 'id'))
+        movies = paginator.paginate(lambda offset, limit: movies[offset:offset + limit], request)
+        return TopMoviesValuesSerializer(movies, many=True).data
+
+    @staticmethod
+    def get_top_commented(date_from, date_to, paginator, request):
+        movies = paginator.paginate(
+            lambda offset, limit: CommentActivity.objects.top_movies(date_from, date_to, offset, limit), request
+        )
+        return TopMoviesValuesSerializer(movies, many=True).data
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data.encode(self.charset)
+
+
+class MetricsView(APIView):
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+    def get_view_description(self, html=False):
+        description_data = {
+            "GET": {
+                "description": "Request latencies, database and OMDb usage and cache hit counters. Every worker "
+                               "process keeps its own, so a scrape sees only the process that answered it.",
+                "Returns": "Counters and histograms in the Prometheus text format."
+            }
+        }
+        if html:
+            return mark_safe(render_to_string('view_description.html', {'description_data': description_data}))
+        else:
+            return description_data